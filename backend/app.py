@@ -1,10 +1,30 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, has_request_context, jsonify, request, send_file
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from datetime import datetime
+from sqlalchemy import event, func, inspect, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import atexit
+import base64
+import click
+import heapq
+import itertools
+import json
+import math
 import os
-import requests
+import random
+import threading
+import time
 from dotenv import load_dotenv
+from upstream import UpstreamClient
+import metrics
+from sqlprofile import QueryLog
+from artcache import ArtCache, image_type
+from hlsrelay import HlsRelay, OriginError, RelayBusy, SegmentCache, media_type
+from songcache import SongIdCache
+from writebehind import PendingVotes
 
 # Load environment variables
 load_dotenv()
@@ -17,12 +37,186 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///database.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# SQLite connection profile, applied to every new connection: 'production'
+# (WAL journal and the tuning below) or 'default' (SQLite's own settings)
+app.config['SQLITE_PROFILE'] = os.getenv('SQLITE_PROFILE', 'production')
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+app.config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+app.config['SQLITE_CACHE_SIZE_KB'] = int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536'))
+
+# List endpoints return pages of at most API_MAX_PAGE_SIZE items
+app.config['API_DEFAULT_PAGE_SIZE'] = int(os.getenv('API_DEFAULT_PAGE_SIZE', '50'))
+app.config['API_MAX_PAGE_SIZE'] = int(os.getenv('API_MAX_PAGE_SIZE', '200'))
+
+# Rating write-behind configuration (off by default: every vote commits immediately)
+app.config['RATING_WRITE_BEHIND'] = os.getenv('RATING_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+app.config['RATING_FLUSH_INTERVAL_MS'] = int(os.getenv('RATING_FLUSH_INTERVAL_MS', '200'))
+app.config['RATING_FLUSH_MAX_VOTES'] = int(os.getenv('RATING_FLUSH_MAX_VOTES', '500'))
+# Most songs accepted by one batch rating lookup or submit
+app.config['RATING_BATCH_MAX'] = int(os.getenv('RATING_BATCH_MAX', '100'))
+# Seconds between rebuilds of the day/week/month leaderboards, which drop
+# votes that have aged out of them (0: only `flask rebuild-rankings`)
+app.config['RANKING_REBUILD_INTERVAL'] = float(os.getenv('RANKING_REBUILD_INTERVAL', '3600'))
+
+# Upstream HTTP client configuration
+app.config['UPSTREAM_POOL_CONNECTIONS'] = int(os.getenv('UPSTREAM_POOL_CONNECTIONS', '10'))
+app.config['UPSTREAM_POOL_MAXSIZE'] = int(os.getenv('UPSTREAM_POOL_MAXSIZE', '10'))
+app.config['UPSTREAM_CONNECT_TIMEOUT'] = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '3.05'))
+app.config['UPSTREAM_READ_TIMEOUT'] = float(os.getenv('UPSTREAM_READ_TIMEOUT', '5'))
+app.config['UPSTREAM_RETRIES'] = int(os.getenv('UPSTREAM_RETRIES', '2'))
+app.config['UPSTREAM_BACKOFF_FACTOR'] = float(os.getenv('UPSTREAM_BACKOFF_FACTOR', '0.2'))
+app.config['UPSTREAM_BACKOFF_JITTER'] = float(os.getenv('UPSTREAM_BACKOFF_JITTER', '0.3'))
+
+# Now playing poller configuration
+app.config['NOWPLAYING_METADATA_URL'] = os.getenv('NOWPLAYING_METADATA_URL', 'https://d3d4yli4hf5bmh.cloudfront.net/metadata.json')
+app.config['NOWPLAYING_ALBUM_ART_URL'] = os.getenv('NOWPLAYING_ALBUM_ART_URL', 'https://d3d4yli4hf5bmh.cloudfront.net/cover.jpg')
+app.config['NOWPLAYING_POLL_INTERVAL'] = float(os.getenv('NOWPLAYING_POLL_INTERVAL', '10'))
+app.config['NOWPLAYING_STALE_AFTER'] = float(os.getenv('NOWPLAYING_STALE_AFTER', '30'))
+app.config['NOWPLAYING_STREAM_HEARTBEAT'] = float(os.getenv('NOWPLAYING_STREAM_HEARTBEAT', '15'))
+# Every station (the one above plus the Station table) is polled by one
+# scheduler thread handing polls to NOWPLAYING_POLL_WORKERS threads; each
+# interval varies by up to +/- NOWPLAYING_POLL_JITTER of itself
+app.config['NOWPLAYING_POLL_WORKERS'] = int(os.getenv('NOWPLAYING_POLL_WORKERS', '4'))
+app.config['NOWPLAYING_POLL_JITTER'] = float(os.getenv('NOWPLAYING_POLL_JITTER', '0.1'))
+# How often the scheduler re-reads the Station table for added or removed stations
+app.config['STATIONS_RELOAD_INTERVAL'] = float(os.getenv('STATIONS_RELOAD_INTERVAL', '60'))
+
+# Play history configuration: the poller records every track change, and
+# old rows are trimmed to the newest PLAY_HISTORY_MAX_ROWS and/or pruned
+# after PLAY_HISTORY_MAX_AGE_DAYS (0 turns either limit off)
+app.config['PLAY_HISTORY_MAX_ROWS'] = int(os.getenv('PLAY_HISTORY_MAX_ROWS', '1000'))
+app.config['PLAY_HISTORY_MAX_AGE_DAYS'] = float(os.getenv('PLAY_HISTORY_MAX_AGE_DAYS', '0'))
+app.config['TRACKHISTORY_LIMIT'] = int(os.getenv('TRACKHISTORY_LIMIT', '5'))
+
+# Album art snapshots, stored by content hash and served from /api/art
+app.config['ART_CACHE_DIR'] = os.getenv('ART_CACHE_DIR', os.path.join(app.instance_path, 'art'))
+app.config['ART_CACHE_MAX_BYTES'] = int(os.getenv('ART_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+app.config['ART_MAX_IMAGE_BYTES'] = int(os.getenv('ART_MAX_IMAGE_BYTES', str(5 * 1024 * 1024)))
+
+# Optional HLS relay: /api/hls/<name> serves HLS_ORIGIN_URL<name> from a
+# playlist cache (TTL: HLS_MANIFEST_TTL seconds, or the playlist's target
+# duration when unset) and a segment LRU in memory spilling to disk
+app.config['HLS_RELAY'] = os.getenv('HLS_RELAY', 'false').lower() in ('1', 'true', 'yes')
+app.config['HLS_ORIGIN_URL'] = os.getenv('HLS_ORIGIN_URL', 'https://d3d4yli4hf5bmh.cloudfront.net/hls/')
+app.config['HLS_MANIFEST_TTL'] = float(os.getenv('HLS_MANIFEST_TTL')) if os.getenv('HLS_MANIFEST_TTL') else None
+app.config['HLS_DEFAULT_MANIFEST_TTL'] = float(os.getenv('HLS_DEFAULT_MANIFEST_TTL', '2'))
+app.config['HLS_SEGMENT_MEMORY_BYTES'] = int(os.getenv('HLS_SEGMENT_MEMORY_BYTES', str(64 * 1024 * 1024)))
+app.config['HLS_SEGMENT_DISK_DIR'] = os.getenv('HLS_SEGMENT_DISK_DIR', os.path.join(app.instance_path, 'hls'))
+app.config['HLS_SEGMENT_DISK_BYTES'] = int(os.getenv('HLS_SEGMENT_DISK_BYTES', str(512 * 1024 * 1024)))
+app.config['HLS_MAX_SEGMENT_BYTES'] = int(os.getenv('HLS_MAX_SEGMENT_BYTES', str(10 * 1024 * 1024)))
+app.config['HLS_SEGMENT_MAX_AGE'] = int(os.getenv('HLS_SEGMENT_MAX_AGE', '86400'))
+# Origin fetches run on request threads, so they get short timeouts and no
+# retries (a player retries by itself). With a fixed number of request
+# threads per process, set HLS_MAX_WAITING below it: further cache misses
+# are answered 503 instead of queueing (0: no limit, for gevent workers)
+app.config['HLS_ORIGIN_CONNECT_TIMEOUT'] = float(os.getenv('HLS_ORIGIN_CONNECT_TIMEOUT', '1'))
+app.config['HLS_ORIGIN_READ_TIMEOUT'] = float(os.getenv('HLS_ORIGIN_READ_TIMEOUT', '2'))
+app.config['HLS_MAX_WAITING'] = int(os.getenv('HLS_MAX_WAITING', '0'))
+
+# Opt-in SQL profiling: X-DB-Query-Count / X-DB-Time-ms headers on every
+# response, a warning for statements repeated SQL_PROFILE_REPEAT_THRESHOLD
+# times in one request (N+1) and a top-N report for requests slower than
+# SQL_PROFILE_SLOW_MS in the database
+app.config['SQL_PROFILE'] = os.getenv('SQL_PROFILE', 'false').lower() in ('1', 'true', 'yes')
+app.config['SQL_PROFILE_REPEAT_THRESHOLD'] = int(os.getenv('SQL_PROFILE_REPEAT_THRESHOLD', '5'))
+app.config['SQL_PROFILE_SLOW_MS'] = float(os.getenv('SQL_PROFILE_SLOW_MS', '100'))
+app.config['SQL_PROFILE_TOP_N'] = int(os.getenv('SQL_PROFILE_TOP_N', '5'))
+
+# Number of (title, artist) -> song id entries kept in memory
+app.config['SONG_ID_CACHE_SIZE'] = int(os.getenv('SONG_ID_CACHE_SIZE', '1024'))
+
 # Initialize CORS
-CORS(app, origins=['http://localhost:3000'])
+CORS(app, origins=['http://localhost:3000'],
+     expose_headers=['ETag', 'X-Metadata-Fetched-At', 'X-DB-Query-Count', 'X-DB-Time-ms'], max_age=600)
 
 # Initialize database
 db = SQLAlchemy(app)
 
+def sqlite_pragmas():
+    """Return the PRAGMA settings of the configured SQLite profile"""
+    profile = app.config['SQLITE_PROFILE']
+    if profile == 'default':
+        return {}
+    if profile != 'production':
+        raise ValueError(f'Unknown SQLITE_PROFILE {profile!r}')
+    return {
+        # Readers no longer block the writer (and vice versa)
+        'journal_mode': 'WAL',
+        # With WAL, fsync at checkpoints instead of on every commit; a power
+        # loss can drop the last commits but cannot corrupt the database
+        'synchronous': 'NORMAL',
+        'busy_timeout': app.config['SQLITE_BUSY_TIMEOUT_MS'],
+        'mmap_size': app.config['SQLITE_MMAP_SIZE'],
+        # Negative cache_size is in KiB rather than pages
+        'cache_size': -app.config['SQLITE_CACHE_SIZE_KB'],
+        'temp_store': 'MEMORY'
+    }
+
+def apply_sqlite_profile(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in sqlite_pragmas().items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+def start_query_timer(connection, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's execution context, which is discarded with
+    # it: a statement that fails never reaches record_query_time
+    context._query_started = time.perf_counter()
+
+def record_query_time(connection, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    metrics.db_query_duration.observe(elapsed)
+    if has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_time += elapsed
+        if 'query_log' in g:
+            g.query_log.record(statement, elapsed)
+
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, 'connect', apply_sqlite_profile)
+    event.listen(db.engine, 'before_cursor_execute', start_query_timer)
+    event.listen(db.engine, 'after_cursor_execute', record_query_time)
+
+# Shared keep-alive client for all upstream fetches
+upstream = UpstreamClient(
+    pool_connections=app.config['UPSTREAM_POOL_CONNECTIONS'],
+    pool_maxsize=app.config['UPSTREAM_POOL_MAXSIZE'],
+    connect_timeout=app.config['UPSTREAM_CONNECT_TIMEOUT'],
+    read_timeout=app.config['UPSTREAM_READ_TIMEOUT'],
+    retries=app.config['UPSTREAM_RETRIES'],
+    backoff_factor=app.config['UPSTREAM_BACKOFF_FACTOR'],
+    backoff_jitter=app.config['UPSTREAM_BACKOFF_JITTER'],
+    observer=metrics.observe_upstream
+)
+
+art_cache = ArtCache(app.config['ART_CACHE_DIR'], app.config['ART_CACHE_MAX_BYTES'])
+
+hls_relay = None
+if app.config['HLS_RELAY']:
+    # A client of its own, so listeners' segment fetches cannot take the
+    # connections the metadata poller needs
+    hls_relay = HlsRelay(
+        UpstreamClient(
+            pool_maxsize=app.config['UPSTREAM_POOL_MAXSIZE'],
+            connect_timeout=app.config['HLS_ORIGIN_CONNECT_TIMEOUT'],
+            read_timeout=app.config['HLS_ORIGIN_READ_TIMEOUT'],
+            retries=0,
+            observer=metrics.observe_hls_upstream
+        ),
+        app.config['HLS_ORIGIN_URL'],
+        SegmentCache(
+            app.config['HLS_SEGMENT_MEMORY_BYTES'],
+            app.config['HLS_SEGMENT_DISK_DIR'],
+            app.config['HLS_SEGMENT_DISK_BYTES']
+        ),
+        manifest_ttl=app.config['HLS_MANIFEST_TTL'],
+        default_ttl=app.config['HLS_DEFAULT_MANIFEST_TTL'],
+        max_segment_bytes=app.config['HLS_MAX_SEGMENT_BYTES'],
+        max_waiting=app.config['HLS_MAX_WAITING'],
+        observe_cache=metrics.observe_cache
+    )
+
 # Models
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -30,13 +224,21 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
-    def to_dict(self):
+    # Newest-first pages (see `flask upgrade-db` for existing databases)
+    __table_args__ = (db.Index('ix_user_created_id', created_at.desc(), id.desc()),)
+
+    def to_dict(self, post_count=None):
+        """post_count may be passed in when it was loaded with the user (see get_users)"""
+        if post_count is None:
+            post_count = db.session.scalar(
+                db.select(func.count(Post.id)).where(Post.user_id == self.id)
+            )
         return {
             'id': self.id,
             'username': self.username,
             'email': self.email,
             'created_at': self.created_at.isoformat(),
-            'post_count': len(self.posts)
+            'post_count': post_count
         }
 
     def __repr__(self):
@@ -46,10 +248,12 @@ class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     user = db.relationship('User', backref=db.backref('posts', lazy=True))
 
+    __table_args__ = (db.Index('ix_post_created_id', created_at.desc(), id.desc()),)
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -68,21 +272,23 @@ class Song(db.Model):
     title = db.Column(db.String(200), nullable=False)
     artist = db.Column(db.String(200), nullable=False)
     album = db.Column(db.String(200))
+    # Denormalized rating counts, maintained by rate_song in the same
+    # transaction as the Rating row (see `flask rebuild-rating-counts`)
+    thumbs_up = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    thumbs_down = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # SHA-256 of the cover snapshotted when the song was last on air (see art_cache)
+    art_hash = db.Column(db.String(64))
     # Composite unique constraint to ensure same song isn't added multiple times
     __table_args__ = (db.UniqueConstraint('title', 'artist', name='_title_artist_uc'),)
 
     def to_dict(self):
-        # Calculate rating stats
-        thumbs_up = Rating.query.filter_by(song_id=self.id, rating_type='up').count()
-        thumbs_down = Rating.query.filter_by(song_id=self.id, rating_type='down').count()
-
         return {
             'id': self.id,
             'title': self.title,
             'artist': self.artist,
             'album': self.album,
-            'thumbs_up': thumbs_up,
-            'thumbs_down': thumbs_down
+            'thumbs_up': self.thumbs_up,
+            'thumbs_down': self.thumbs_down
         }
 
     def __repr__(self):
@@ -95,8 +301,14 @@ class Rating(db.Model):
     rating_type = db.Column(db.String(10), nullable=False)  # 'up' or 'down'
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
-    # Ensure one rating per user per song
-    __table_args__ = (db.UniqueConstraint('song_id', 'user_identifier', name='_song_user_uc'),)
+    __table_args__ = (
+        # Ensure one rating per user per song
+        db.UniqueConstraint('song_id', 'user_identifier', name='_song_user_uc'),
+        # Covers per-song counts by rating type without reading the table
+        db.Index('ix_rating_song_type', 'song_id', 'rating_type'),
+        # Incremental exports (?since=) in (created_at, id) order
+        db.Index('ix_rating_created_id', 'created_at', 'id'),
+    )
 
     song = db.relationship('Song', backref=db.backref('ratings', lazy=True))
 
@@ -111,185 +323,1088 @@ class Rating(db.Model):
     def __repr__(self):
         return f'<Rating {self.rating_type} for Song {self.song_id}>'
 
-# API Routes
+class Station(db.Model):
+    """A stream whose now playing metadata is polled (see PollScheduler).
 
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({'status': 'ok', 'message': 'API is running'}), 200
+    The station configured with NOWPLAYING_METADATA_URL has no row: it is
+    served at /api/nowplaying and /api/trackhistory, and its plays have no
+    station_id. Stations are managed with `flask add-station` and
+    `flask remove-station`.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(80), unique=True, nullable=False)
+    name = db.Column(db.String(200), nullable=False)
+    metadata_url = db.Column(db.String(500), nullable=False)
+    album_art_url = db.Column(db.String(500))
+    stream_url = db.Column(db.String(500))
+    # Seconds between metadata polls; None uses NOWPLAYING_POLL_INTERVAL
+    poll_interval = db.Column(db.Float)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-@app.route('/api/nowplaying', methods=['GET'])
-def get_now_playing():
-    """Get current track information from Radio Calico stream"""
-    try:
-        # Fetch metadata from Radio Calico CloudFront endpoint
-        response = requests.get('https://d3d4yli4hf5bmh.cloudfront.net/metadata.json', timeout=5)
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'slug': self.slug,
+            'name': self.name,
+            'stream_url': self.stream_url
+        }
 
-        if response.status_code == 200:
-            data = response.json()
+    def __repr__(self):
+        return f'<Station {self.slug}>'
 
-            # Extract track information
-            title = data.get('title', 'Unknown Track')
-            artist = data.get('artist', 'Unknown Artist')
-            album = data.get('album', '')
+class PlayHistory(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    song_id = db.Column(db.Integer, db.ForeignKey('song.id'), nullable=False, index=True)
+    # None for the station configured with NOWPLAYING_METADATA_URL
+    station_id = db.Column(db.Integer, db.ForeignKey('station.id'))
+    played_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
-            # Get album art from Radio Calico server
-            album_art = 'https://d3d4yli4hf5bmh.cloudfront.net/cover.jpg'
+    # Most recent plays of each station first (see `flask upgrade-db` for existing databases)
+    __table_args__ = (db.Index('ix_play_history_station_played', station_id, played_at.desc(), id.desc()),)
 
-            # Find or create song in database
-            song = Song.query.filter_by(title=title, artist=artist).first()
-            if not song:
-                song = Song(title=title, artist=artist, album=album)
-                db.session.add(song)
-                db.session.commit()
+    song = db.relationship('Song')
 
-            # Get rating stats
-            song_data = song.to_dict()
+    def __repr__(self):
+        return f'<PlayHistory Song {self.song_id} at {self.played_at}>'
+
+class SongRanking(db.Model):
+    """Materialized leaderboard: one row per song with votes in each window.
+
+    apply_vote_changes adds votes to every window in the same transaction
+    as the song counters. Votes only leave the time windows when those are
+    recomputed (RankingRefresher or `flask rebuild-rankings`).
+    """
+    period = db.Column(db.String(10), primary_key=True)
+    song_id = db.Column(db.Integer, db.ForeignKey('song.id'), primary_key=True)
+    thumbs_up = db.Column(db.Integer, nullable=False, default=0)
+    thumbs_down = db.Column(db.Integer, nullable=False, default=0)
+    votes = db.Column(db.Integer, nullable=False, default=0)
+    score = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # /api/songs/top reads the first rows of one window in index order
+    __table_args__ = (
+        db.Index('ix_song_ranking_top', period, score.desc(), votes.desc(), song_id),
+        # Rows voted on while a window was being rebuilt
+        db.Index('ix_song_ranking_updated', period, updated_at),
+    )
 
-            return jsonify({
-                'song_id': song.id,
-                'title': title,
-                'artist': artist,
-                'album': album,
-                'albumArt': album_art,
-                'live': True,
-                'bit_depth': data.get('bit_depth'),
-                'sample_rate': data.get('sample_rate'),
-                'thumbs_up': song_data['thumbs_up'],
-                'thumbs_down': song_data['thumbs_down']
-            }), 200
+    song = db.relationship('Song')
+
+    def __repr__(self):
+        return f'<SongRanking {self.period} Song {self.song_id}: {self.score:.3f}>'
 
-        # Fallback if endpoint fails
-        title = 'Radio Calico'
-        artist = 'Live Stream'
-        album = '24/7 Music'
+class RankingWindow(db.Model):
+    """When each leaderboard window was last recomputed from the ratings"""
+    period = db.Column(db.String(10), primary_key=True)
+    rebuilt_at = db.Column(db.DateTime, nullable=False)
 
-        # Find or create fallback song
-        song = Song.query.filter_by(title=title, artist=artist).first()
-        if not song:
-            song = Song(title=title, artist=artist, album=album)
-            db.session.add(song)
-            db.session.commit()
+    def __repr__(self):
+        return f'<RankingWindow {self.period} rebuilt at {self.rebuilt_at}>'
 
-        song_data = song.to_dict()
+class RatingRollup(db.Model):
+    """Votes cast per song per hour, kept up to date by apply_vote_changes.
 
-        return jsonify({
-            'song_id': song.id,
+    up and down count votes cast in the hour, including changed votes;
+    flips counts the votes that replaced an earlier vote of the other type.
+    """
+    song_id = db.Column(db.Integer, db.ForeignKey('song.id'), primary_key=True)
+    hour = db.Column(db.DateTime, primary_key=True)
+    up = db.Column(db.Integer, nullable=False, default=0)
+    down = db.Column(db.Integer, nullable=False, default=0)
+    flips = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<RatingRollup Song {self.song_id} at {self.hour}: +{self.up} -{self.down}>'
+
+# Song id cache, shared by the poller and find-or-create
+song_ids = SongIdCache(maxsize=app.config['SONG_ID_CACHE_SIZE'])
+
+@event.listens_for(Song, 'after_delete')
+def forget_deleted_song(mapper, connection, song):
+    song_ids.invalidate(song.id)
+
+SONG_COLUMNS = ('id', 'title', 'artist', 'album', 'thumbs_up', 'thumbs_down')
+
+def _upsert_songs_once(rows):
+    # One attempt at finding or creating rows; returns {(title, artist): (song_data, created)}
+    song_table = Song.__table__
+    columns = [song_table.c[name] for name in SONG_COLUMNS]
+    keys = [(row['title'], row['artist']) for row in rows]
+    key_filter = db.tuple_(song_table.c.title, song_table.c.artist).in_(keys)
+    dialect = db.engine.dialect.name
+
+    if dialect == 'postgresql':
+        # A single statement: rows inserted by the CTE plus rows that
+        # already existed. Both halves read the same snapshot, so a row
+        # is never returned twice.
+        inserted = (
+            postgresql_insert(song_table).values(rows)
+            .on_conflict_do_nothing(index_elements=['title', 'artist'])
+            .returning(*columns)
+            .cte('inserted')
+        )
+        result = db.session.execute(
+            db.select(*inserted.c, db.literal(True).label('created'))
+            .union_all(db.select(*columns, db.literal(False).label('created')).where(key_filter))
+        )
+        found = {}
+        for row in result.mappings():
+            song_data = {name: row[name] for name in SONG_COLUMNS}
+            found[(song_data['title'], song_data['artist'])] = (song_data, row['created'])
+        return found
+
+    if dialect == 'sqlite':
+        created = db.session.execute(
+            sqlite_insert(song_table).values(rows)
+            .on_conflict_do_nothing(index_elements=['title', 'artist'])
+            .returning(*columns)
+        ).mappings().all()
+        found = {(row['title'], row['artist']): (dict(row), True) for row in created}
+        if len(found) < len(rows):
+            # SQLite has no data-modifying CTEs: read the conflicting rows in
+            # the same transaction (no network round trip, it is in-process)
+            existing = db.session.execute(db.select(*columns).where(key_filter)).mappings()
+            for row in existing:
+                found.setdefault((row['title'], row['artist']), (dict(row), False))
+        return found
+
+    # Other databases: plain select, then insert what is missing
+    found = {
+        (row['title'], row['artist']): (dict(row), False)
+        for row in db.session.execute(db.select(*columns).where(key_filter)).mappings()
+    }
+    missing = [row for row in rows if (row['title'], row['artist']) not in found]
+    if missing:
+        db.session.execute(db.insert(song_table), missing)
+        for row in db.session.execute(db.select(*columns).where(key_filter)).mappings():
+            found.setdefault((row['title'], row['artist']), (dict(row), True))
+    return found
+
+def upsert_songs(songs):
+    """Find or create several songs at once, safely under concurrent writers.
+
+    songs is a list of dicts with 'title', 'artist' and optional 'album'
+    (the first album given for a (title, artist) pair is used). Uses
+    INSERT ... ON CONFLICT (title, artist) DO NOTHING RETURNING, so two
+    workers creating the same song never hit the unique constraint.
+    Returns a dict mapping (title, artist) to (song_data, created), where
+    song_data has the Song.to_dict() fields, and commits.
+    """
+    rows = {}
+    for song in songs:
+        rows.setdefault((song['title'], song['artist']), {
+            'title': song['title'],
+            'artist': song['artist'],
+            'album': song.get('album', '')
+        })
+    if not rows:
+        return {}
+
+    found = {}
+    for attempt in range(3):
+        missing = [row for key, row in rows.items() if key not in found]
+        if not missing:
+            break
+        # On PostgreSQL a row committed by another worker after this
+        # statement's snapshot is neither inserted nor seen; try again
+        found.update(_upsert_songs_once(missing))
+    db.session.commit()
+
+    if len(found) < len(rows):
+        raise RuntimeError('Could not find or create all songs')
+    for (title, artist), (song_data, _) in found.items():
+        song_ids.put(title, artist, song_data['id'])
+    return found
+
+def resolve_song(title, artist, album=''):
+    """Find or create one song and return (song_data, created).
+
+    Songs in the song_ids cache only cost a primary key read; others go
+    through upsert_songs.
+    """
+    song_id = song_ids.get(title, artist)
+    metrics.observe_cache('song_ids', song_id is not None)
+    if song_id is not None:
+        song = db.session.get(Song, song_id)
+        if song is not None:
+            return song.to_dict(), False
+        # Deleted by another process, whose delete event we never saw
+        song_ids.invalidate(song_id)
+    return upsert_songs([{'title': title, 'artist': artist, 'album': album}])[(title, artist)]
+
+def art_version(art_hash):
+    """The ?v= of a cover's URL: makes the URL change with the image"""
+    return art_hash[:16]
+
+def art_url(song_id, art_hash):
+    """URL of a song's cached cover, or None if it has none on disk"""
+    if not art_hash or not art_cache.has(art_hash):
+        return None
+    return f'/api/art/{song_id}?v={art_version(art_hash)}'
+
+def format_timestamp(timestamp):
+    """Format a time.time() value as an ISO 8601 UTC string (None stays None)"""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+def conditional_jsonify(payload):
+    """jsonify a payload with a strong ETag, answering If-None-Match with 304.
+
+    Clients are told to revalidate every time, so an unchanged resource
+    costs them a bodiless 304 instead of the full JSON.
+    """
+    response = jsonify(payload)
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def encode_cursor(created_at, row_id):
+    """Opaque next_cursor token for the row a page ended on"""
+    raw = json.dumps([created_at.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    """Inverse of encode_cursor; raises ValueError for a malformed token"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def page_limit():
+    """The request's ?limit=, defaulted and capped at API_MAX_PAGE_SIZE"""
+    limit = request.args.get('limit', str(app.config['API_DEFAULT_PAGE_SIZE']))
+    # Parsed by hand: type=int would quietly replace ?limit=abc with the default
+    if not (limit.isascii() and limit.isdigit()) or int(limit) < 1:
+        raise ValueError('limit must be a positive integer')
+    return min(int(limit), app.config['API_MAX_PAGE_SIZE'])
+
+def newest_first_page(query, model):
+    """Run one page of a select, newest first, keyed on (created_at, id).
+
+    The page after ?cursor= starts right below the row that token names,
+    so every page is an index range scan of `limit` rows no matter how
+    deep it is. Returns (rows, next_cursor), next_cursor None on the last
+    page. Raises ValueError for a bad limit or cursor.
+    """
+    limit = page_limit()
+    cursor = request.args.get('cursor')
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.where(
+            model.created_at <= created_at,
+            (model.created_at < created_at) | (model.id < row_id)
+        )
+    rows = db.session.execute(
+        query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+    ).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return rows, next_cursor
+
+# Now playing event fan-out
+class EventBroadcaster:
+    """Fans out the latest event to any number of stream subscribers.
+
+    Subscribers do not get a queue each. They all wait on one shared
+    condition and compare a version counter, so publishing costs the same
+    no matter how many clients are connected, and a slow client can only
+    miss intermediate events, never hold up the producer.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._version = 0
+        self._event = None
+
+    @property
+    def version(self):
+        return self._version
+
+    def publish(self, event):
+        with self._condition:
+            self._version += 1
+            self._event = event
+            self._condition.notify_all()
+
+    def wait(self, seen_version, timeout):
+        """Block until an event newer than seen_version exists or timeout expires.
+
+        Returns (version, event); the version is unchanged on timeout.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._version != seen_version, timeout)
+            return self._version, self._event
+
+# Now playing poller
+class NowPlayingPoller:
+    """Now playing state of one station, refreshed by PollScheduler.
+
+    Each poll builds a fresh snapshot dict and swaps it in with a single
+    assignment, so request handlers read the latest snapshot without locking
+    and never wait on the upstream server. station_id is None for the
+    station configured with NOWPLAYING_METADATA_URL; other stations show
+    their name until their first poll succeeds.
+    """
+
+    FALLBACK_TRACK = {
+        'title': 'Radio Calico',
+        'artist': 'Live Stream',
+        'album': '24/7 Music',
+        'albumArt': '/images/RadioCalicoLayout.png'
+    }
+
+    def __init__(self, app, metadata_url, album_art_url, interval, stale_after, broadcaster=None, station_id=None,
+                 name=None):
+        self.app = app
+        self.metadata_url = metadata_url
+        self.album_art_url = album_art_url
+        self.interval = interval
+        self.stale_after = stale_after
+        self.broadcaster = broadcaster
+        self.station_id = station_id
+        self.name = name
+        self.snapshot = None
+        self._last_played_song_id = None
+        self._lock = threading.Lock()
+
+    def poll_once(self):
+        """Fetch metadata once and publish a new snapshot.
+
+        If the upstream request fails outright or answers with an error
+        status, the previous snapshot is kept and simply ages until it is
+        reported as stale. The fallback track is only shown before the
+        first successful poll.
+        """
+        with self.app.app_context():
+            try:
+                response, modified = upstream.get_conditional(self.metadata_url)
+                if response.status_code == 200:
+                    if not modified and self._touch():
+                        # Upstream answered 304: nothing to re-parse, but the
+                        # counts may have changed through another process
+                        self._refresh_ratings()
+                        if not self.snapshot.get('art_pending'):
+                            return
+                        snapshot = self._with_album_art(self.snapshot)
+                    else:
+                        snapshot = self._with_album_art(self._build_snapshot(response.json()))
+                        self._record_play(snapshot['song_id'])
+                else:
+                    # Same as a failed request: keep the last snapshot
+                    self.app.logger.warning('Now playing poll failed: HTTP %s', response.status_code)
+                    if self.snapshot is not None:
+                        return
+                    snapshot = self._build_fallback_snapshot()
+            except Exception as e:
+                self.app.logger.warning('Now playing poll failed: %s', e)
+                db.session.rollback()
+                if self.snapshot is None:
+                    self._publish(self._build_fallback_snapshot())
+                return
+
+        self._publish(snapshot)
+
+    def _touch(self):
+        """Mark the current live snapshot as freshly confirmed by upstream.
+
+        Returns False if there is no live snapshot to refresh.
+        """
+        with self._lock:
+            snapshot = self.snapshot
+            if snapshot is None or snapshot['fetched_at'] is None:
+                return False
+            self._swap({**snapshot, 'fetched_at': time.time()})
+            return True
+
+    def current(self):
+        """Return the latest snapshot, building the fallback on first use"""
+        snapshot = self.snapshot
+        if snapshot is None:
+            snapshot = self._build_fallback_snapshot()
+            with self._lock:
+                if self.snapshot is None:
+                    self._swap(snapshot)
+                snapshot = self.snapshot
+        return snapshot
+
+    def is_stale(self, snapshot):
+        fetched_at = snapshot['fetched_at']
+        return fetched_at is None or time.time() - fetched_at > self.stale_after
+
+    def to_payload(self, snapshot):
+        """Build the /api/nowplaying response body for a snapshot.
+
+        The fetch time is deliberately left out of the body so the body (and
+        its ETag) only changes when the track, ratings or staleness change;
+        /api/nowplaying sends it in the X-Metadata-Fetched-At header instead.
+        """
+        payload = {key: value for key, value in snapshot.items() if key not in ('fetched_at', 'art_pending')}
+        payload['stale'] = self.is_stale(snapshot)
+        return payload
+
+    def update_ratings(self, song_id, thumbs_up, thumbs_down):
+        """Refresh rating counts in the snapshot if the song is still current"""
+        with self._lock:
+            snapshot = self.snapshot
+            if snapshot is None or snapshot['song_id'] != song_id:
+                return
+            self._swap({**snapshot, 'thumbs_up': thumbs_up, 'thumbs_down': thumbs_down})
+
+    def _refresh_ratings(self):
+        """Reload the current song's counts from the database"""
+        song = db.session.get(Song, self.snapshot['song_id'])
+        if song is not None:
+            song_data = with_pending_votes(song.to_dict())
+            self.update_ratings(song.id, song_data['thumbs_up'], song_data['thumbs_down'])
+
+    def _publish(self, snapshot):
+        with self._lock:
+            self._swap(snapshot)
+
+    def _swap(self, snapshot):
+        # Caller holds self._lock. Subscribers only hear about changes they
+        # would render: a new track or new rating counts.
+        previous = self.snapshot
+        self.snapshot = snapshot
+        if self.broadcaster is None:
+            return
+        if previous is not None and self._event_key(previous) == self._event_key(snapshot):
+            return
+        self.broadcaster.publish(self.to_payload(snapshot))
+        metrics.nowplaying_events_published.inc()
+
+    @staticmethod
+    def _event_key(snapshot):
+        return (snapshot['song_id'], snapshot['thumbs_up'], snapshot['thumbs_down'], snapshot['albumArt'])
+
+    def _build_snapshot(self, data):
+        # Extract track information
+        title = data.get('title', 'Unknown Track')
+        artist = data.get('artist', 'Unknown Artist')
+        album = data.get('album', '')
+
+        song_data = self._find_or_create_song(title, artist, album)
+
+        return {
+            'song_id': song_data['id'],
             'title': title,
             'artist': artist,
             'album': album,
-            'albumArt': '/images/RadioCalicoLayout.png',
+            'albumArt': self.album_art_url,
             'live': True,
+            'bit_depth': data.get('bit_depth'),
+            'sample_rate': data.get('sample_rate'),
             'thumbs_up': song_data['thumbs_up'],
-            'thumbs_down': song_data['thumbs_down']
-        }), 200
+            'thumbs_down': song_data['thumbs_down'],
+            'fetched_at': time.time()
+        }
+
+    def _with_album_art(self, snapshot):
+        """Point a live snapshot's albumArt at a cached copy of the cover.
+
+        The cover is fetched once per track change (the upstream URL always
+        shows the current track's cover) and stored by content hash. If the
+        fetch fails the upstream URL is used and the next poll tries again.
+        """
+        previous = self.snapshot
+        if (previous is not None and previous['song_id'] == snapshot['song_id']
+                and previous['fetched_at'] is not None and not previous.get('art_pending')):
+            return {**snapshot, 'albumArt': previous['albumArt'], 'art_pending': False}
+
+        song = db.session.get(Song, snapshot['song_id'])
+        if not self.album_art_url:
+            # No cover URL for this station: show art stored from another one, if any
+            return {**snapshot, 'albumArt': art_url(song.id, song.art_hash) or self.FALLBACK_TRACK['albumArt'],
+                    'art_pending': False}
+        response = None
+        try:
+            response = upstream.get(self.album_art_url, stream=True)
+            response.raise_for_status()
+            content = response.raw.read(self.app.config['ART_MAX_IMAGE_BYTES'] + 1, decode_content=True)
+            if len(content) > self.app.config['ART_MAX_IMAGE_BYTES']:
+                raise ValueError(f'cover is larger than {self.app.config["ART_MAX_IMAGE_BYTES"]} bytes')
+            if image_type(content) is None:
+                raise ValueError('cover is not a JPEG, PNG, GIF or WebP image')
+            art_hash = art_cache.store(content)
+        except Exception as e:
+            self.app.logger.warning('Album art snapshot failed: %s', e)
+            # Keep showing the art stored on an earlier play, if any
+            return {**snapshot, 'albumArt': art_url(song.id, song.art_hash) or self.album_art_url, 'art_pending': True}
+        finally:
+            if response is not None:
+                response.close()
+
+        if song.art_hash != art_hash:
+            song.art_hash = art_hash
+            db.session.commit()
+        return {**snapshot, 'albumArt': art_url(song.id, art_hash), 'art_pending': False}
+
+    def _build_fallback_snapshot(self):
+        track = self.FALLBACK_TRACK
+        if self.name:
+            # A placeholder until the station's first poll, not a song: no
+            # Song row, so it cannot be rated, exported or ranked
+            track = {**track, 'title': self.name}
+            song_data = {'id': None, 'thumbs_up': 0, 'thumbs_down': 0}
+        else:
+            song_data = self._find_or_create_song(track['title'], track['artist'], track['album'])
+
+        return {
+            'song_id': song_data['id'],
+            'title': track['title'],
+            'artist': track['artist'],
+            'album': track['album'],
+            'albumArt': track['albumArt'],
+            'live': True,
+            'thumbs_up': song_data['thumbs_up'],
+            'thumbs_down': song_data['thumbs_down'],
+            'fetched_at': None
+        }
+
+    def _record_play(self, song_id):
+        """Add a PlayHistory row if the live track differs from the last one played"""
+        if song_id == self._last_played_song_id:
+            return
+        # Checked against the table too, in the insert itself: after a
+        # restart, or with several worker processes polling, the change may
+        # be recorded already (or be being recorded right now)
+        latest = (
+            db.select(PlayHistory.song_id)
+            .where(play_history_of(self.station_id))
+            .order_by(PlayHistory.played_at.desc(), PlayHistory.id.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+        if db.engine.dialect.name == 'postgresql':
+            # Under READ COMMITTED two inserts could both see the old latest
+            # play; this mode conflicts with itself but not with readers
+            db.session.execute(text('LOCK TABLE play_history IN SHARE ROW EXCLUSIVE MODE'))
+        inserted = db.session.execute(
+            db.insert(PlayHistory).from_select(
+                ['song_id', 'station_id', 'played_at'],
+                db.select(
+                    db.literal(song_id, db.Integer),
+                    db.literal(self.station_id, db.Integer),
+                    db.literal(datetime.utcnow(), db.DateTime)
+                ).where(func.coalesce(latest, 0) != song_id)
+            )
+        ).rowcount
+        db.session.commit()
+        if inserted:
+            prune_play_history(self.station_id)
+        self._last_played_song_id = song_id
+
+    def _find_or_create_song(self, title, artist, album):
+        song_data, _ = resolve_song(title, artist, album)
+        return with_pending_votes(song_data)
+
+# Metadata poll scheduling
+class PollScheduler:
+    """Polls every station's metadata from one thread and a fixed worker pool.
+
+    Pollers wait in a heap ordered by when they are next due. The scheduler
+    thread sleeps until the earliest is due and hands it to a pool of
+    `workers` threads, so the thread count does not grow with the number of
+    stations, and a slow upstream only delays its own station (a station is
+    skipped while its previous poll is still running). Intervals vary by up
+    to +/- jitter of themselves and new stations start at a random point of
+    their first interval, so polls do not bunch up. The Station table is
+    re-read every reload_interval seconds.
+    """
+
+    def __init__(self, app, default_poller, workers, jitter, reload_interval):
+        self.app = app
+        self.default_poller = default_poller
+        self.workers = workers
+        self.jitter = jitter
+        self.reload_interval = reload_interval
+        # station id (None for the default station) -> poller; replaced as
+        # a whole on reload, so request handlers read it without locking
+        self.pollers = {None: default_poller}
+        # (due, tie breaker, poller), by time.monotonic()
+        self._due = []
+        self._sequence = itertools.count()
+        self._in_flight = set()
+        self._reloaded_at = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def start(self):
+        """Start the scheduler thread if it is not already running"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='nowplaying-poll')
+            now = time.monotonic()
+            for poller in self.pollers.values():
+                # The default station is polled right away, as before there were stations
+                self._schedule(poller, now if poller is self.default_poller else now + random.uniform(0, poller.interval))
+            self._thread = threading.Thread(target=self._run, name='nowplaying-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Ask the scheduler to exit; polls already running finish first"""
+        self._stop.set()
+        self._wake.set()
+
+    def poller(self, station_id):
+        return self.pollers.get(station_id)
+
+    def update_ratings(self, song_id, thumbs_up, thumbs_down):
+        """Refresh rating counts in every station snapshot showing the song"""
+        for poller in self.pollers.values():
+            poller.update_ratings(song_id, thumbs_up, thumbs_down)
+
+    def reload(self):
+        """Start polling newly active stations and stop polling removed ones"""
+        with self.app.app_context():
+            stations = [
+                (station.id, station.name, station.metadata_url, station.album_art_url, station.poll_interval)
+                for station in db.session.execute(db.select(Station).where(Station.active)).scalars()
+            ]
+        default_interval = self.app.config['NOWPLAYING_POLL_INTERVAL']
+        now = time.monotonic()
+        with self._lock:
+            pollers = {None: self.default_poller}
+            for station_id, name, metadata_url, album_art_url, interval in stations:
+                interval = interval or default_interval
+                # A station polled less often than the default one would
+                # otherwise be reported stale between its own polls
+                stale_after = max(self.app.config['NOWPLAYING_STALE_AFTER'], 3 * interval)
+                poller = self.pollers.get(station_id)
+                if poller is None or (poller.metadata_url, poller.album_art_url) != (metadata_url, album_art_url):
+                    poller = NowPlayingPoller(
+                        self.app,
+                        metadata_url=metadata_url,
+                        album_art_url=album_art_url,
+                        interval=interval,
+                        stale_after=stale_after,
+                        broadcaster=EventBroadcaster(),
+                        station_id=station_id,
+                        name=name
+                    )
+                    if self._thread is not None:
+                        self._schedule(poller, now + random.uniform(0, poller.interval))
+                poller.interval = interval
+                poller.stale_after = stale_after
+                poller.name = name
+                pollers[station_id] = poller
+            self.pollers = pollers
+            self._reloaded_at = now
+        self._wake.set()
+
+    def _schedule(self, poller, due):
+        # Caller holds self._lock
+        heapq.heappush(self._due, (due, next(self._sequence), poller))
+
+    def _run(self):
+        try:
+            self.reload()
+        except Exception as e:
+            self.app.logger.error('Loading stations failed: %s', e)
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if self._reloaded_at is None or now - self._reloaded_at >= self.reload_interval:
+                try:
+                    self.reload()
+                except Exception as e:
+                    self._reloaded_at = now
+                    self.app.logger.error('Reloading stations failed: %s', e)
+
+            with self._lock:
+                while self._due and self._due[0][0] <= now:
+                    due, _, poller = heapq.heappop(self._due)
+                    if self.pollers.get(poller.station_id) is not poller:
+                        # Removed or replaced since it was scheduled
+                        continue
+                    interval = poller.interval * (1 + random.uniform(-self.jitter, self.jitter))
+                    # Keep the cadence, unless polls fell a whole interval behind
+                    self._schedule(poller, due + interval if due + interval > now else now + interval)
+                    if poller in self._in_flight:
+                        metrics.nowplaying_polls_skipped.inc()
+                        continue
+                    self._in_flight.add(poller)
+                    metrics.nowplaying_poll_delay.observe(now - due)
+                    try:
+                        self._executor.submit(self._poll, poller)
+                    except RuntimeError:
+                        # The interpreter is exiting and no longer runs new work
+                        self._stop.set()
+                        break
+                next_due = self._due[0][0] if self._due else now + self.reload_interval
+
+            timeout = min(next_due, self._reloaded_at + self.reload_interval) - time.monotonic()
+            self._wake.wait(max(0.0, timeout))
+            self._wake.clear()
+        self._executor.shutdown(wait=False)
+
+    def _poll(self, poller):
+        try:
+            poller.poll_once()
+        except Exception as e:
+            self.app.logger.error('Now playing poller error (station %s): %s', poller.station_id, e)
+        finally:
+            with self._lock:
+                self._in_flight.discard(poller)
+
+now_playing_events = EventBroadcaster()
+now_playing_poller = NowPlayingPoller(
+    app,
+    metadata_url=app.config['NOWPLAYING_METADATA_URL'],
+    album_art_url=app.config['NOWPLAYING_ALBUM_ART_URL'],
+    interval=app.config['NOWPLAYING_POLL_INTERVAL'],
+    stale_after=app.config['NOWPLAYING_STALE_AFTER'],
+    broadcaster=now_playing_events
+)
+poll_scheduler = PollScheduler(
+    app,
+    now_playing_poller,
+    workers=app.config['NOWPLAYING_POLL_WORKERS'],
+    jitter=app.config['NOWPLAYING_POLL_JITTER'],
+    reload_interval=app.config['STATIONS_RELOAD_INTERVAL']
+)
+
+def play_history_of(station_id):
+    """Filter for one station's PlayHistory rows (None: the default station)"""
+    if station_id is None:
+        return PlayHistory.station_id.is_(None)
+    return PlayHistory.station_id == station_id
+
+def prune_play_history(station_id=None):
+    """Apply the play history retention limits to one station's plays"""
+    max_rows = app.config['PLAY_HISTORY_MAX_ROWS']
+    max_age_days = app.config['PLAY_HISTORY_MAX_AGE_DAYS']
+    if max_rows > 0:
+        # Ring buffer: rows are appended in play order, so everything at or
+        # below the id of the (max_rows + 1)th newest row goes
+        cutoff_id = db.session.execute(
+            db.select(PlayHistory.id)
+            .where(play_history_of(station_id))
+            .order_by(PlayHistory.played_at.desc(), PlayHistory.id.desc())
+            .offset(max_rows)
+            .limit(1)
+        ).scalar()
+        if cutoff_id is not None:
+            db.session.execute(
+                db.delete(PlayHistory).where(play_history_of(station_id), PlayHistory.id <= cutoff_id)
+            )
+    if max_age_days > 0:
+        cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+        db.session.execute(
+            db.delete(PlayHistory).where(play_history_of(station_id), PlayHistory.played_at < cutoff)
+        )
+    db.session.commit()
+
+# Request metrics
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.db_queries = 0
+    g.db_time = 0.0
+    if app.config['SQL_PROFILE']:
+        g.query_log = QueryLog()
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_started' not in g:
+        return response
+    metrics.observe_request(
+        request.method,
+        request.url_rule.rule if request.url_rule is not None else 'unmatched',
+        response.status_code,
+        time.perf_counter() - g.request_started,
+        g.db_queries,
+        g.db_time
+    )
+    if 'query_log' in g:
+        report_queries(g.query_log, response)
+    return response
+
+def report_queries(log, response):
+    """Add the SQL profile headers and log N+1 suspects and slow requests"""
+    response.headers['X-DB-Query-Count'] = str(log.count)
+    response.headers['X-DB-Time-ms'] = f'{log.seconds * 1000:.2f}'
+    where = f'{request.method} {request.path}'
+    for shape, count, seconds in log.repeated(app.config['SQL_PROFILE_REPEAT_THRESHOLD']):
+        app.logger.warning('Possible N+1 in %s: %d x (%.1f ms) %s', where, count, seconds * 1000, shape[:300])
+    if log.seconds * 1000 >= app.config['SQL_PROFILE_SLOW_MS']:
+        app.logger.warning('Slow SQL in %s: %s', where, log.report(app.config['SQL_PROFILE_TOP_N']))
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text format metrics (summed over all workers in multi-process mode)"""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+# API Routes
+
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    return jsonify({'status': 'ok', 'message': 'API is running'}), 200
+
+@app.route('/api/health/caches', methods=['GET'])
+def cache_health():
+    """Size and hit/miss counters of the in-process caches"""
+    caches = {'song_ids': song_ids.stats(), 'album_art': art_cache.stats()}
+    if hls_relay is not None:
+        caches['hls'] = hls_relay.stats()
+    return jsonify(caches), 200
+
+@app.route('/api/hls/<path:name>', methods=['GET'])
+def relay_hls(name):
+    """Serve a playlist or segment of the live stream through the relay cache (HLS_RELAY=true)
+
+    Playlists may be up to one TTL old and are cached by clients for what
+    is left of it; segments are immutable once published.
+    """
+    if hls_relay is None:
+        return jsonify({'error': 'HLS relay is disabled'}), 404
+    mimetype = media_type(name)
+    if mimetype is None or name.startswith('/') or '..' in name.split('/'):
+        return jsonify({'error': 'Not an HLS playlist or segment'}), 404
+
+    try:
+        if name.endswith('.m3u8'):
+            body, expires_in = hls_relay.manifest(name)
+            cache_control = f'public, max-age={int(expires_in)}'
+        else:
+            body = hls_relay.segment(name)
+            cache_control = f'public, max-age={app.config["HLS_SEGMENT_MAX_AGE"]}, immutable'
+    except RelayBusy as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    except OriginError as e:
+        return jsonify({'error': str(e)}), 404 if e.status == 404 else 502
+    except Exception as e:
+        return jsonify({'error': str(e)}), 502
+
+    response = Response(body, mimetype=mimetype)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+@app.route('/api/art/<int:song_id>', methods=['GET'])
+def get_album_art(song_id):
+    """Serve the cover snapshotted for a song from the disk cache
+
+    The ETag is the image's content hash. Requests whose ?v= is the one
+    art_url gives out for it get a year-long immutable Cache-Control, so browsers never ask
+    again; requests without it revalidate with the ETag every time.
+    """
+    try:
+        song = db.session.get(Song, song_id)
+        cached = art_cache.open(song.art_hash) if song is not None and song.art_hash else None
+        metrics.observe_cache('album_art', cached is not None)
+        if cached is None:
+            return jsonify({'error': 'No album art for this song'}), 404
+
+        path, mtime, _ = cached
+        with open(path, 'rb') as file:
+            mimetype = image_type(file.read(16)) or 'application/octet-stream'
+        response = send_file(path, mimetype=mimetype, etag=song.art_hash, last_modified=mtime)
+        if request.args.get('v') == art_version(song.art_hash):
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/trackhistory', methods=['GET'])
-def get_track_history():
-    """Get recently played tracks from Radio Calico stream"""
+def station_poller(station_id):
+    """Return the poller of an active station, or None"""
+    poller = poll_scheduler.poller(station_id)
+    if poller is None:
+        # Added by `flask add-station` since the scheduler last read the table
+        station = db.session.get(Station, station_id)
+        if station is not None and station.active:
+            poll_scheduler.reload()
+            poller = poll_scheduler.poller(station_id)
+    return poller
+
+def now_playing_response(poller):
     try:
-        # Try to fetch track history from common streaming history endpoints
-        history_urls = [
-            'https://d3d4yli4hf5bmh.cloudfront.net/hls/history.json',
-            'https://d3d4yli4hf5bmh.cloudfront.net/api/history',
-            'https://radiocalico.com/api/trackhistory.json',
-            'https://radiocalico.com/api/recent-tracks'
-        ]
+        poll_scheduler.start()
+        snapshot = poller.current()
 
-        tracks_data = None
-        for url in history_urls:
-            try:
-                response = requests.get(url, timeout=5)
-                if response.status_code == 200:
-                    data = response.json()
-                    # Normalize the response format
-                    if isinstance(data, list):
-                        tracks_data = data
-                        break
-                    elif 'tracks' in data:
-                        tracks_data = data['tracks']
-                        break
-            except:
-                continue
-
-        # If no history endpoint works, use sample/default data
-        if not tracks_data:
-            tracks_data = [
-                {
-                    'title': 'He\'s A Dream (1983)',
-                    'artist': 'Shandi Sinnamon',
-                    'album': 'Flashdance (Original Motion Picture Soundtrack)',
-                    'playedAt': '2024-11-04T18:30:00Z'
-                },
-                {
-                    'title': 'Ain\'t 2 Proud 2 Beg',
-                    'artist': 'TLC',
-                    'album': 'Ooooooohhh... On the TLC Tip',
-                    'playedAt': '2024-11-04T18:26:00Z'
-                },
-                {
-                    'title': 'Steady, As She Goes',
-                    'artist': 'The Raconteurs',
-                    'album': 'Broken Boy Soldiers',
-                    'playedAt': '2024-11-04T18:22:00Z'
-                },
-                {
-                    'title': 'Just Another Night',
-                    'artist': 'Mick Jagger',
-                    'album': 'She\'s the Boss',
-                    'playedAt': '2024-11-04T18:18:00Z'
-                },
-                {
-                    'title': 'Irreplaceable (Album Version)',
-                    'artist': 'Beyoncé',
-                    'album': 'B\'Day',
-                    'playedAt': '2024-11-04T18:14:00Z'
-                }
-            ]
+        response = conditional_jsonify(poller.to_payload(snapshot))
+        response.headers['X-Metadata-Fetched-At'] = format_timestamp(snapshot['fetched_at']) or ''
+        return response
 
-        # Add song IDs and rating stats to each track
-        enriched_tracks = []
-        for track in tracks_data:
-            title = track.get('title', 'Unknown Track')
-            artist = track.get('artist', 'Unknown Artist')
-            album = track.get('album', '')
-
-            # Find or create song in database
-            song = Song.query.filter_by(title=title, artist=artist).first()
-            if not song:
-                song = Song(title=title, artist=artist, album=album)
-                db.session.add(song)
-                db.session.commit()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/nowplaying', methods=['GET'])
+def get_now_playing():
+    """Get current track information from the background poller's snapshot"""
+    return now_playing_response(now_playing_poller)
 
-            # Get rating stats
-            song_data = song.to_dict()
+@app.route('/api/nowplaying/stream', methods=['GET'])
+def stream_now_playing():
+    """Server-Sent Events stream of track changes and rating updates
 
-            enriched_track = {
-                'song_id': song.id,
-                'title': title,
-                'artist': artist,
-                'album': album,
-                'playedAt': track.get('playedAt'),
+    The first event is the current track. After that an event is only sent
+    when the track or its rating counts change, with a comment line as a
+    heartbeat in between so proxies keep the connection open.
+    """
+    return now_playing_stream_response(now_playing_poller)
+
+def now_playing_stream_response(poller):
+    try:
+        poll_scheduler.start()
+        # Read the version before the snapshot so a change published in
+        # between is sent again rather than lost
+        version = poller.broadcaster.version
+        snapshot = poller.current()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    events = poller.broadcaster
+    heartbeat = app.config['NOWPLAYING_STREAM_HEARTBEAT']
+    initial = poller.to_payload(snapshot)
+
+    def generate():
+        nonlocal version
+        metrics.nowplaying_stream_clients.inc()
+        try:
+            yield 'retry: 5000\n'
+            yield f'event: nowplaying\ndata: {json.dumps(initial)}\n\n'
+            metrics.nowplaying_events_sent.inc()
+            while True:
+                latest_version, event = events.wait(version, heartbeat)
+                if latest_version == version:
+                    yield ': keepalive\n\n'
+                    continue
+                version = latest_version
+                yield f'id: {version}\nevent: nowplaying\ndata: {json.dumps(event)}\n\n'
+                metrics.nowplaying_events_sent.inc()
+        finally:
+            # Runs when the client disconnects and the server closes the generator
+            metrics.nowplaying_stream_clients.dec()
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/trackhistory', methods=['GET'])
+def get_track_history():
+    """Get the tracks played before the current one, newest first (?limit=)"""
+    return track_history_response(now_playing_poller)
+
+def track_history_response(poller):
+    try:
+        # Plays are only recorded while the pollers run
+        poll_scheduler.start()
+        limit = request.args.get('limit', app.config['TRACKHISTORY_LIMIT'], type=int)
+        limit = max(1, min(limit, app.config['API_MAX_PAGE_SIZE']))
+
+        def read():
+            # One more row than needed, in case the newest is the track on air
+            rows = db.session.execute(
+                db.select(PlayHistory.played_at, Song)
+                .join(Song, PlayHistory.song_id == Song.id)
+                .where(play_history_of(poller.station_id))
+                .order_by(PlayHistory.played_at.desc(), PlayHistory.id.desc())
+                .limit(limit + 1)
+            ).all()
+            return [(played_at, song.to_dict(), song.art_hash) for played_at, song in rows]
+
+        plays = read_with_pending_votes(read, songs=lambda result: [song_data for _, song_data, _ in result])
+
+        snapshot = poller.snapshot
+        if plays and snapshot is not None and plays[0][1]['id'] == snapshot['song_id']:
+            plays = plays[1:]
+
+        tracks = [
+            {
+                'song_id': song_data['id'],
+                'title': song_data['title'],
+                'artist': song_data['artist'],
+                'album': song_data['album'],
+                'playedAt': played_at.replace(tzinfo=timezone.utc).isoformat(),
                 'thumbs_up': song_data['thumbs_up'],
-                'thumbs_down': song_data['thumbs_down']
+                'thumbs_down': song_data['thumbs_down'],
+                'albumArt': art_url(song_data['id'], art_hash)
             }
-            enriched_tracks.append(enriched_track)
+            for played_at, song_data, art_hash in plays[:limit]
+        ]
+
+        return conditional_jsonify({'tracks': tracks})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        return jsonify({'tracks': enriched_tracks}), 200
+# Station endpoints
+@app.route('/api/stations', methods=['GET'])
+def get_stations():
+    """List the active stations"""
+    try:
+        stations = db.session.execute(
+            db.select(Station).where(Station.active).order_by(Station.id)
+        ).scalars()
+        return conditional_jsonify({'stations': [station.to_dict() for station in stations]})
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/stations/<int:station_id>/nowplaying', methods=['GET'])
+def get_station_now_playing(station_id):
+    """Get a station's current track (as /api/nowplaying)"""
+    poller = station_poller(station_id)
+    if poller is None:
+        return jsonify({'error': 'Station not found'}), 404
+    return now_playing_response(poller)
+
+@app.route('/api/stations/<int:station_id>/nowplaying/stream', methods=['GET'])
+def stream_station_now_playing(station_id):
+    """Server-Sent Events stream of a station's track changes (as /api/nowplaying/stream)"""
+    poller = station_poller(station_id)
+    if poller is None:
+        return jsonify({'error': 'Station not found'}), 404
+    return now_playing_stream_response(poller)
+
+@app.route('/api/stations/<int:station_id>/trackhistory', methods=['GET'])
+def get_station_track_history(station_id):
+    """Get the tracks a station played before the current one (as /api/trackhistory)"""
+    poller = station_poller(station_id)
+    if poller is None:
+        return jsonify({'error': 'Station not found'}), 404
+    return track_history_response(poller)
+
 # User endpoints
 @app.route('/api/users', methods=['GET'])
 def get_users():
-    """Get all users"""
+    """Get a page of users, newest first (?limit=, ?cursor=)"""
     try:
-        users = User.query.order_by(User.created_at.desc()).all()
-        return jsonify({'users': [user.to_dict() for user in users]}), 200
+        # Count posts in the same query instead of loading each user's posts
+        post_count = (
+            db.select(func.count(Post.id))
+            .where(Post.user_id == User.id)
+            .scalar_subquery()
+        )
+        rows, next_cursor = newest_first_page(db.select(User, post_count), User)
+        return jsonify({
+            'users': [user.to_dict(post_count=count) for user, count in rows],
+            'next_cursor': next_cursor
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -328,7 +1443,7 @@ def create_user():
 
         return jsonify({
             'message': 'User created successfully',
-            'user': new_user.to_dict()
+            'user': new_user.to_dict(post_count=0)
         }), 201
 
     except Exception as e:
@@ -350,10 +1465,18 @@ def delete_user(user_id):
 # Post endpoints
 @app.route('/api/posts', methods=['GET'])
 def get_posts():
-    """Get all posts"""
+    """Get a page of posts, newest first (?limit=, ?cursor=)"""
     try:
-        posts = Post.query.order_by(Post.created_at.desc()).all()
-        return jsonify({'posts': [post.to_dict() for post in posts]}), 200
+        # Load authors in the same query (Post.to_dict reads user.username)
+        rows, next_cursor = newest_first_page(
+            db.select(Post).options(db.joinedload(Post.user)), Post
+        )
+        return jsonify({
+            'posts': [post.to_dict() for post, in rows],
+            'next_cursor': next_cursor
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -411,6 +1534,478 @@ def delete_post(post_id):
         return jsonify({'error': str(e)}), 500
 
 # Song rating endpoints
+
+# Leaderboard windows: name -> days of ratings counted (None for all time)
+RANKING_WINDOWS = {'all': None, 'month': 30, 'week': 7, 'day': 1}
+RANKING_BATCH_SIZE = 10000
+# A rebuild counts again the songs whose rows were updated this long before
+# it started or later: covers vote transactions that were committing then
+RANKING_REBUILD_OVERLAP = timedelta(minutes=1)
+# Longest period /api/songs/<id>/trend returns, in hourly buckets
+TREND_MAX_HOURS = 24 * 90
+
+def wilson_lower_bound(up, down, z=1.96):
+    """Lower bound of the 95% Wilson score interval for the share of up votes.
+
+    Ranks a song with 90 of 100 up votes above one with 2 of 2: few votes
+    mean a wide interval and so a low bound.
+    """
+    n = up + down
+    if n == 0:
+        return 0.0
+    p = up / n
+    z2 = z * z
+    return (p + z2 / (2 * n) - z * math.sqrt((p * (1 - p) + z2 / (4 * n)) / n)) / (1 + z2 / n)
+
+def ranking_row(period, song_id, up, down, now):
+    return {
+        'period': period,
+        'song_id': song_id,
+        'thumbs_up': up,
+        'thumbs_down': down,
+        'votes': up + down,
+        'score': wilson_lower_bound(up, down),
+        'updated_at': now
+    }
+
+def upsert_rankings(rows, executor):
+    """Insert or replace SongRanking rows by (period, song_id)"""
+    ranking_table = SongRanking.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        statement = insert(ranking_table)
+        executor.execute(
+            statement.on_conflict_do_update(
+                index_elements=['period', 'song_id'],
+                set_={name: statement.excluded[name] for name in ('thumbs_up', 'thumbs_down', 'votes', 'score', 'updated_at')}
+            ),
+            rows
+        )
+        return
+    for row in rows:
+        executor.execute(db.delete(ranking_table).where(
+            ranking_table.c.period == row['period'], ranking_table.c.song_id == row['song_id']
+        ))
+    executor.execute(db.insert(ranking_table), rows)
+
+def hour_bucket(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def upsert_rollups(rows, executor):
+    """Add up/down/flips counts to RatingRollup rows, creating missing ones"""
+    rollup_table = RatingRollup.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        statement = insert(rollup_table)
+        executor.execute(
+            statement.on_conflict_do_update(
+                index_elements=['song_id', 'hour'],
+                set_={name: rollup_table.c[name] + statement.excluded[name] for name in ('up', 'down', 'flips')}
+            ),
+            rows
+        )
+        return
+    for row in rows:
+        result = executor.execute(
+            db.update(rollup_table)
+            .where(rollup_table.c.song_id == row['song_id'], rollup_table.c.hour == row['hour'])
+            .values(up=rollup_table.c.up + row['up'], down=rollup_table.c.down + row['down'],
+                    flips=rollup_table.c.flips + row['flips'])
+        )
+        if result.rowcount == 0:
+            executor.execute(db.insert(rollup_table), [row])
+
+def apply_vote_changes(changes, connection=None):
+    """Update song counters and rollups for a list of vote changes in the current transaction.
+
+    changes is a list of (song_id, previous_type, new_type, voted_at,
+    previous_at) tuples, with previous_type and previous_at (the replaced
+    rating's created_at) None for a first vote. Changes are summed per
+    song and written as `SET thumbs_up = thumbs_up + :delta` statements,
+    so concurrent writers cannot lose increments; the hourly RatingRollup
+    counts are added the same way. Statements run on connection if given,
+    otherwise on db.session.
+    """
+    executor = connection if connection is not None else db.session
+    buckets = {}
+    for song_id, previous_type, new_type, voted_at, _ in changes:
+        bucket = buckets.setdefault((song_id, hour_bucket(voted_at)), [0, 0, 0])
+        bucket[0 if new_type == 'up' else 1] += 1
+        if previous_type is not None and previous_type != new_type:
+            bucket[2] += 1
+    if buckets:
+        upsert_rollups([
+            {'song_id': song_id, 'hour': hour, 'up': up, 'down': down, 'flips': flips}
+            for (song_id, hour), (up, down, flips) in buckets.items()
+        ], executor)
+
+    deltas = {}
+    for song_id, previous_type, new_type, _, _ in changes:
+        up, down = deltas.get(song_id, (0, 0))
+        if previous_type == 'up':
+            up -= 1
+        elif previous_type == 'down':
+            down -= 1
+        if new_type == 'up':
+            up += 1
+        elif new_type == 'down':
+            down += 1
+        deltas[song_id] = (up, down)
+
+    rows = [
+        {'b_id': song_id, 'b_up': up, 'b_down': down}
+        for song_id, (up, down) in deltas.items()
+        if up or down
+    ]
+    if rows:
+        song_table = Song.__table__
+        executor.execute(
+            db.update(song_table)
+            .where(song_table.c.id == db.bindparam('b_id'))
+            .values(
+                thumbs_up=song_table.c.thumbs_up + db.bindparam('b_up'),
+                thumbs_down=song_table.c.thumbs_down + db.bindparam('b_down')
+            ),
+            rows
+        )
+        # Re-score the changed songs on the leaderboards in the same
+        # transaction. The song rows updated above stay locked until the
+        # commit, so no other writer changes these songs' rankings meanwhile
+        now = datetime.utcnow()
+        counters = executor.execute(
+            db.select(song_table.c.id, song_table.c.thumbs_up, song_table.c.thumbs_down)
+            .where(song_table.c.id.in_([row['b_id'] for row in rows]))
+        ).all()
+        rankings = [ranking_row('all', song_id, up, down, now) for song_id, up, down in counters]
+        upsert_rankings(rankings + window_rankings(changes, now, executor), executor)
+
+def window_rankings(changes, now, executor):
+    """SongRanking rows of the time windows with a list of vote changes applied.
+
+    A window's rows count the votes cast after the cutoff of its last
+    rebuild (rebuilt_at minus the window), including those that have aged
+    out since. A new vote is added to every window; the vote it replaced is
+    taken out of each window that still counts it.
+    """
+    windows = [window for window, days in RANKING_WINDOWS.items() if days is not None]
+    ranking_table = SongRanking.__table__
+    current = {
+        (period, song_id): (up, down)
+        for period, song_id, up, down in executor.execute(
+            db.select(ranking_table.c.period, ranking_table.c.song_id,
+                      ranking_table.c.thumbs_up, ranking_table.c.thumbs_down)
+            .where(ranking_table.c.period.in_(windows),
+                   ranking_table.c.song_id.in_({change[0] for change in changes}))
+            # Waits for a rebuild in progress (rebuild_ranking_window)
+            .with_for_update()
+        )
+    }
+    ranking_window = RankingWindow.__table__
+    cutoffs = {
+        period: rebuilt_at - timedelta(days=RANKING_WINDOWS[period])
+        for period, rebuilt_at in executor.execute(db.select(ranking_window.c.period, ranking_window.c.rebuilt_at))
+    }
+
+    window_deltas = {}
+    for window in windows:
+        # A window that was never rebuilt counts every vote
+        cutoff = cutoffs.get(window)
+        for song_id, previous_type, new_type, voted_at, previous_at in changes:
+            delta = window_deltas.setdefault((window, song_id), [0, 0])
+            if previous_type is not None and previous_at is not None and (cutoff is None or previous_at >= cutoff):
+                delta[0 if previous_type == 'up' else 1] -= 1
+            if cutoff is None or voted_at >= cutoff:
+                delta[0 if new_type == 'up' else 1] += 1
+
+    rows = []
+    for (window, song_id), (up_delta, down_delta) in window_deltas.items():
+        if up_delta or down_delta:
+            up, down = current.get((window, song_id), (0, 0))
+            rows.append(ranking_row(window, song_id, max(0, up + up_delta), max(0, down + down_delta), now))
+    return rows
+
+def ranking_counts(window, now, song_ids=None):
+    """Select (song_id, thumbs_up, thumbs_down) of the songs with votes in a window as of now"""
+    days = RANKING_WINDOWS[window]
+    if days is None:
+        # All time is exactly the song counters
+        query = db.select(Song.id, Song.thumbs_up, Song.thumbs_down).where((Song.thumbs_up > 0) | (Song.thumbs_down > 0))
+        song_column = Song.id
+    else:
+        query = (
+            db.select(
+                Rating.song_id,
+                func.sum(db.case((Rating.rating_type == 'up', 1), else_=0)),
+                func.sum(db.case((Rating.rating_type == 'down', 1), else_=0))
+            )
+            .where(Rating.created_at >= now - timedelta(days=days))
+            .group_by(Rating.song_id)
+        )
+        song_column = Rating.song_id
+    if song_ids is not None:
+        query = query.where(song_column.in_(song_ids))
+    return query
+
+def rebuild_ranking_window(window, now):
+    """Recompute one leaderboard window as of now and commit; returns the number of songs ranked.
+
+    The counts are added up and compared with the stored rows before taking
+    the write lock, so votes are not held up behind the scan of the ratings
+    and only rows whose counts changed are rewritten. Songs whose rows
+    apply_vote_changes updated meanwhile are counted again under the lock.
+    """
+    counts = {song_id: (up, down) for song_id, up, down in db.session.execute(ranking_counts(window, now))}
+    stored = {
+        song_id: (up, down)
+        for song_id, up, down in db.session.execute(
+            db.select(SongRanking.song_id, SongRanking.thumbs_up, SongRanking.thumbs_down)
+            .where(SongRanking.period == window)
+        )
+    }
+    db.session.commit()
+
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('LOCK TABLE song_ranking IN EXCLUSIVE MODE'))
+    # The first write takes SQLite's write lock, so nothing commits between
+    # the recount below and the rewrite
+    db.session.execute(db.delete(RankingWindow).where(RankingWindow.period == window))
+    changed = db.session.scalars(
+        db.select(SongRanking.song_id)
+        .where(SongRanking.period == window, SongRanking.updated_at >= now - RANKING_REBUILD_OVERLAP)
+    ).all()
+    for start in range(0, len(changed), RANKING_BATCH_SIZE):
+        batch = changed[start:start + RANKING_BATCH_SIZE]
+        for song_id in batch:
+            counts.pop(song_id, None)
+            stored[song_id] = None
+        counts.update(
+            (song_id, (up, down))
+            for song_id, up, down in db.session.execute(ranking_counts(window, now, batch))
+        )
+
+    removed = [song_id for song_id in stored if song_id not in counts]
+    for start in range(0, len(removed), RANKING_BATCH_SIZE):
+        db.session.execute(db.delete(SongRanking).where(
+            SongRanking.period == window, SongRanking.song_id.in_(removed[start:start + RANKING_BATCH_SIZE])
+        ))
+    rows = [
+        ranking_row(window, song_id, up, down, now)
+        for song_id, (up, down) in counts.items()
+        if stored.get(song_id) != (up, down)
+    ]
+    for start in range(0, len(rows), RANKING_BATCH_SIZE):
+        upsert_rankings(rows[start:start + RANKING_BATCH_SIZE], db.session)
+    db.session.add(RankingWindow(period=window, rebuilt_at=now))
+    db.session.commit()
+    return len(counts)
+
+def claim_ranking_rebuild(window, now, max_age):
+    """Mark window as rebuilt at now if its last rebuild is older than max_age; returns True if marked.
+
+    A conditional UPDATE, so of several worker processes checking at once
+    only one gets True. A window that was never rebuilt is always claimed.
+    """
+    ranking_window = RankingWindow.__table__
+    claimed = db.session.execute(
+        db.update(ranking_window)
+        .where(ranking_window.c.period == window, ranking_window.c.rebuilt_at < now - max_age)
+        .values(rebuilt_at=now)
+    ).rowcount
+    if not claimed:
+        claimed = db.session.get(RankingWindow, window) is None
+    db.session.commit()
+    return bool(claimed)
+
+class RankingRefresher:
+    """Rebuilds the time-window leaderboards in the background.
+
+    Votes are added to every window as they are written, but only a
+    rebuild drops the votes that have grown older than a window. The
+    thread checks every minute (or every interval, if shorter) and rebuilds
+    each window last rebuilt more than interval seconds ago, by this or
+    another worker process.
+    """
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start the refresher thread if it is enabled and not already running"""
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='ranking-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def refresh(self):
+        """Rebuild the time windows that are due; returns the names of those rebuilt"""
+        rebuilt = []
+        with self.app.app_context():
+            for window, days in RANKING_WINDOWS.items():
+                if days is None:
+                    continue
+                now = datetime.utcnow()
+                try:
+                    if claim_ranking_rebuild(window, now, timedelta(seconds=self.interval)):
+                        rebuild_ranking_window(window, now)
+                        rebuilt.append(window)
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error('Rebuilding the %s leaderboard failed: %s', window, e)
+        return rebuilt
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(min(self.interval, 60))
+
+ranking_refresher = RankingRefresher(app, app.config['RANKING_REBUILD_INTERVAL'])
+
+def write_votes(votes, connection):
+    """Write a batch of buffered votes using connection's open transaction.
+
+    The stored rating of every (song, user) pair in the batch is read with
+    one query, so counters stay exact even if another worker process wrote
+    some of these votes in the meantime.
+    """
+    keys = [(vote['song_id'], vote['user_identifier']) for vote in votes]
+    stored = {
+        (song_id, user_identifier): (rating_type, created_at)
+        for song_id, user_identifier, rating_type, created_at in connection.execute(
+            db.select(Rating.song_id, Rating.user_identifier, Rating.rating_type, Rating.created_at)
+            .where(db.tuple_(Rating.song_id, Rating.user_identifier).in_(keys))
+        )
+    }
+
+    inserts = []
+    updates = []
+    changes = []
+    for vote in votes:
+        key = (vote['song_id'], vote['user_identifier'])
+        previous_type, previous_at = stored.get(key, (None, None))
+        if previous_type == vote['rating_type']:
+            continue
+        row = {
+            'song_id': vote['song_id'],
+            'user_identifier': vote['user_identifier'],
+            'rating_type': vote['rating_type'],
+            'created_at': vote['created_at']
+        }
+        if previous_type is None:
+            inserts.append(row)
+        else:
+            updates.append({f'b_{name}': value for name, value in row.items()})
+        changes.append((vote['song_id'], previous_type, vote['rating_type'], vote['created_at'], previous_at))
+
+    if inserts:
+        connection.execute(db.insert(Rating.__table__), inserts)
+    if updates:
+        rating_table = Rating.__table__
+        connection.execute(
+            db.update(rating_table)
+            .where(
+                rating_table.c.song_id == db.bindparam('b_song_id'),
+                rating_table.c.user_identifier == db.bindparam('b_user_identifier')
+            )
+            .values(rating_type=db.bindparam('b_rating_type'), created_at=db.bindparam('b_created_at')),
+            updates
+        )
+    apply_vote_changes(changes, connection)
+
+def _flush_votes(votes):
+    with app.app_context():
+        with _vote_connection.begin():
+            write_votes(votes, _vote_connection)
+    metrics.rating_votes_flushed.inc(len(votes))
+
+pending_votes = None
+if app.config['RATING_WRITE_BEHIND']:
+    # The writer gets its own connection up front: request threads waiting
+    # for a flush to finish hold pooled connections, so a flush that had to
+    # check one out of the pool could wait on them forever.
+    with app.app_context():
+        _vote_connection = db.engine.connect()
+    pending_votes = PendingVotes(
+        _flush_votes,
+        flush_interval=app.config['RATING_FLUSH_INTERVAL_MS'] / 1000,
+        max_pending=app.config['RATING_FLUSH_MAX_VOTES'],
+        logger=app.logger
+    )
+    # Write out buffered votes on a clean shutdown
+    atexit.register(pending_votes.stop)
+
+def read_with_pending_votes(read, songs=lambda result: [result]):
+    """Run read() and add buffered (not yet written) votes to its song counts.
+
+    read returns something containing song dicts from Song.to_dict();
+    songs(result) yields those dicts, whose counts are adjusted in place.
+    Without write-behind this is just read().
+    """
+    if pending_votes is None:
+        return read()
+
+    def fresh_read():
+        # A retried read must not be served from the session's identity map
+        db.session.expire_all()
+        return read()
+
+    result, deltas = pending_votes.read_consistent(fresh_read)
+    for song_data in songs(result):
+        up, down = deltas.get(song_data['id'], (0, 0))
+        song_data['thumbs_up'] += up
+        song_data['thumbs_down'] += down
+    return result
+
+def with_pending_votes(song_data):
+    """Return a song dict with buffered votes added (unchanged without write-behind)"""
+    if pending_votes is None:
+        return song_data
+    return read_with_pending_votes(lambda: db.session.get(Song, song_data['id']).to_dict())
+
+def queue_rating(song, user_identifier, rating_type):
+    """Write-behind variant of rate_song: buffer the vote and answer right away"""
+    pending_votes.start()
+    previous_type = pending_votes.submit(
+        song.id,
+        user_identifier,
+        rating_type,
+        load_stored=lambda: db.session.execute(
+            db.select(Rating.rating_type).filter_by(song_id=song.id, user_identifier=user_identifier)
+        ).scalar()
+    )
+
+    song_data = read_with_pending_votes(lambda: db.session.get(Song, song.id).to_dict())
+    poll_scheduler.update_ratings(song.id, song_data['thumbs_up'], song_data['thumbs_down'])
+
+    rating = {'song_id': song.id, 'rating_type': rating_type}
+    if previous_type == rating_type:
+        return jsonify({
+            'message': 'Rating unchanged',
+            'rating': rating,
+            'song': song_data,
+            'updated': False
+        }), 200
+
+    return jsonify({
+        'message': 'Rating queued',
+        'rating': rating,
+        'song': song_data,
+        'updated': previous_type is not None,
+        'queued': True
+    }), 202
+
 @app.route('/api/songs/<int:song_id>/rate', methods=['POST'])
 def rate_song(song_id):
     """Rate a song with thumbs up or down, or update existing rating"""
@@ -428,6 +2023,9 @@ def rate_song(song_id):
         if not song:
             return jsonify({'error': 'Song not found'}), 404
 
+        if pending_votes is not None:
+            return queue_rating(song, data['user_identifier'], data['rating_type'])
+
         # Check if user already rated this song
         existing_rating = Rating.query.filter_by(
             song_id=song_id,
@@ -437,14 +2035,23 @@ def rate_song(song_id):
         if existing_rating:
             # User is changing their rating - update it
             if existing_rating.rating_type != data['rating_type']:
+                now = datetime.utcnow()
+                apply_vote_changes([
+                    (song_id, existing_rating.rating_type, data['rating_type'], now, existing_rating.created_at)
+                ])
                 existing_rating.rating_type = data['rating_type']
-                existing_rating.created_at = datetime.utcnow()  # Update timestamp
+                existing_rating.created_at = now  # Update timestamp
+                # Serialized before the commit expires it (saves a re-read)
+                rating_data = existing_rating.to_dict()
                 db.session.commit()
 
+                song_data = song.to_dict()
+                poll_scheduler.update_ratings(song.id, song_data['thumbs_up'], song_data['thumbs_down'])
+
                 return jsonify({
                     'message': 'Rating updated successfully',
-                    'rating': existing_rating.to_dict(),
-                    'song': song.to_dict(),
+                    'rating': rating_data,
+                    'song': song_data,
                     'updated': True
                 }), 200
             else:
@@ -460,16 +2067,23 @@ def rate_song(song_id):
         new_rating = Rating(
             song_id=song_id,
             user_identifier=data['user_identifier'],
-            rating_type=data['rating_type']
+            rating_type=data['rating_type'],
+            created_at=datetime.utcnow()
         )
 
         db.session.add(new_rating)
+        apply_vote_changes([(song_id, None, data['rating_type'], new_rating.created_at, None)])
+        # The INSERT was flushed by the counter update, so the id is known
+        rating_data = new_rating.to_dict()
         db.session.commit()
 
+        song_data = song.to_dict()
+        poll_scheduler.update_ratings(song.id, song_data['thumbs_up'], song_data['thumbs_down'])
+
         return jsonify({
             'message': 'Rating submitted successfully',
-            'rating': new_rating.to_dict(),
-            'song': song.to_dict(),
+            'rating': rating_data,
+            'song': song_data,
             'updated': False
         }), 201
 
@@ -477,6 +2091,104 @@ def rate_song(song_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/songs/top', methods=['GET'])
+def get_top_songs():
+    """Best rated songs by Wilson lower bound (?window=all|month|week|day, ?min_votes=, ?limit=)"""
+    try:
+        window = request.args.get('window', 'all')
+        if window not in RANKING_WINDOWS:
+            return jsonify({'error': f'window must be one of: {", ".join(RANKING_WINDOWS)}'}), 400
+        min_votes = request.args.get('min_votes', 1, type=int)
+        ranking_refresher.start()
+
+        rows = db.session.execute(
+            db.select(SongRanking, Song)
+            .join(Song, SongRanking.song_id == Song.id)
+            .where(SongRanking.period == window, SongRanking.votes >= min_votes)
+            .order_by(SongRanking.score.desc(), SongRanking.votes.desc(), SongRanking.song_id)
+            .limit(page_limit())
+        ).all()
+
+        songs = [
+            {
+                'rank': rank,
+                'song_id': song.id,
+                'title': song.title,
+                'artist': song.artist,
+                'album': song.album,
+                'thumbs_up': ranking.thumbs_up,
+                'thumbs_down': ranking.thumbs_down,
+                'score': round(ranking.score, 4)
+            }
+            for rank, (ranking, song) in enumerate(rows, start=1)
+        ]
+        rebuilt = db.session.get(RankingWindow, window)
+        return conditional_jsonify({
+            'window': window,
+            'min_votes': min_votes,
+            # Votes since then are included; older votes may still count
+            # in a time window until its next rebuild
+            'updated_at': rebuilt.rebuilt_at.replace(tzinfo=timezone.utc).isoformat() if rebuilt else None,
+            'songs': songs
+        })
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/songs/<int:song_id>/trend', methods=['GET'])
+def get_song_trend(song_id):
+    """Votes cast per hour for a song over the last ?hours= hours (default 24)
+
+    Read from the hourly rollup, so the cost grows with the number of
+    hours asked for, not with the number of ratings. Hours without votes
+    are included with zero counts.
+    """
+    try:
+        hours = max(1, min(request.args.get('hours', 24, type=int), TREND_MAX_HOURS))
+        if db.session.get(Song, song_id) is None:
+            return jsonify({'error': 'Song not found'}), 404
+
+        until = hour_bucket(datetime.utcnow())
+        since = until - timedelta(hours=hours - 1)
+        counts = {
+            hour: (up, down, flips)
+            for hour, up, down, flips in db.session.execute(
+                db.select(RatingRollup.hour, RatingRollup.up, RatingRollup.down, RatingRollup.flips)
+                .where(RatingRollup.song_id == song_id, RatingRollup.hour >= since)
+                .order_by(RatingRollup.hour)
+            )
+        }
+
+        buckets = []
+        totals = [0, 0, 0]
+        for offset in range(hours):
+            hour = since + timedelta(hours=offset)
+            up, down, flips = counts.get(hour, (0, 0, 0))
+            totals = [totals[0] + up, totals[1] + down, totals[2] + flips]
+            buckets.append({
+                'hour': hour.replace(tzinfo=timezone.utc).isoformat(),
+                'up': up,
+                'down': down,
+                'flips': flips
+            })
+
+        up, down, flips = totals
+        return conditional_jsonify({
+            'song_id': song_id,
+            'hours': hours,
+            'up': up,
+            'down': down,
+            'flips': flips,
+            # Share of up votes among the votes cast in the period
+            'sentiment': round(up / (up + down), 4) if up + down else None,
+            'buckets': buckets
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/songs/<int:song_id>/ratings', methods=['GET'])
 def get_song_ratings(song_id):
     """Get rating statistics for a song"""
@@ -485,7 +2197,7 @@ def get_song_ratings(song_id):
         if not song:
             return jsonify({'error': 'Song not found'}), 404
 
-        return jsonify(song.to_dict()), 200
+        return jsonify(read_with_pending_votes(lambda: db.session.get(Song, song_id).to_dict())), 200
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -494,6 +2206,14 @@ def get_song_ratings(song_id):
 def get_user_rating(song_id, user_identifier):
     """Check if a user has already rated a song"""
     try:
+        if pending_votes is not None:
+            buffered_type = pending_votes.buffered_vote(song_id, user_identifier)
+            if buffered_type is not None:
+                return jsonify({
+                    'has_rated': True,
+                    'rating_type': buffered_type
+                }), 200
+
         rating = Rating.query.filter_by(
             song_id=song_id,
             user_identifier=user_identifier
@@ -512,6 +2232,121 @@ def get_user_rating(song_id, user_identifier):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def parse_song_id(value):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError('song IDs must be integers')
+    return value
+
+def parse_user_identifier(value):
+    if not isinstance(value, str) or not value:
+        raise ValueError('user_identifier must be a non-empty string')
+    return value
+
+@app.route('/api/songs/user-ratings', methods=['POST'])
+def get_user_ratings():
+    """Look up one user's ratings for several songs in a single query"""
+    try:
+        data = request.get_json(silent=True)
+
+        if not isinstance(data, dict) or not data.get('user_identifier') or not isinstance(data.get('song_ids'), list):
+            return jsonify({'error': 'user_identifier and a song_ids list are required'}), 400
+
+        if len(data['song_ids']) > app.config['RATING_BATCH_MAX']:
+            return jsonify({'error': f'At most {app.config["RATING_BATCH_MAX"]} songs per request'}), 400
+
+        user_identifier = parse_user_identifier(data['user_identifier'])
+        song_ids = list(dict.fromkeys(parse_song_id(song_id) for song_id in data['song_ids']))
+
+        ratings = {song_id: None for song_id in song_ids}
+        if song_ids:
+            ratings.update(db.session.execute(
+                db.select(Rating.song_id, Rating.rating_type)
+                .where(Rating.user_identifier == user_identifier, Rating.song_id.in_(song_ids))
+            ).all())
+
+        if pending_votes is not None:
+            for song_id in song_ids:
+                buffered_type = pending_votes.buffered_vote(song_id, user_identifier)
+                if buffered_type is not None:
+                    ratings[song_id] = buffered_type
+
+        # JSON object keys are strings; null means the user has not rated the song
+        return jsonify({'ratings': {str(song_id): rating_type for song_id, rating_type in ratings.items()}}), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/songs/rate', methods=['POST'])
+def rate_songs():
+    """Submit several ratings from one user in a single transaction"""
+    try:
+        data = request.get_json(silent=True)
+
+        if not isinstance(data, dict) or not data.get('user_identifier') or not isinstance(data.get('ratings'), list):
+            return jsonify({'error': 'user_identifier and a ratings list are required'}), 400
+
+        if len(data['ratings']) > app.config['RATING_BATCH_MAX']:
+            return jsonify({'error': f'At most {app.config["RATING_BATCH_MAX"]} ratings per request'}), 400
+
+        user_identifier = parse_user_identifier(data['user_identifier'])
+        # Last rating per song wins, as with repeated single votes
+        ratings = {}
+        for entry in data['ratings']:
+            if not isinstance(entry, dict) or entry.get('rating_type') not in ['up', 'down']:
+                return jsonify({'error': 'each rating needs a song_id and a rating_type of "up" or "down"'}), 400
+            ratings[parse_song_id(entry.get('song_id'))] = entry['rating_type']
+
+        known = set(db.session.execute(
+            db.select(Song.id).where(Song.id.in_(list(ratings)))
+        ).scalars())
+        missing = [song_id for song_id in ratings if song_id not in known]
+        if missing:
+            return jsonify({'error': 'Song not found', 'song_ids': missing}), 404
+
+        if pending_votes is not None:
+            pending_votes.start()
+            for song_id, rating_type in ratings.items():
+                pending_votes.submit(
+                    song_id,
+                    user_identifier,
+                    rating_type,
+                    load_stored=lambda song_id=song_id: db.session.execute(
+                        db.select(Rating.rating_type).filter_by(song_id=song_id, user_identifier=user_identifier)
+                    ).scalar()
+                )
+            status_code = 202
+        else:
+            now = datetime.utcnow()
+            write_votes([
+                {'song_id': song_id, 'user_identifier': user_identifier, 'rating_type': rating_type, 'created_at': now}
+                for song_id, rating_type in ratings.items()
+            ], db.session.connection())
+            db.session.commit()
+            status_code = 200
+
+        songs = read_with_pending_votes(
+            lambda: [song.to_dict() for song in db.session.execute(
+                db.select(Song).where(Song.id.in_(list(ratings)))
+            ).scalars()],
+            songs=lambda result: result
+        )
+        for song_data in songs:
+            poll_scheduler.update_ratings(song_data['id'], song_data['thumbs_up'], song_data['thumbs_down'])
+
+        return jsonify({
+            'message': 'Ratings queued' if status_code == 202 else 'Ratings submitted successfully',
+            'ratings': [{'song_id': song_id, 'rating_type': rating_type} for song_id, rating_type in ratings.items()],
+            'songs': songs
+        }), status_code
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/songs/find-or-create', methods=['POST'])
 def find_or_create_song():
     """Find a song by title and artist, or create it if it doesn't exist"""
@@ -521,37 +2356,117 @@ def find_or_create_song():
         if not data or not data.get('title') or not data.get('artist'):
             return jsonify({'error': 'title and artist are required'}), 400
 
-        # Try to find existing song
-        song = Song.query.filter_by(
-            title=data['title'],
-            artist=data['artist']
-        ).first()
-
-        if song:
-            return jsonify({
-                'song': song.to_dict(),
-                'created': False
-            }), 200
-
-        # Create new song
-        new_song = Song(
-            title=data['title'],
-            artist=data['artist'],
-            album=data.get('album', '')
-        )
-
-        db.session.add(new_song)
-        db.session.commit()
+        song_data, created = resolve_song(data['title'], data['artist'], data.get('album', ''))
 
         return jsonify({
-            'song': new_song.to_dict(),
-            'created': True
-        }), 201
+            'song': with_pending_votes(song_data),
+            'created': created
+        }), 201 if created else 200
 
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+# Bulk export endpoints
+EXPORT_BATCH_SIZE = 1000
+
+def export_query(table, since=None, since_id=None):
+    """Build the select for an NDJSON export of 'songs', 'ratings' or 'play_history'.
+
+    since (a datetime) keeps ratings created or changed at or after it, or
+    plays at or after it; since_id keeps rows with a larger id. Rows come in a stable order, so
+    the last row of one export is a valid starting point for the next.
+    """
+    if table == 'songs':
+        if since is not None:
+            raise ValueError('songs can only be filtered with since_id')
+        song_table = Song.__table__
+        query = db.select(
+            song_table.c.id, song_table.c.title, song_table.c.artist, song_table.c.album,
+            song_table.c.thumbs_up, song_table.c.thumbs_down
+        ).order_by(song_table.c.id)
+        if since_id is not None:
+            query = query.where(song_table.c.id > since_id)
+        return query
+    if table == 'ratings':
+        rating_table = Rating.__table__
+        query = db.select(
+            rating_table.c.id, rating_table.c.song_id, rating_table.c.rating_type,
+            rating_table.c.created_at
+        ).order_by(rating_table.c.created_at, rating_table.c.id)
+        if since is not None:
+            query = query.where(rating_table.c.created_at >= since)
+        if since_id is not None:
+            query = query.where(rating_table.c.id > since_id)
+        return query
+    if table == 'play_history':
+        history_table = PlayHistory.__table__
+        query = db.select(
+            history_table.c.id, history_table.c.song_id, history_table.c.played_at
+        ).order_by(history_table.c.played_at, history_table.c.id)
+        if since is not None:
+            query = query.where(history_table.c.played_at >= since)
+        if since_id is not None:
+            query = query.where(history_table.c.id > since_id)
+        return query
+    raise LookupError(f'Unknown export {table!r}')
+
+def export_lines(engine, query):
+    """Yield an export query's rows as NDJSON, one batch of lines at a time.
+
+    Rows are read through a server-side cursor on a connection of its own,
+    so memory stays flat however large the table is and the export never
+    holds the request's session.
+    """
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE).execute(query)
+        for rows in result.partitions():
+            lines = []
+            for row in rows:
+                record = row._asdict()
+                for name in ('created_at', 'played_at'):
+                    if isinstance(record.get(name), datetime):
+                        record[name] = record[name].isoformat()
+                lines.append(json.dumps(record) + '\n')
+            yield ''.join(lines)
+
+def parse_export_filters(since, since_id):
+    if since:
+        try:
+            since = datetime.fromisoformat(since)
+        except ValueError:
+            raise ValueError('since must be an ISO 8601 timestamp')
+        # Stored timestamps are naive UTC; compare an offset as the instant it names
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    else:
+        since = None
+    if since_id in (None, ''):
+        since_id = None
+    else:
+        try:
+            since_id = int(since_id)
+        except ValueError:
+            raise ValueError('since_id must be an integer')
+    return since, since_id
+
+@app.route('/api/export/<table>', methods=['GET'])
+def export_table(table):
+    """Stream songs, ratings or play history as newline-delimited JSON (?since=, ?since_id=)"""
+    try:
+        since, since_id = parse_export_filters(request.args.get('since'), request.args.get('since_id'))
+        query = export_query(table, since=since, since_id=since_id)
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return Response(
+        export_lines(db.engine, query),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-store'}
+    )
+
 # Database initialization commands
 @app.cli.command()
 def init_db():
@@ -559,6 +2474,205 @@ def init_db():
     db.create_all()
     print('Database initialized!')
 
+# Indexes replaced by newer definitions, dropped by `flask upgrade-db`
+RETIRED_INDEXES = {
+    'user': ['ix_user_created_at'],
+    'post': ['ix_post_created_at'],
+    'play_history': ['ix_play_history_played_id']
+}
+
+@app.cli.command()
+def upgrade_db():
+    """Create missing tables and indexes on an existing database."""
+    db.create_all()
+    existing = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        columns = {column['name'] for column in existing.get_columns(table.name)}
+        for column in table.columns:
+            # Only nullable columns can be added without a default; columns
+            # with other needs get their own command (rebuild-rating-counts)
+            if column.name not in columns and column.nullable:
+                column_type = column.type.compile(db.engine.dialect)
+                with db.engine.begin() as connection:
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                print(f'Added column {table.name}.{column.name}')
+        present = {index['name'] for index in existing.get_indexes(table.name)}
+        for name in RETIRED_INDEXES.get(table.name, []):
+            if name in present:
+                with db.engine.begin() as connection:
+                    connection.execute(text(f'DROP INDEX {name}'))
+                print(f'Dropped index {name} on {table.name}')
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in present:
+                index.create(db.engine)
+                print(f'Created index {index.name} on {table.name}')
+    if db.engine.dialect.name == 'sqlite':
+        # Refresh the statistics the query planner uses to pick indexes
+        with db.engine.begin() as connection:
+            connection.execute(text('ANALYZE'))
+            journal_mode = connection.execute(text('PRAGMA journal_mode')).scalar()
+        print(f'SQLite profile {app.config["SQLITE_PROFILE"]!r}, journal mode {journal_mode}')
+    print('Database is up to date.')
+
+@app.cli.command()
+@click.option('--verify', is_flag=True, help='Only report songs whose counters disagree with the Rating table.')
+def rebuild_rating_counts(verify):
+    """Rebuild or verify the denormalized song rating counters."""
+    song_columns = {column['name'] for column in inspect(db.engine).get_columns('song')}
+    missing = [name for name in ('thumbs_up', 'thumbs_down') if name not in song_columns]
+    if missing and verify:
+        raise click.ClickException(f'Missing counter columns: {", ".join(missing)}. Run without --verify first.')
+    for name in missing:
+        db.session.execute(text(f'ALTER TABLE song ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0'))
+        print(f'Added song.{name} column')
+
+    up_count = (
+        db.select(func.count(Rating.id))
+        .where(Rating.song_id == Song.id, Rating.rating_type == 'up')
+        .scalar_subquery()
+    )
+    down_count = (
+        db.select(func.count(Rating.id))
+        .where(Rating.song_id == Song.id, Rating.rating_type == 'down')
+        .scalar_subquery()
+    )
+
+    if verify:
+        mismatches = db.session.execute(
+            db.select(Song.id, Song.thumbs_up, Song.thumbs_down, up_count, down_count)
+            .where((Song.thumbs_up != up_count) | (Song.thumbs_down != down_count))
+        ).all()
+        for song_id, thumbs_up, thumbs_down, actual_up, actual_down in mismatches:
+            print(f'Song {song_id}: stored {thumbs_up}/{thumbs_down}, actual {actual_up}/{actual_down}')
+        if mismatches:
+            raise click.ClickException(f'{len(mismatches)} song(s) have incorrect rating counters')
+        print('All rating counters match the Rating table.')
+        return
+
+    result = db.session.execute(
+        db.update(Song).values(thumbs_up=up_count, thumbs_down=down_count)
+    )
+    db.session.commit()
+    print(f'Rebuilt rating counters for {result.rowcount} song(s).')
+
+@app.cli.command()
+@click.argument('table', type=click.Choice(['songs', 'ratings', 'play_history']))
+@click.option('--since', help='Only ratings created or changed, or plays, at or after this ISO 8601 timestamp.')
+@click.option('--since-id', type=int, help='Only rows with a larger id.')
+@click.option('--output', '-o', type=click.File('w'), default='-', help='File to write (default: stdout).')
+def export(table, since, since_id, output):
+    """Export songs, ratings or play history as newline-delimited JSON."""
+    try:
+        since, since_id = parse_export_filters(since, since_id)
+        query = export_query(table, since=since, since_id=since_id)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    for chunk in export_lines(db.engine, query):
+        output.write(chunk)
+
+@app.cli.command()
+@click.option('--window', 'windows', multiple=True, type=click.Choice(list(RANKING_WINDOWS)),
+              help='Window to rebuild (repeatable, default: all of them).')
+def rebuild_rankings(windows):
+    """Recompute the song leaderboard from the ratings."""
+    for window in windows or RANKING_WINDOWS:
+        ranked = rebuild_ranking_window(window, datetime.utcnow())
+        print(f'Ranked {ranked} song(s) for window {window!r}')
+
+@app.cli.command()
+@click.option('--since', help='Only rebuild hours from this ISO 8601 timestamp on (default: everything).')
+def backfill_rollups(since):
+    """Rebuild the hourly rating rollups from the Rating table.
+
+    The Rating table only keeps each listener's latest vote, so rebuilt
+    hours count every current rating once, at the time it was cast, and
+    have no flips; hours maintained live by apply_vote_changes are exact.
+    """
+    try:
+        since, _ = parse_export_filters(since, None)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--since')
+    if since is not None:
+        since = hour_bucket(since)
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        hour = func.strftime('%Y-%m-%d %H:00:00', Rating.created_at)
+    elif dialect == 'postgresql':
+        hour = func.date_trunc('hour', Rating.created_at)
+    else:
+        raise click.ClickException(f'backfill-rollups does not support {dialect}')
+
+    query = (
+        db.select(
+            Rating.song_id,
+            hour,
+            func.sum(db.case((Rating.rating_type == 'up', 1), else_=0)),
+            func.sum(db.case((Rating.rating_type == 'down', 1), else_=0))
+        )
+        .group_by(Rating.song_id, hour)
+    )
+    delete = db.delete(RatingRollup)
+    if since is not None:
+        query = query.where(Rating.created_at >= since)
+        delete = delete.where(RatingRollup.hour >= since)
+
+    with db.engine.begin() as connection:
+        connection.execute(delete)
+        # Read on a second connection so the writes do not disturb the open cursor
+        with db.engine.connect() as reader:
+            result = reader.execution_options(stream_results=True, yield_per=RANKING_BATCH_SIZE).execute(query)
+            buckets = 0
+            for partition in result.partitions():
+                connection.execute(db.insert(RatingRollup.__table__), [
+                    {
+                        'song_id': song_id,
+                        'hour': datetime.fromisoformat(bucket) if isinstance(bucket, str) else bucket,
+                        'up': up,
+                        'down': down,
+                        'flips': 0
+                    }
+                    for song_id, bucket, up, down in partition
+                ])
+                buckets += len(partition)
+    print(f'Backfilled {buckets} hourly rollup row(s).')
+
+@app.cli.command()
+@click.argument('slug')
+@click.argument('name')
+@click.argument('metadata_url')
+@click.option('--album-art-url', help='URL of the current cover image.')
+@click.option('--stream-url', help='HLS playlist URL shown to clients.')
+@click.option('--poll-interval', type=float, help='Seconds between metadata polls (default: NOWPLAYING_POLL_INTERVAL).')
+def add_station(slug, name, metadata_url, album_art_url, stream_url, poll_interval):
+    """Add a station, or update and reactivate the one with this slug.
+
+    Running servers start polling it within STATIONS_RELOAD_INTERVAL seconds.
+    """
+    station = db.session.execute(db.select(Station).filter_by(slug=slug)).scalar()
+    if station is None:
+        station = Station(slug=slug)
+        db.session.add(station)
+    station.name = name
+    station.metadata_url = metadata_url
+    station.album_art_url = album_art_url
+    station.stream_url = stream_url
+    station.poll_interval = poll_interval
+    station.active = True
+    db.session.commit()
+    print(f'Station {station.id} ({slug}) saved.')
+
+@app.cli.command()
+@click.argument('slug')
+def remove_station(slug):
+    """Stop polling a station; its play history is kept."""
+    station = db.session.execute(db.select(Station).filter_by(slug=slug)).scalar()
+    if station is None:
+        raise click.ClickException(f'No station {slug!r}')
+    station.active = False
+    db.session.commit()
+    print(f'Station {station.id} ({slug}) removed.')
+
 @app.cli.command()
 def seed_db():
     """Seed the database with sample data."""
@@ -0,0 +1,130 @@
+"""
+Content-addressed disk cache for album art
+
+The station publishes the current cover at one mutable URL, so the poller
+snapshots it whenever a track becomes current and keeps the bytes here
+under their SHA-256. A given hash always names the same image, which is
+what lets /api/art responses be cached by browsers forever.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+IMAGE_TYPES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+def image_type(content):
+    """Guess an image's MIME type from its first bytes, or None"""
+    for magic, mimetype in IMAGE_TYPES:
+        if content.startswith(magic):
+            return mimetype
+    if content[:4] == b'RIFF' and content[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+class ArtCache:
+    """Image files named by content hash, evicted oldest first by total size.
+
+    Files are spread over 256 subdirectories by the first two hex digits of
+    their hash. A file's mtime is its last use (stored again or served, at
+    most once per touch_interval), so eviction drops the least recently
+    used images once the directory grows past max_bytes. Several processes
+    may share one directory: writes go through a temporary file and rename.
+    """
+
+    def __init__(self, directory, max_bytes, touch_interval=3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    def path(self, art_hash):
+        return os.path.join(self.directory, art_hash[:2], art_hash)
+
+    def store(self, content):
+        """Save image bytes if not present yet and return their hash"""
+        art_hash = hashlib.sha256(content).hexdigest()
+        path = self.path(art_hash)
+        if os.path.exists(path):
+            os.utime(path)
+            return art_hash
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(content)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.evict()
+        return art_hash
+
+    def open(self, art_hash):
+        """Return (path, mtime, size) of a cached image, or None if it is not on disk"""
+        path = self.path(art_hash)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        if now - stat.st_mtime > self.touch_interval:
+            os.utime(path, (now, now))
+        return path, stat.st_mtime, stat.st_size
+
+    def has(self, art_hash):
+        return os.path.exists(self.path(art_hash))
+
+    def evict(self):
+        """Delete the least recently used images until the total fits max_bytes"""
+        with self._lock:
+            files = []
+            total = 0
+            for subdirectory in self._subdirectories():
+                for entry in os.scandir(subdirectory):
+                    if entry.is_file() and not entry.name.startswith('.'):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+                        total += stat.st_size
+            files.sort()
+            for _, size, path in files:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evicted += 1
+            return total
+
+    def stats(self):
+        files = 0
+        total = 0
+        for subdirectory in self._subdirectories():
+            for entry in os.scandir(subdirectory):
+                if entry.is_file() and not entry.name.startswith('.'):
+                    files += 1
+                    total += entry.stat().st_size
+        return {
+            'files': files,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'evicted': self.evicted
+        }
+
+    def _subdirectories(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return [entry.path for entry in os.scandir(self.directory) if entry.is_dir()]
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Measure how much origin traffic the HLS relay saves
+
+Starts benchmarks/stub_upstream.py's server as the HLS origin (a live
+playlist with a new segment every --segment-seconds) and simulates
+--listeners players: each reloads the playlist once per target duration
+and fetches every segment it has not fetched yet, like hls.js. The
+listeners play --seconds against the origin directly, then against the
+backend's /api/hls relay (HLS_RELAY=true, served by werkzeug's threaded
+server). Prints listener requests, origin requests and latency for both
+runs, and exits non-zero if any request failed, any relayed segment
+differed from the origin's bytes, or the relay made more than
+--max-origin-ratio of the direct run's origin requests.
+
+Usage:
+    python benchmarks/bench_hls_relay.py [--listeners 200] [--seconds 20]
+                                         [--segment-seconds 2] [--delay 0.05]
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from stub_upstream import StubUpstream
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_listeners(playlist_url, stub, listeners, seconds):
+    """Play the stream from `listeners` threads; returns ({kind: [ms]}, errors)"""
+    latencies = {'playlist': [], 'segment': []}
+    errors = []
+    lock = threading.Lock()
+    deadline = time.time() + seconds
+    base_url = playlist_url.rsplit('/', 1)[0] + '/'
+
+    def timed_get(session, kind, url):
+        started = time.perf_counter()
+        try:
+            response = session.get(url, timeout=30)
+        except requests.RequestException as e:
+            response = e
+        with lock:
+            latencies[kind].append((time.perf_counter() - started) * 1000)
+            if not isinstance(response, requests.Response) or response.status_code != 200:
+                errors.append(f'{kind} {url}: {response}')
+                return None
+        return response
+
+    def listener(number):
+        session = requests.Session()
+        # Players join at different moments, not in lockstep
+        time.sleep(random.Random(number).uniform(0, stub.segment_seconds))
+        fetched = set()
+        while time.time() < deadline:
+            response = timed_get(session, 'playlist', playlist_url)
+            if response is not None:
+                names = [line for line in response.text.splitlines() if line and not line.startswith('#')]
+                # A new player starts three segments from the live edge
+                for name in (names if fetched else names[-3:]):
+                    if name in fetched:
+                        continue
+                    fetched.add(name)
+                    segment = timed_get(session, 'segment', base_url + name)
+                    sequence = int(name[len('segment'):-len('.ts')])
+                    if segment is not None and segment.content != stub.segment(sequence):
+                        with lock:
+                            errors.append(f'segment {name}: content differs from the origin')
+            time.sleep(stub.segment_seconds)
+
+    with ThreadPoolExecutor(listeners) as pool:
+        list(pool.map(listener, range(listeners)))
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--listeners', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=20.0, help='listening time per run')
+    parser.add_argument('--segment-seconds', type=float, default=2.0)
+    parser.add_argument('--delay', type=float, default=0.05, help='origin response time in seconds')
+    parser.add_argument('--max-origin-ratio', type=float, default=0.05)
+    args = parser.parse_args()
+
+    stub = StubUpstream(delay=args.delay, segment_seconds=args.segment_seconds).start()
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.update(
+        DATABASE_URL=f'sqlite:///{os.path.join(tmp.name, "bench.db")}',
+        NOWPLAYING_METADATA_URL=f'{stub.url}/metadata.json',
+        NOWPLAYING_ALBUM_ART_URL=f'{stub.url}/cover.jpg',
+        ART_CACHE_DIR=os.path.join(tmp.name, 'art'),
+        HLS_RELAY='true',
+        HLS_ORIGIN_URL=f'{stub.url}/hls/',
+        HLS_SEGMENT_DISK_DIR=os.path.join(tmp.name, 'hls'),
+        # Small enough that the run exercises the disk spillover
+        HLS_SEGMENT_MEMORY_BYTES=str(4 * stub.segment_bytes)
+    )
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    relay_url = f'http://127.0.0.1:{server.server_port}/api/hls/live.m3u8'
+
+    results = {}
+    failures = []
+    for run, playlist_url in (('direct', f'{stub.url}/hls/live.m3u8'), ('relay', relay_url)):
+        hits_before = dict(stub.hits)
+        latencies, errors = run_listeners(playlist_url, stub, args.listeners, args.seconds)
+        origin = {path: count - hits_before.get(path, 0) for path, count in stub.hits.items()}
+        results[run] = (latencies, errors, origin.get('/hls/live.m3u8', 0) + origin.get('/hls/*.ts', 0))
+        failures += errors
+
+    print(f'{args.listeners} listeners, {args.seconds:g}s per run, {args.segment_seconds:g}s segments, '
+          f'origin answers in {args.delay * 1000:g} ms\n')
+    print(f'{"":<22}{"requests":>10}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"max ms":>9}')
+    for run, (latencies, errors, origin_requests) in results.items():
+        total = sum(len(values) for values in latencies.values())
+        print(f'{run}: {total} listener requests, {len(errors)} errors, {origin_requests} origin requests')
+        for kind, values in latencies.items():
+            if values:
+                print(f'  {kind:<20}{len(values):>10}{percentile(values, 0.5):>9.1f}'
+                      f'{percentile(values, 0.95):>9.1f}{percentile(values, 0.99):>9.1f}{max(values):>9.1f}')
+    print(f'\nrelay caches: {backend.hls_relay.stats()}')
+    for error in failures[:5]:
+        print(f'  {error}')
+
+    server.shutdown()
+    backend.poll_scheduler.stop()
+    stub.stop()
+
+    ratio = results['relay'][2] / max(1, results['direct'][2])
+    ok = not failures and ratio <= args.max_origin_ratio
+    print(f'relay origin requests: {ratio:.1%} of direct')
+    print('OK' if ok else 'FAILED')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
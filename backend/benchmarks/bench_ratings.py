@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark rating throughput: immediate commits vs write-behind batching
+
+Drives POST /api/songs/<id>/rate through the Flask test client from several
+threads against a throwaway SQLite file, once per mode, and reports votes/s.
+Each mode runs in its own process because the backend reads its
+configuration from the environment at import time.
+
+Usage:
+    python benchmarks/bench_ratings.py [--threads 8] [--votes 2000] [--users 5000]
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_mode(threads, votes, users):
+    """Run one benchmark in this process, using the current environment"""
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+
+    with backend.app.app_context():
+        backend.db.create_all()
+        song = backend.Song(title='Benchmark Song', artist='Benchmark Artist', album='')
+        backend.db.session.add(song)
+        backend.db.session.commit()
+        song_id = song.id
+
+    votes_per_thread = votes // threads
+    errors = []
+
+    def worker(seed):
+        client = backend.app.test_client()
+        rng = random.Random(seed)
+        for _ in range(votes_per_thread):
+            response = client.post(f'/api/songs/{song_id}/rate', json={
+                'user_identifier': f'user_{rng.randrange(users)}',
+                'rating_type': rng.choice(['up', 'down'])
+            })
+            if response.status_code >= 300:
+                errors.append(response.get_json())
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    if backend.pending_votes is not None:
+        # Count the final flush, so both modes measure votes actually stored
+        backend.pending_votes.stop()
+    elapsed = time.perf_counter() - started
+
+    total = votes_per_thread * threads
+    print(f'{total} {elapsed:.3f} {len(errors)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--votes', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--run', choices=['sync', 'write-behind'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_mode(args.threads, args.votes, args.users)
+        return
+
+    print(f'{args.votes} votes from {args.threads} threads, {args.users} distinct users\n')
+    print(f'{"mode":<14}{"votes/s":>10}{"seconds":>10}{"errors":>8}')
+    for mode in ('sync', 'write-behind'):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                DATABASE_URL=f'sqlite:///{os.path.join(tmp, "bench.db")}',
+                RATING_WRITE_BEHIND='true' if mode == 'write-behind' else 'false',
+                NOWPLAYING_METADATA_URL='http://127.0.0.1:9/metadata.json'
+            )
+            output = subprocess.run(
+                [sys.executable, __file__, '--run', mode, '--threads', str(args.threads),
+                 '--votes', str(args.votes), '--users', str(args.users)],
+                env=env, capture_output=True, text=True, check=True
+            ).stdout.split()
+            total, elapsed, errors = int(output[0]), float(output[1]), int(output[2])
+            print(f'{mode:<14}{total / elapsed:>10.0f}{elapsed:>10.2f}{errors:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Benchmark the SQLite profile and indexes added by `flask upgrade-db`
+
+Builds a throwaway database with the pre-upgrade schema (no extra indexes)
+and SQLite's default settings, times a set of the backend's queries and
+single-vote writes, then upgrades the same file (SQLITE_PROFILE=production
+plus `flask upgrade-db`) and times them again. Each phase runs in its own
+process because the backend reads its configuration at import time.
+
+Usage:
+    python benchmarks/bench_sqlite.py [--ratings 1000000] [--songs 20000]
+                                      [--users 5000] [--posts 50000]
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Indexes that an existing (pre-upgrade) database does not have yet
+NEW_INDEXES = ('ix_user_created_id', 'ix_post_created_id', 'ix_post_user_id', 'ix_rating_song_type', 'ix_rating_created_id')
+
+SAMPLES = 500
+WRITES = 500
+
+
+def import_backend():
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+    return backend
+
+
+def build(args):
+    """Create and fill the database with the pre-upgrade schema"""
+    backend = import_backend()
+    db = backend.db
+    rng = random.Random(1)
+    now = datetime.utcnow()
+
+    def timestamp():
+        return now - timedelta(seconds=rng.randrange(365 * 24 * 3600))
+
+    with backend.app.app_context():
+        db.create_all()
+        with db.engine.begin() as connection:
+            for name in NEW_INDEXES:
+                connection.execute(db.text(f'DROP INDEX IF EXISTS {name}'))
+
+            connection.execute(db.insert(backend.User.__table__), [
+                {'username': f'user{i}', 'email': f'user{i}@example.com', 'created_at': timestamp()}
+                for i in range(args.users)
+            ])
+            connection.execute(db.insert(backend.Post.__table__), [
+                {'title': f'Post {i}', 'content': 'Lorem ipsum ' * 20,
+                 'user_id': rng.randrange(args.users) + 1, 'created_at': timestamp()}
+                for i in range(args.posts)
+            ])
+            connection.execute(db.insert(backend.Song.__table__), [
+                {'title': f'Song {i}', 'artist': f'Artist {i % 500}', 'album': ''}
+                for i in range(args.songs)
+            ])
+
+            listeners = max(args.ratings // args.songs * 2, 100)
+            per_song = args.ratings // args.songs
+            batch = []
+            for song_id in range(1, args.songs + 1):
+                for listener in rng.sample(range(listeners), per_song):
+                    batch.append({
+                        'song_id': song_id,
+                        'user_identifier': f'listener_{listener}',
+                        'rating_type': 'up' if rng.random() < 0.7 else 'down',
+                        'created_at': timestamp()
+                    })
+                if len(batch) >= 50000:
+                    connection.execute(db.insert(backend.Rating.__table__), batch)
+                    batch = []
+            if batch:
+                connection.execute(db.insert(backend.Rating.__table__), batch)
+        backend.app.test_cli_runner().invoke(backend.rebuild_rating_counts)
+
+
+def timed(function, repeat):
+    started = time.perf_counter()
+    for i in range(repeat):
+        function(i)
+    return (time.perf_counter() - started) * 1000
+
+
+def measure(args, phase):
+    """Time the benchmark queries, printing `name milliseconds` lines"""
+    backend = import_backend()
+    db = backend.db
+    Rating, Post, User = backend.Rating, backend.Post, backend.User
+    rng = random.Random(2)
+    song_ids = [rng.randrange(args.songs) + 1 for _ in range(SAMPLES)]
+    user_ids = [rng.randrange(args.users) + 1 for _ in range(SAMPLES)]
+    client = backend.app.test_client()
+    results = []
+
+    with backend.app.app_context():
+        if phase == 'after':
+            started = time.perf_counter()
+            backend.app.test_cli_runner().invoke(backend.upgrade_db)
+            results.append(('flask upgrade-db (one-off)', (time.perf_counter() - started) * 1000))
+
+        def rating_counts(i):
+            db.session.execute(
+                db.select(Rating.rating_type, db.func.count(Rating.id))
+                .where(Rating.song_id == song_ids[i])
+                .group_by(Rating.rating_type)
+            ).all()
+
+        def latest_posts(i):
+            db.session.execute(db.select(Post).order_by(Post.created_at.desc(), Post.id.desc()).limit(20)).all()
+
+        def latest_users(i):
+            db.session.execute(db.select(User).order_by(User.created_at.desc(), User.id.desc()).limit(20)).all()
+
+        def post_count(i):
+            db.session.execute(
+                db.select(db.func.count(Post.id)).where(Post.user_id == user_ids[i])
+            ).scalar()
+
+        def verify_counters(i):
+            backend.app.test_cli_runner().invoke(backend.rebuild_rating_counts, ['--verify'])
+
+        def vote(i):
+            client.post(f'/api/songs/{song_ids[i]}/rate', json={
+                'user_identifier': f'bench_{phase}_{i}',
+                'rating_type': 'up'
+            })
+
+        results += [
+            (f'rating counts by type, {SAMPLES} songs', timed(rating_counts, SAMPLES)),
+            (f'latest 20 posts x{SAMPLES}', timed(latest_posts, SAMPLES)),
+            (f'latest 20 users x{SAMPLES}', timed(latest_users, SAMPLES)),
+            (f'post count per user, {SAMPLES} users', timed(post_count, SAMPLES)),
+            ('flask rebuild-rating-counts --verify', timed(verify_counters, 1)),
+            (f'{WRITES} committed votes', timed(vote, WRITES)),
+        ]
+
+    for name, milliseconds in results:
+        print(f'{milliseconds:.1f}\t{name}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ratings', type=int, default=1000000)
+    parser.add_argument('--songs', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--posts', type=int, default=50000)
+    parser.add_argument('--run', choices=['build', 'before', 'after'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run == 'build':
+        build(args)
+        return
+    if args.run:
+        measure(args, args.run)
+        return
+
+    print(f'{args.ratings} ratings, {args.songs} songs, {args.users} users, {args.posts} posts\n')
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        base_env = dict(
+            os.environ,
+            DATABASE_URL=f'sqlite:///{os.path.join(tmp, "bench.db")}',
+            RATING_WRITE_BEHIND='false',
+            NOWPLAYING_METADATA_URL='http://127.0.0.1:9/metadata.json'
+        )
+        for phase, profile in (('build', 'default'), ('before', 'default'), ('after', 'production')):
+            started = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, __file__, '--run', phase,
+                 '--ratings', str(args.ratings), '--songs', str(args.songs),
+                 '--users', str(args.users), '--posts', str(args.posts)],
+                env=dict(base_env, SQLITE_PROFILE=profile), capture_output=True, text=True, check=True
+            ).stdout
+            if phase == 'build':
+                print(f'Built database in {time.perf_counter() - started:.1f}s\n')
+                continue
+            for line in output.splitlines():
+                milliseconds, name = line.split('\t', 1)
+                timings.setdefault(name, {})[phase] = float(milliseconds)
+
+    print(f'{"":<42}{"before ms":>12}{"after ms":>12}{"speedup":>10}')
+    for name, phases in timings.items():
+        before, after = phases.get('before'), phases['after']
+        if before is None:
+            print(f'{name:<42}{"":>12}{after:>12.1f}')
+        else:
+            print(f'{name:<42}{before:>12.1f}{after:>12.1f}{before / after:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
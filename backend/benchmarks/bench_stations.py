@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Check that adding stations does not slow down requests or add threads
+
+Starts benchmarks/stub_upstream.py's server (each station gets its own
+track list through /metadata.json?station=<slug>) and serves the backend
+from a separate process with werkzeug's threaded server. For each count
+in --stations, adds stations until there are that many, lets the
+scheduler pick them up and then sends station now playing and track
+history requests for --seconds. Prints request latency, the server's
+thread count once the load is over, how many metadata polls the
+scheduler made against how many were due and how late polls started
+(from /metrics). Exits non-zero if any request failed, the thread count
+grew by more than the poll worker pool (which starts its threads as
+needed) over the first count's, or the largest count's p99 exceeds
+--max-p99-ms.
+
+Linux only (threads are counted from /proc).
+
+Usage:
+    python benchmarks/bench_stations.py [--stations 1,10,50] [--seconds 15]
+                                        [--interval 2] [--delay 0.05]
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from stub_upstream import StubUpstream
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_load(base_url, station_ids, seconds, clients):
+    """Request random stations from `clients` threads for `seconds`; returns ([ms], errors)"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.time() + seconds
+
+    def client(number):
+        rng = random.Random(number)
+        # Closed at the end, so the server's connection threads exit too
+        with requests.Session() as session:
+            while time.time() < deadline:
+                path = f'/api/stations/{rng.choice(station_ids)}/{rng.choice(["nowplaying", "trackhistory"])}'
+                started = time.perf_counter()
+                try:
+                    response = session.get(base_url + path, timeout=30)
+                    error = None if response.status_code == 200 else f'{response.status_code} {path}'
+                except requests.RequestException as e:
+                    error = f'{type(e).__name__} {path}'
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    if error:
+                        errors.append(error)
+
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(client, range(clients)))
+    return latencies, errors
+
+
+def thread_count(pid):
+    return len(os.listdir(f'/proc/{pid}/task'))
+
+
+def scrape(base_url):
+    """Return {sample name: value} of the server's unlabelled metric samples"""
+    from prometheus_client.parser import text_string_to_metric_families
+    text = requests.get(base_url + '/metrics', timeout=30).text
+    return {
+        sample.name: sample.value
+        for family in text_string_to_metric_families(text)
+        for sample in family.samples if not sample.labels
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--stations', default='1,10,50', help='comma-separated station counts, ascending')
+    parser.add_argument('--seconds', type=float, default=15.0, help='load duration per station count')
+    parser.add_argument('--interval', type=float, default=2.0, help='seconds between polls of each station')
+    parser.add_argument('--delay', type=float, default=0.05, help='upstream response time in seconds')
+    parser.add_argument('--workers', type=int, default=4, help='NOWPLAYING_POLL_WORKERS')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent request threads')
+    parser.add_argument('--max-p99-ms', type=float, default=100.0)
+    args = parser.parse_args()
+    counts = [int(count) for count in args.stations.split(',')]
+
+    stub = StubUpstream(delay=args.delay, track_seconds=10).start()
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.update(
+        DATABASE_URL=f'sqlite:///{os.path.join(tmp.name, "bench.db")}',
+        NOWPLAYING_METADATA_URL=f'{stub.url}/metadata.json',
+        NOWPLAYING_ALBUM_ART_URL=f'{stub.url}/cover.jpg',
+        NOWPLAYING_POLL_INTERVAL=str(args.interval),
+        NOWPLAYING_POLL_WORKERS=str(args.workers),
+        STATIONS_RELOAD_INTERVAL='1',
+        ART_CACHE_DIR=os.path.join(tmp.name, 'art')
+    )
+    # Stations are added from here; the server process does the polling
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+
+    with backend.app.app_context():
+        backend.db.create_all()
+
+    port = 5000 + random.randrange(1000, 4000)
+    base_url = f'http://127.0.0.1:{port}'
+    server = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, 'loadtest.py'), '--serve', str(port)],
+                              stderr=subprocess.DEVNULL)
+    try:
+        results, failures = measure(args, backend, stub, base_url, server.pid, counts)
+    finally:
+        stub.stop()
+        server.terminate()
+        server.wait()
+        tmp.cleanup()
+
+    print(f'{args.interval:g}s poll interval, upstream answers in {args.delay * 1000:g} ms, '
+          f'{args.workers} poll workers, {args.clients} clients, {args.seconds:g}s per count\n')
+    print(f'{"stations":>9}{"requests":>10}{"errors":>8}{"p50 ms":>9}{"p99 ms":>9}{"threads":>9}'
+          f'{"polls":>8}{"due":>8}{"delay ms":>10}{"skipped":>9}')
+    for r in results:
+        print(f'{r["stations"]:>9}{r["requests"]:>10}{r["errors"]:>8}{r["p50"]:>9.1f}{r["p99"]:>9.1f}'
+              f'{r["threads"]:>9}{r["polls"]:>8}{r["due"]:>8.0f}{r["delay_ms"]:>10.1f}{r["skipped"]:>9}')
+    for error in failures[:5]:
+        print(f'  {error}')
+
+    growth = max(r['threads'] for r in results) - results[0]['threads']
+    ok = not failures and growth <= args.workers and results[-1]['p99'] <= args.max_p99_ms
+    print(f'thread growth: {growth} (poll workers: {args.workers})')
+    print('OK' if ok else 'FAILED')
+    sys.exit(0 if ok else 1)
+
+
+def measure(args, backend, stub, base_url, pid, counts):
+    """Run the load at each station count; returns (results, errors)"""
+    deadline = time.time() + 60
+    while True:
+        try:
+            requests.get(base_url + '/api/nowplaying', timeout=30)
+            break
+        except requests.RequestException:
+            if time.time() > deadline:
+                raise SystemExit(f'Backend at {base_url} did not become ready')
+            time.sleep(0.2)
+
+    results = []
+    failures = []
+    station_ids = []
+    for count in counts:
+        with backend.app.app_context():
+            for number in range(len(station_ids), count):
+                station = backend.Station(
+                    slug=f'station-{number}', name=f'Station {number}',
+                    metadata_url=f'{stub.url}/metadata.json?station=station-{number}',
+                    album_art_url=f'{stub.url}/cover.jpg'
+                )
+                backend.db.session.add(station)
+                backend.db.session.commit()
+                station_ids.append(station.id)
+        # Let the scheduler read the table and poll every new station once
+        time.sleep(1 + 2 * args.interval)
+
+        polls_before = stub.hits.get('/metadata.json', 0)
+        before = scrape(base_url)
+        started = time.time()
+        latencies, errors = run_load(base_url, station_ids, args.seconds, args.clients)
+        elapsed = time.time() - started
+        # Connection threads exit once the clients have closed their sessions
+        time.sleep(0.5)
+        threads = thread_count(pid)
+        after = scrape(base_url)
+        polls = stub.hits.get('/metadata.json', 0) - polls_before
+
+        def delta(name):
+            return after.get(name, 0.0) - before.get(name, 0.0)
+
+        delays = delta('nowplaying_poll_delay_seconds_count')
+        results.append({
+            'stations': count,
+            'requests': len(latencies),
+            'errors': len(errors),
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+            'threads': threads,
+            'polls': polls,
+            # The default station is polled too
+            'due': (count + 1) * elapsed / args.interval,
+            'delay_ms': delta('nowplaying_poll_delay_seconds_sum') / delays * 1000 if delays else 0.0,
+            'skipped': int(delta('nowplaying_polls_skipped_total'))
+        })
+        failures += errors
+    return results, failures
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Check that a slow upstream does not slow down the API
+
+Starts benchmarks/stub_upstream.py's server and points the now playing
+poller and the HLS relay at it, then serves the backend from a fixed pool
+of worker slots (like `gunicorn -w 4` sync workers) and hammers it with a
+mix of health, now playing, track history, rating and relayed segment
+requests (new segments, so each is a cache miss). The load runs twice:
+once with a fast upstream and once with one that takes --delay seconds to
+answer (longer than UPSTREAM_READ_TIMEOUT, so every poll times out and is
+retried, and longer than HLS_ORIGIN_READ_TIMEOUT). Prints per-endpoint
+latency percentiles for both phases and how many upstream requests were
+made, and exits non-zero if any request failed (relayed segments may
+answer 502 or 503 while the upstream is slow) or the slow phase's p99 of
+the other endpoints exceeds --max-p99-ms.
+
+Usage:
+    python benchmarks/bench_upstream_latency.py [--delay 8] [--seconds 20]
+                                                [--workers 4] [--clients 16]
+                                                [--hls-max-waiting 2]
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from stub_upstream import StubUpstream
+
+
+class BoundedWorkers:
+    """WSGI middleware that lets at most `workers` requests run at once"""
+
+    def __init__(self, app, workers):
+        self.app = app
+        self._slots = threading.Semaphore(workers)
+
+    def __call__(self, environ, start_response):
+        with self._slots:
+            return list(self.app(environ, start_response))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_load(base_url, song_ids, seconds, clients):
+    """Send requests from `clients` threads for `seconds`; returns {endpoint: [ms]}, errors"""
+    latencies = {}
+    errors = []
+    lock = threading.Lock()
+    deadline = time.time() + seconds
+
+    def client(number):
+        session = requests.Session()
+        rng = random.Random(number)
+        while time.time() < deadline:
+            song_id = rng.choice(song_ids)
+            name, method, path, body = rng.choice([
+                ('GET /api/health', 'GET', '/api/health', None),
+                ('GET /api/nowplaying', 'GET', '/api/nowplaying', None),
+                ('GET /api/trackhistory', 'GET', '/api/trackhistory', None),
+                ('GET /api/songs/<id>/ratings', 'GET', f'/api/songs/{song_id}/ratings', None),
+                ('GET /api/hls/<segment>', 'GET', f'/api/hls/segment{rng.randrange(10 ** 9)}.ts', None),
+                ('POST /api/songs/<id>/rate', 'POST', f'/api/songs/{song_id}/rate', {
+                    'user_identifier': f'bench_{number}_{rng.randrange(50)}',
+                    'rating_type': rng.choice(['up', 'down'])
+                }),
+            ])
+            started = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, json=body, timeout=30)
+                # The relay answers 502 (origin timed out) or 503 (too many
+                # requests waiting on it) instead of holding the worker
+                ok = response.status_code < 500 or (name == 'GET /api/hls/<segment>' and response.status_code in (502, 503))
+            except requests.RequestException as e:
+                ok, response = False, e
+            milliseconds = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.setdefault(name, []).append(milliseconds)
+                if not ok:
+                    errors.append(f'{name}: {response}')
+
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(client, range(clients)))
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--delay', type=float, default=8.0, help='slow upstream delay in seconds')
+    parser.add_argument('--seconds', type=float, default=20.0, help='load duration per phase')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent request slots')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent load threads')
+    parser.add_argument('--hls-max-waiting', type=int, default=2, help='HLS_MAX_WAITING, below --workers')
+    parser.add_argument('--max-p99-ms', type=float, default=500.0)
+    args = parser.parse_args()
+
+    stub = StubUpstream(delay=0.01, track_seconds=5).start()
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.update(
+        DATABASE_URL=f'sqlite:///{os.path.join(tmp.name, "bench.db")}',
+        NOWPLAYING_METADATA_URL=f'{stub.url}/metadata.json',
+        NOWPLAYING_ALBUM_ART_URL=f'{stub.url}/cover.jpg',
+        NOWPLAYING_POLL_INTERVAL='1',
+        ART_CACHE_DIR=os.path.join(tmp.name, 'art'),
+        HLS_RELAY='true',
+        HLS_ORIGIN_URL=f'{stub.url}/hls/',
+        HLS_SEGMENT_DISK_DIR=os.path.join(tmp.name, 'hls'),
+        HLS_MAX_WAITING=str(args.hls_max_waiting)
+    )
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+    from werkzeug.serving import make_server
+
+    with backend.app.app_context():
+        backend.db.create_all()
+        song_ids = [
+            song_data['id'] for song_data, _ in backend.upsert_songs([
+                {'title': f'Song {i}', 'artist': 'Bench'} for i in range(20)
+            ]).values()
+        ]
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, BoundedWorkers(backend.app, args.workers), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    requests.get(base_url + '/api/nowplaying', timeout=30)
+
+    results = {}
+    failures = []
+    for phase, delay in (('fast upstream', 0.01), (f'upstream {args.delay:g}s', args.delay)):
+        stub.delay = delay
+        hits_before = sum(stub.hits.values())
+        latencies, errors = run_load(base_url, song_ids, args.seconds, args.clients)
+        results[phase] = (latencies, errors, sum(stub.hits.values()) - hits_before)
+        failures += errors
+
+    print(f'{args.workers} worker slots, {args.clients} clients, {args.seconds:g}s per phase\n')
+    print(f'{"":<30}{"requests":>10}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"max ms":>9}')
+    slow_p99 = 0.0
+    for phase, (latencies, errors, upstream_requests) in results.items():
+        total = sum(len(values) for values in latencies.values())
+        print(f'{phase}: {total} API requests, {len(errors)} errors, '
+              f'{upstream_requests} upstream requests (poller and relay)')
+        for name, values in sorted(latencies.items()):
+            p99 = percentile(values, 0.99)
+            print(f'  {name:<28}{len(values):>10}{percentile(values, 0.5):>9.1f}'
+                  f'{percentile(values, 0.95):>9.1f}{p99:>9.1f}{max(values):>9.1f}')
+            if phase != 'fast upstream' and name != 'GET /api/hls/<segment>':
+                slow_p99 = max(slow_p99, p99)
+
+    snapshot = backend.now_playing_poller.current()
+    print(f'\nnow playing snapshot stale at the end: {backend.now_playing_poller.is_stale(snapshot)}')
+    print(f'relayed segments turned away (HLS_MAX_WAITING={args.hls_max_waiting}): {backend.hls_relay.stats()["rejected"]}')
+    for error in failures[:5]:
+        print(f'  {error}')
+
+    server.shutdown()
+    backend.poll_scheduler.stop()
+    stub.stop()
+
+    ok = not failures and slow_p99 <= args.max_p99_ms
+    print('OK' if ok else f'FAILED (slow upstream p99 {slow_p99:.1f} ms, limit {args.max_p99_ms:g} ms)')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Load test the API over HTTP and save the results as JSON
+
+Starts benchmarks/stub_upstream.py's server in place of the station's
+CloudFront metadata and cover URLs, serves the backend from a separate
+process (werkzeug's threaded server, or any server given with --url), and
+drives each scenario for --duration seconds at every --concurrency level.
+Requests are spread over --client-processes processes so the load
+generator itself is not held back by the GIL. Reports throughput and
+p50/p95/p99 latency per scenario and writes them, with the commit and
+settings, to a JSON file; --compare prints the change against an earlier
+results file.
+
+Scenarios: nowplaying, trackhistory, rate (POST /api/songs/<id>/rate for
+random songs and listeners), users and posts (first page and a few pages
+in via the cursor), and mixed (all of them).
+
+Usage:
+    python benchmarks/seed_data.py --database /tmp/load.db
+    python benchmarks/loadtest.py --database /tmp/load.db [--duration 20]
+        [--concurrency 1,8,32] [--scenarios nowplaying,rate,...]
+        [--output results.json] [--compare previous.json]
+
+Without --database a small data set is seeded into a temporary file.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from multiprocessing import Pool
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from stub_upstream import StubUpstream
+
+SCENARIOS = ('nowplaying', 'trackhistory', 'rate', 'users', 'posts', 'mixed')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def next_request(scenario, rng, state):
+    """Return (method, path, body) for one request of a scenario"""
+    if scenario == 'mixed':
+        scenario = rng.choice(SCENARIOS[:-1])
+    if scenario == 'nowplaying':
+        return 'GET', '/api/nowplaying', None
+    if scenario == 'trackhistory':
+        return 'GET', '/api/trackhistory', None
+    if scenario == 'rate':
+        return 'POST', f'/api/songs/{rng.randint(1, state["songs"])}/rate', {
+            'user_identifier': f'load_{rng.randrange(100000)}',
+            'rating_type': rng.choice(['up', 'down'])
+        }
+    # List endpoints: mostly the first page, sometimes a page further in
+    cursor = state['cursors'].get(scenario) if rng.random() < 0.3 else None
+    return 'GET', f'/api/{scenario}' + (f'?cursor={cursor}' if cursor else ''), None
+
+
+def client_process(base_url, scenario, threads, duration, seed, songs):
+    """Run `threads` client loops for `duration` seconds; returns (latencies ms, errors)"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    state = {'songs': songs, 'cursors': {}}
+    for name in ('users', 'posts'):
+        # A cursor a few pages into the list, for deeper page requests
+        response = requests.get(f'{base_url}/api/{name}?limit=200', timeout=30)
+        state['cursors'][name] = response.json().get('next_cursor')
+    deadline = time.perf_counter() + duration
+
+    def loop(number):
+        session = requests.Session()
+        rng = random.Random(seed * 1000 + number)
+        while True:
+            method, path, body = next_request(scenario, rng, state)
+            started = time.perf_counter()
+            if started >= deadline:
+                return
+            try:
+                response = session.request(method, base_url + path, json=body, timeout=30)
+                failed = response.status_code >= 400 and response.status_code != 304
+                error = f'{response.status_code} {method} {path}' if failed else None
+            except requests.RequestException as e:
+                error = f'{type(e).__name__} {method} {path}'
+            milliseconds = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(milliseconds)
+                if error:
+                    errors.append(error)
+
+    workers = [threading.Thread(target=loop, args=(number,)) for number in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, errors
+
+
+def run_scenario(base_url, scenario, concurrency, duration, processes, songs):
+    processes = max(1, min(processes, concurrency))
+    shares = [concurrency // processes + (1 if i < concurrency % processes else 0) for i in range(processes)]
+    started = time.perf_counter()
+    with Pool(processes) as pool:
+        parts = pool.starmap(client_process, [
+            (base_url, scenario, threads, duration, seed, songs) for seed, threads in enumerate(shares)
+        ])
+    elapsed = time.perf_counter() - started
+    latencies = [value for part, _ in parts for value in part]
+    errors = [error for _, part in parts for error in part]
+    result = {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput_rps': round(len(latencies) / min(elapsed, duration), 1),
+    }
+    if latencies:
+        result.update({
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'max_ms': round(max(latencies), 2),
+        })
+    if errors:
+        result['sample_errors'] = sorted(set(errors))[:5]
+    return result
+
+
+def serve(port):
+    """Serve the backend with werkzeug's threaded server (runs in its own process)"""
+    import logging
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', port, backend.app, threaded=True)
+    print('ready', flush=True)
+    server.serve_forever()
+
+
+def wait_until_ready(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(base_url + '/api/health', timeout=2).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f'Backend at {base_url} did not become ready')
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, previous=None):
+    baseline = {}
+    if previous:
+        baseline = {(r['scenario'], r['concurrency']): r for r in previous['results']}
+    header = f'{"scenario":<14}{"conc":>5}{"requests":>10}{"errors":>8}{"req/s":>10}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}'
+    print(header + ('   vs baseline (req/s, p99)' if previous else ''))
+    for r in results:
+        line = (f'{r["scenario"]:<14}{r["concurrency"]:>5}{r["requests"]:>10}{r["errors"]:>8}'
+                f'{r["throughput_rps"]:>10.1f}{r.get("p50_ms", 0):>9.1f}{r.get("p95_ms", 0):>9.1f}{r.get("p99_ms", 0):>9.1f}')
+        old = baseline.get((r['scenario'], r['concurrency']))
+        if old and old['throughput_rps'] and old.get('p99_ms'):
+            line += (f'   {(r["throughput_rps"] / old["throughput_rps"] - 1) * 100:+6.1f}%'
+                     f' {(r.get("p99_ms", 0) / old["p99_ms"] - 1) * 100:+7.1f}%')
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', help='seeded SQLite file (see seed_data.py)')
+    parser.add_argument('--url', help='test an already running backend instead of starting one')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds per scenario and concurrency')
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated client counts')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--client-processes', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--output', help='JSON results file (default: benchmarks/results/<time>-<commit>.json)')
+    parser.add_argument('--compare', help='earlier JSON results file to compare against')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        serve(args.serve)
+        return
+
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    stub = StubUpstream(delay=0.02, track_seconds=60).start()
+    tmp = tempfile.TemporaryDirectory()
+    server = None
+    try:
+        database = args.database
+        if database is None and args.url is None:
+            database = os.path.join(tmp.name, 'load.db')
+            print('Seeding a small data set (use seed_data.py and --database for realistic volumes)...')
+            subprocess.run(
+                [sys.executable, os.path.join(BENCH_DIR, 'seed_data.py'), '--database', database,
+                 '--songs', '2000', '--ratings', '200000', '--listeners', '20000',
+                 '--users', '2000', '--posts', '20000'],
+                check=True, stdout=subprocess.DEVNULL
+            )
+
+        base_url = args.url
+        if base_url is None:
+            port = 5000 + random.randrange(1000, 4000)
+            base_url = f'http://127.0.0.1:{port}'
+            env = dict(
+                os.environ,
+                DATABASE_URL=f'sqlite:///{os.path.abspath(database)}',
+                NOWPLAYING_METADATA_URL=f'{stub.url}/metadata.json',
+                NOWPLAYING_ALBUM_ART_URL=f'{stub.url}/cover.jpg',
+                ART_CACHE_DIR=os.path.join(tmp.name, 'art')
+            )
+            server = subprocess.Popen([sys.executable, __file__, '--serve', str(port)], env=env)
+        wait_until_ready(base_url)
+        requests.get(base_url + '/api/nowplaying', timeout=30)
+
+        songs = len(requests.get(base_url + '/api/export/songs', timeout=300).text.splitlines())
+
+        results = []
+        for scenario in scenarios:
+            for concurrency in levels:
+                result = run_scenario(base_url, scenario, concurrency, args.duration, args.client_processes, songs)
+                results.append(result)
+                print(f'  {scenario} x{concurrency}: {result["throughput_rps"]} req/s, '
+                      f'p99 {result.get("p99_ms")} ms, {result["errors"]} errors')
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        stub.stop()
+        tmp.cleanup()
+
+    report = {
+        'commit': git_commit(),
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {
+            'database': args.database,
+            'url': args.url,
+            'songs': songs,
+            'duration_s': args.duration,
+            'concurrency': levels,
+            'client_processes': args.client_processes
+        },
+        'results': results
+    }
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(BENCH_DIR, 'results', f'{stamp}-{report["commit"] or "unknown"}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)
+    print()
+    print_results(results, previous)
+    print(f'\nSaved {output}')
+
+
+if __name__ == '__main__':
+    main()
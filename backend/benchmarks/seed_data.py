@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Seed a database with realistic volumes for load testing
+
+Fills an empty database with users, posts, songs, ratings and play
+history. Rating counts per song follow a Zipf-like curve (a few hits
+collect most votes, the long tail very few), each song has its own
+thumbs-up ratio, and timestamps are spread over the past year. The song
+counters are written consistent with the ratings, so
+`flask rebuild-rating-counts --verify` passes. The same --seed always
+produces the same data.
+
+Usage:
+    python benchmarks/seed_data.py --database /tmp/load.db
+        [--songs 100000] [--ratings 10000000] [--listeners 500000]
+        [--users 10000] [--posts 100000] [--plays 1000] [--seed 1]
+
+Without --database the backend's DATABASE_URL is used.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BATCH_SIZE = 50000
+
+
+def rating_counts(rng, songs, ratings, listeners):
+    """Number of ratings per song: Zipf-like, capped at the number of listeners"""
+    weights = [1 / (rank ** 0.8) for rank in range(1, songs + 1)]
+    scale = ratings / sum(weights)
+    counts = [min(listeners, int(weight * scale)) for weight in weights]
+    # Hand out what rounding and the cap left over, one per song
+    shortfall = ratings - sum(counts)
+    for song in range(songs):
+        if shortfall <= 0:
+            break
+        if counts[song] < listeners:
+            counts[song] += 1
+            shortfall -= 1
+    rng.shuffle(counts)
+    return counts
+
+
+def seed(backend, args, log=print):
+    """Insert the data set; returns a dict of row counts"""
+    db = backend.db
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    year = 365 * 24 * 3600
+
+    def timestamp():
+        return now - timedelta(seconds=rng.randrange(year))
+
+    def insert(connection, table, rows):
+        batch = []
+        inserted = 0
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                connection.execute(db.insert(table), batch)
+                inserted += len(batch)
+                batch = []
+        if batch:
+            connection.execute(db.insert(table), batch)
+            inserted += len(batch)
+        return inserted
+
+    with backend.app.app_context():
+        db.create_all()
+        if db.session.execute(db.select(db.func.count(backend.Song.id))).scalar():
+            raise SystemExit('The database already has songs; seed an empty database.')
+        db.session.close()
+
+        counts = rating_counts(rng, args.songs, args.ratings, args.listeners)
+        totals = {}
+        started = time.perf_counter()
+        with db.engine.begin() as connection:
+            totals['users'] = insert(connection, backend.User.__table__, (
+                {'username': f'user{i}', 'email': f'user{i}@example.com', 'created_at': timestamp()}
+                for i in range(args.users)
+            ))
+            totals['posts'] = insert(connection, backend.Post.__table__, (
+                {'title': f'Post {i}', 'content': 'Lorem ipsum dolor sit amet. ' * rng.randint(2, 40),
+                 'user_id': rng.randrange(args.users) + 1, 'created_at': timestamp()}
+                for i in range(args.posts)
+            ))
+            log(f'users and posts: {time.perf_counter() - started:.1f}s')
+
+            up_ratios = [rng.betavariate(7, 3) for _ in range(args.songs)]
+            thumbs = [[0, 0] for _ in range(args.songs)]
+
+            def ratings():
+                for song in range(args.songs):
+                    for listener in rng.sample(range(args.listeners), counts[song]):
+                        up = rng.random() < up_ratios[song]
+                        thumbs[song][0 if up else 1] += 1
+                        yield {
+                            'song_id': song + 1,
+                            'user_identifier': f'listener_{listener}',
+                            'rating_type': 'up' if up else 'down',
+                            'created_at': timestamp()
+                        }
+
+            # Songs first, so ratings reference existing ids; counters after
+            totals['songs'] = insert(connection, backend.Song.__table__, (
+                {'id': i + 1, 'title': f'Song {i}', 'artist': f'Artist {i % (args.songs // 10 or 1)}',
+                 'album': f'Album {i // 12}'}
+                for i in range(args.songs)
+            ))
+            totals['ratings'] = insert(connection, backend.Rating.__table__, ratings())
+            log(f'songs and ratings: {time.perf_counter() - started:.1f}s')
+
+            connection.execute(
+                db.update(backend.Song.__table__)
+                .where(backend.Song.__table__.c.id == db.bindparam('song_id'))
+                .values(thumbs_up=db.bindparam('up'), thumbs_down=db.bindparam('down')),
+                [{'song_id': song + 1, 'up': up, 'down': down} for song, (up, down) in enumerate(thumbs) if up or down]
+            )
+
+            # Recent plays, about four minutes apart, oldest first
+            totals['play_history'] = insert(connection, backend.PlayHistory.__table__, (
+                {'song_id': rng.randrange(args.songs) + 1,
+                 'played_at': now - timedelta(seconds=240 * (args.plays - i))}
+                for i in range(args.plays)
+            ))
+        log(f'done: {time.perf_counter() - started:.1f}s')
+
+        if db.engine.dialect.name == 'sqlite':
+            with db.engine.begin() as connection:
+                connection.execute(db.text('ANALYZE'))
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', help='SQLite file to create (default: DATABASE_URL)')
+    parser.add_argument('--songs', type=int, default=100000)
+    parser.add_argument('--ratings', type=int, default=10000000)
+    parser.add_argument('--listeners', type=int, default=500000, help='distinct anonymous voters')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--plays', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.database)}'
+    os.environ.setdefault('RATING_WRITE_BEHIND', 'false')
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+
+    totals = seed(backend, args)
+    print(', '.join(f'{count} {table}' for table, count in totals.items()))
+
+
+if __name__ == '__main__':
+    main()
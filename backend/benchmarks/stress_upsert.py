@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Stress the song find-or-create path from several processes at once
+
+Every worker process resolves the same shuffled list of (title, artist)
+pairs against one shared SQLite file, half of them one at a time through
+POST /api/songs/find-or-create and half through upsert_songs in batches,
+all starting at the same moment. Checks that no request failed, that every
+worker got the same id for each pair, that exactly one worker reported
+creating each song and that the song table holds one row per pair.
+
+Usage:
+    python benchmarks/stress_upsert.py [--workers 8] [--songs 500] [--batch 50]
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_backend():
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+    return backend
+
+
+def pairs(count):
+    return [(f'Song {i}', f'Artist {i % 37}') for i in range(count)]
+
+
+def worker(args):
+    """Resolve every pair once and print a JSON report on stdout"""
+    backend = import_backend()
+    rng = random.Random(args.worker)
+    todo = pairs(args.songs)
+    rng.shuffle(todo)
+    single, batched = todo[:len(todo) // 2], todo[len(todo) // 2:]
+    client = backend.app.test_client()
+    ids, created, errors = {}, 0, []
+
+    # Start together so the workers really race for the same rows
+    while time.time() < args.start_at:
+        time.sleep(0.001)
+    started = time.perf_counter()
+
+    for title, artist in single:
+        response = client.post('/api/songs/find-or-create', json={'title': title, 'artist': artist})
+        if response.status_code not in (200, 201):
+            errors.append(f'{response.status_code} {response.get_data(as_text=True)[:200]}')
+            continue
+        ids[f'{title}|{artist}'] = response.json['song']['id']
+        created += response.json['created']
+
+    with backend.app.app_context():
+        for i in range(0, len(batched), args.batch):
+            chunk = [{'title': title, 'artist': artist} for title, artist in batched[i:i + args.batch]]
+            try:
+                result = backend.upsert_songs(chunk)
+            except Exception as e:
+                backend.db.session.rollback()
+                errors.append(repr(e)[:200])
+                continue
+            for (title, artist), (song_data, was_created) in result.items():
+                ids[f'{title}|{artist}'] = song_data['id']
+                created += was_created
+
+    print(json.dumps({
+        'ids': ids,
+        'created': created,
+        'errors': errors,
+        'seconds': time.perf_counter() - started
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--songs', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=50)
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--start-at', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        worker(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f'sqlite:///{os.path.join(tmp, "stress.db")}',
+            SQLITE_PROFILE='production',
+            RATING_WRITE_BEHIND='false',
+            NOWPLAYING_METADATA_URL='http://127.0.0.1:9/metadata.json'
+        )
+        subprocess.run(
+            [sys.executable, '-c', 'import app; app.app.app_context().push(); app.db.create_all()'],
+            cwd=BACKEND_DIR, env=env, check=True
+        )
+
+        start_at = time.time() + 2
+        processes = [
+            subprocess.Popen(
+                [sys.executable, __file__, '--worker', str(i), '--start-at', str(start_at),
+                 '--songs', str(args.songs), '--batch', str(args.batch)],
+                env=env, stdout=subprocess.PIPE, text=True
+            )
+            for i in range(args.workers)
+        ]
+        reports = []
+        for process in processes:
+            output, _ = process.communicate()
+            if process.returncode != 0:
+                sys.exit(f'worker exited with status {process.returncode}')
+            reports.append(json.loads(output))
+
+        row_count = subprocess.run(
+            [sys.executable, '-c',
+             'import app; app.app.app_context().push(); '
+             'print(app.db.session.execute(app.db.select(app.db.func.count(app.Song.id))).scalar())'],
+            cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True
+        ).stdout.strip()
+
+    errors = [error for report in reports for error in report['errors']]
+    disagreements = sum(
+        1 for key in reports[0]['ids']
+        if len({report['ids'].get(key) for report in reports}) != 1
+    )
+    created = sum(report['created'] for report in reports)
+    slowest = max(report['seconds'] for report in reports)
+
+    print(f'{args.workers} workers x {args.songs} songs in {slowest:.2f}s')
+    print(f'errors:              {len(errors)}')
+    for error in errors[:5]:
+        print(f'  {error}')
+    print(f'songs created:       {created} (expected {args.songs})')
+    print(f'id disagreements:    {disagreements}')
+    print(f'rows in song table:  {row_count} (expected {args.songs})')
+
+    ok = not errors and not disagreements and created == args.songs and int(row_count) == args.songs
+    print('OK' if ok else 'FAILED')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the station's upstream server, with injected latency
+
+Serves /metadata.json (the now playing feed, advancing to a new track every
+--track-seconds), /cover.jpg and a live HLS stream (/hls/live.m3u8, a
+sliding window of six segments, a new one every --segment-seconds), each
+after sleeping --delay seconds (plus up to --jitter seconds).
+/metadata.json supports ETag revalidation like the real CloudFront
+endpoint, and /metadata.json?station=<name> plays a separate track list
+per station name. Every request is counted per path (all segments under
+/hls/*.ts), and GET /_stats returns the counts without delay.
+
+Usage:
+    python benchmarks/stub_upstream.py [--port 8765] [--delay 8] [--jitter 0]
+                                       [--track-seconds 30] [--segment-seconds 2]
+
+Point the backend at it with
+    NOWPLAYING_METADATA_URL=http://127.0.0.1:8765/metadata.json
+    HLS_ORIGIN_URL=http://127.0.0.1:8765/hls/
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Smallest valid JPEG-ish payload; clients only pass it through
+COVER = b'\xff\xd8\xff\xe0' + b'\x00' * 64 + b'\xff\xd9'
+# Segments in the live playlist at any time
+HLS_WINDOW = 6
+
+
+class StubUpstream:
+    """Threaded HTTP server answering like the station's metadata host.
+
+    delay and jitter may be changed while the server is running.
+    """
+
+    def __init__(self, port=0, delay=0.0, jitter=0.0, track_seconds=30.0,
+                 segment_seconds=2.0, segment_bytes=48000):
+        self.delay = delay
+        self.jitter = jitter
+        self.track_seconds = track_seconds
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.hits = {}
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='stub-upstream', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def metadata(self, station=None):
+        track = int((time.time() - self._started_at) // self.track_seconds)
+        return {
+            'title': f'Stub Track {track}' + (f' ({station})' if station else ''),
+            'artist': f'Stub Artist {track % 7}',
+            'album': 'Stub Sessions',
+            'date': '2024',
+            'bit_depth': 16,
+            'sample_rate': 44100
+        }
+
+    def playlist(self):
+        """The live playlist: the newest HLS_WINDOW published segments"""
+        latest = int((time.time() - self._started_at) // self.segment_seconds)
+        first = max(0, latest - HLS_WINDOW + 1)
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            f'#EXT-X-TARGETDURATION:{math.ceil(self.segment_seconds)}',
+            f'#EXT-X-MEDIA-SEQUENCE:{first}',
+        ]
+        for sequence in range(first, latest + 1):
+            lines += [f'#EXTINF:{self.segment_seconds:.3f},', f'segment{sequence}.ts']
+        return '\n'.join(lines) + '\n'
+
+    def segment(self, sequence):
+        """Deterministic bytes for a segment (MPEG-TS sync byte, then filler)"""
+        filler = hashlib.sha256(str(sequence).encode()).digest()
+        return (b'G' + filler * (self.segment_bytes // len(filler) + 1))[:self.segment_bytes]
+
+    def _count(self, path):
+        with self._lock:
+            self.hits[path] = self.hits.get(path, 0) + 1
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                path, query = urlsplit(self.path)[2:4]
+                if path == '/_stats':
+                    with stub._lock:
+                        return self._send(200, json.dumps(stub.hits).encode(), 'application/json')
+
+                stub._count('/hls/*.ts' if path.startswith('/hls/segment') else path)
+                time.sleep(stub.delay + random.uniform(0, stub.jitter))
+
+                if path == '/metadata.json':
+                    body = json.dumps(stub.metadata(parse_qs(query).get('station', [None])[0])).encode()
+                    etag = '"%s"' % hashlib.md5(body).hexdigest()
+                    if self.headers.get('If-None-Match') == etag:
+                        return self._send(304, b'', None, {'ETag': etag})
+                    return self._send(200, body, 'application/json', {'ETag': etag})
+                if path == '/cover.jpg':
+                    return self._send(200, COVER, 'image/jpeg')
+                if path == '/hls/live.m3u8':
+                    return self._send(200, stub.playlist().encode(), 'application/vnd.apple.mpegurl')
+                if path.startswith('/hls/segment') and path.endswith('.ts'):
+                    sequence = path[len('/hls/segment'):-len('.ts')]
+                    if sequence.isdigit():
+                        return self._send(200, stub.segment(int(sequence)), 'video/mp2t')
+                return self._send(404, b'not found', 'text/plain')
+
+            def _send(self, status, body, content_type, headers=None):
+                self.send_response(status)
+                if content_type:
+                    self.send_header('Content-Type', content_type)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=8.0, help='seconds to wait before answering')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random delay, up to this many seconds')
+    parser.add_argument('--track-seconds', type=float, default=30.0, help='how long each stub track plays')
+    parser.add_argument('--segment-seconds', type=float, default=2.0, help='duration of each HLS segment')
+    args = parser.parse_args()
+
+    stub = StubUpstream(args.port, args.delay, args.jitter, args.track_seconds, args.segment_seconds).start()
+    print(f'Stub upstream on {stub.url} (delay {args.delay}s), Ctrl+C to stop')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
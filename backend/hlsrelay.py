@@ -0,0 +1,380 @@
+"""
+Caching relay for the station's HLS stream
+
+Every listener's player reloads the live playlist about once per segment
+and then fetches each new segment, so without a relay the origin sees
+every listener's requests. HlsRelay serves playlists from a cache that is
+refreshed at most once per TTL (the playlist's target duration by
+default) and segments from a size-bounded LRU in memory that spills to
+disk. Concurrent misses for the same URL wait for a single upstream fetch
+instead of each making their own. Optionally only so many requests may
+wait on the origin at once: the rest are turned away (RelayBusy) rather
+than holding a worker thread while the origin is slow.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# Media types served for each extension the relay accepts
+MEDIA_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.aac': 'audio/aac',
+    '.m4a': 'audio/mp4',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+    '.mp3': 'audio/mpeg',
+    '.vtt': 'text/vtt',
+}
+
+_TARGET_DURATION = re.compile(r'^#EXT-X-TARGETDURATION:\s*(\d+(?:\.\d+)?)', re.MULTILINE)
+_URI_ATTRIBUTE = re.compile(r'URI="([^"]*)"')
+
+
+class OriginError(Exception):
+    """The origin answered with an error status or an unusable body"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class RelayBusy(Exception):
+    """Too many requests are already waiting on the origin"""
+
+
+def media_type(name):
+    """Return the media type for a relayed file name, or None if it is not relayed"""
+    return MEDIA_TYPES.get(os.path.splitext(name)[1].lower())
+
+
+def rewrite_playlist(text, origin_url):
+    """Make URIs of relayed files in the origin directory relative, so players request them from the relay.
+
+    Relative URIs already resolve against the relay's URL; other absolute
+    URIs (including keys, which are not relayed) are left as they are.
+    """
+    def relative(uri):
+        if uri.startswith(origin_url) and media_type(uri.split('?', 1)[0]) is not None:
+            return uri[len(origin_url):]
+        return uri
+
+    lines = []
+    for line in text.splitlines():
+        if line.startswith('#'):
+            line = _URI_ATTRIBUTE.sub(lambda match: f'URI="{relative(match.group(1))}"', line)
+        elif line.strip():
+            line = relative(line.strip())
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers share its outcome"""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """Return (result, shared); shared is True if another thread made the call"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class SegmentCache:
+    """Bytes by key in an in-memory LRU, spilling evicted entries to disk.
+
+    Entries pushed out of memory are written to directory (if given), which
+    is itself trimmed least recently used first to max_disk_bytes. A disk
+    hit moves the entry back into memory. The disk index is per process;
+    files left behind by earlier runs are deleted on start once they are
+    more than an hour old, long after they left the live playlist.
+    """
+
+    STALE_FILE_SECONDS = 3600
+
+    def __init__(self, max_memory_bytes, directory=None, max_disk_bytes=0):
+        self.max_memory_bytes = max_memory_bytes
+        self.directory = directory if max_disk_bytes > 0 else None
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # key -> size of the spilled file
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._remove_stale_files()
+
+    def get(self, key):
+        """Return the cached bytes, or None on a miss"""
+        with self._lock:
+            content = self._memory.get(key)
+            if content is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return content
+            on_disk = key in self._disk
+
+        if on_disk:
+            try:
+                with open(self._path(key), 'rb') as file:
+                    content = file.read()
+            except FileNotFoundError:
+                content = None
+            if content is not None:
+                self.disk_hits += 1
+                self.put(key, content)
+                return content
+            with self._lock:
+                self._forget_file(key)
+        self.misses += 1
+        return None
+
+    def put(self, key, content):
+        if len(content) > self.max_memory_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = content
+            self._memory_bytes += len(content)
+            self._forget_file(key)
+            spilled = []
+            while self._memory_bytes > self.max_memory_bytes:
+                evicted_key, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+                spilled.append((evicted_key, evicted))
+
+        # Written outside the lock; a get in between is a miss and refetches
+        for evicted_key, evicted in spilled:
+            self._spill(evicted_key, evicted)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'max_memory_bytes': self.max_memory_bytes,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+                'max_disk_bytes': self.max_disk_bytes if self.directory else 0,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': round((self.hits + self.disk_hits) / lookups, 4) if lookups else None
+            }
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def _spill(self, key, content):
+        if self.directory is None or len(content) > self.max_disk_bytes:
+            return
+        fd, temporary = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(content)
+            os.replace(temporary, self._path(key))
+        except OSError:
+            try:
+                os.unlink(temporary)
+            except FileNotFoundError:
+                pass
+            return
+
+        with self._lock:
+            self._forget_file(key, unlink=False)
+            self._disk[key] = len(content)
+            self._disk_bytes += len(content)
+            while self._disk_bytes > self.max_disk_bytes:
+                self._forget_file(next(iter(self._disk)))
+
+    def _forget_file(self, key, unlink=True):
+        # Called with the lock held
+        size = self._disk.pop(key, None)
+        if size is None:
+            return
+        self._disk_bytes -= size
+        if unlink:
+            try:
+                os.unlink(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _remove_stale_files(self):
+        cutoff = time.time() - self.STALE_FILE_SECONDS
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+class HlsRelay:
+    """Serve an HLS origin directory's playlists and segments from caches.
+
+    origin_url is the directory the playlists live in (ending in /);
+    relayed names are paths below it, e.g. 'live.m3u8'. Playlists are
+    reused for manifest_ttl seconds, or for their #EXT-X-TARGETDURATION
+    when manifest_ttl is None (default_ttl for playlists without one, such
+    as multivariant playlists). Segments never change once published, so
+    they are cached until evicted. If max_waiting is set, at most that
+    many requests wait on origin fetches at a time (counting those sharing
+    another's fetch) and further cache misses raise RelayBusy.
+    """
+
+    def __init__(self, client, origin_url, segments, manifest_ttl=None, default_ttl=2.0,
+                 max_segment_bytes=10 * 1024 * 1024, max_waiting=None, observe_cache=None):
+        self.client = client
+        self.origin_url = origin_url if origin_url.endswith('/') else origin_url + '/'
+        self.segments = segments
+        self.manifest_ttl = manifest_ttl
+        self.default_ttl = default_ttl
+        self.max_segment_bytes = max_segment_bytes
+        self.max_waiting = max_waiting
+        self.observe_cache = observe_cache
+        self.manifest_hits = 0
+        self.manifest_misses = 0
+        self.rejected = 0
+        self.origin_fetches = {'playlist': 0, 'segment': 0}
+        # name -> (expires_at, body, ttl)
+        self._manifests = {}
+        self._manifests_lock = threading.Lock()
+        self._flights = SingleFlight()
+        self._waiting = threading.BoundedSemaphore(max_waiting) if max_waiting else None
+
+    def manifest(self, name):
+        """Return (body, seconds until it expires) for a playlist"""
+        entry = self._manifests.get(name)
+        if entry is not None and entry[0] > time.monotonic():
+            return self._manifest_hit(entry)
+
+        def refresh():
+            # A caller that waited for the previous refresh may find it done
+            entry = self._manifests.get(name)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry, True
+            body = self._fetch(name, 'playlist').decode('utf-8')
+            if not body.startswith('#EXTM3U'):
+                raise OriginError(f'{name} is not an HLS playlist')
+            body = rewrite_playlist(body, self.origin_url).encode('utf-8')
+            ttl = self._ttl(body)
+            entry = (time.monotonic() + ttl, body, ttl)
+            with self._manifests_lock:
+                self._manifests[name] = entry
+            return entry, False
+
+        (entry, cached), shared = self._wait_for(('playlist', name), refresh)
+        if cached or shared:
+            return self._manifest_hit(entry)
+        self.manifest_misses += 1
+        if self.observe_cache is not None:
+            self.observe_cache('hls_playlist', False)
+        return entry[1], entry[2]
+
+    def segment(self, name):
+        """Return a segment's bytes"""
+        content = self.segments.get(name)
+        hit = content is not None
+        if not hit:
+            def fetch():
+                content = self._fetch(name, 'segment', self.max_segment_bytes)
+                self.segments.put(name, content)
+                return content
+            content, hit = self._wait_for(('segment', name), fetch)
+        if self.observe_cache is not None:
+            self.observe_cache('hls_segment', hit)
+        return content
+
+    def stats(self):
+        lookups = self.manifest_hits + self.manifest_misses
+        return {
+            'origin': self.origin_url,
+            'playlists': {
+                'cached': len(self._manifests),
+                'hits': self.manifest_hits,
+                'misses': self.manifest_misses,
+                'hit_ratio': round(self.manifest_hits / lookups, 4) if lookups else None
+            },
+            'segments': self.segments.stats(),
+            'origin_fetches': dict(self.origin_fetches),
+            'rejected': self.rejected
+        }
+
+    def _wait_for(self, key, function):
+        if self._waiting is None:
+            return self._flights.do(key, function)
+        if not self._waiting.acquire(blocking=False):
+            self.rejected += 1
+            raise RelayBusy(f'{self.max_waiting} requests are already waiting on the origin')
+        try:
+            return self._flights.do(key, function)
+        finally:
+            self._waiting.release()
+
+    def _manifest_hit(self, entry):
+        self.manifest_hits += 1
+        if self.observe_cache is not None:
+            self.observe_cache('hls_playlist', True)
+        return entry[1], max(0.0, entry[0] - time.monotonic())
+
+    def _ttl(self, body):
+        if self.manifest_ttl is not None:
+            return self.manifest_ttl
+        match = _TARGET_DURATION.search(body.decode('utf-8'))
+        return float(match.group(1)) if match else self.default_ttl
+
+    def _fetch(self, name, kind, max_bytes=None):
+        self.origin_fetches[kind] += 1
+        response = self.client.get(self.origin_url + name, stream=max_bytes is not None)
+        try:
+            if response.status_code != 200:
+                raise OriginError(f'origin returned {response.status_code} for {name}', response.status_code)
+            if max_bytes is None:
+                return response.content
+            content = response.raw.read(max_bytes + 1, decode_content=True)
+            if len(content) > max_bytes:
+                raise OriginError(f'{name} is larger than {max_bytes} bytes')
+            return content
+        finally:
+            response.close()
@@ -0,0 +1,164 @@
+"""
+Prometheus metrics for the backend, served at /metrics
+
+All metrics are prometheus_client objects, which aggregate in process with
+a lock per metric. Under gunicorn (or any other multi-process server) set
+PROMETHEUS_MULTIPROC_DIR to an empty directory shared by the workers before
+starting them: every worker then writes its samples to files there, and a
+scrape of any worker returns the sum over all of them (see README).
+"""
+
+import functools
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Request latency buckets, in seconds (most API calls are a few ms)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+UPSTREAM_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+http_request_duration = Histogram(
+    'http_request_duration_seconds',
+    'Time to produce a response (to the first byte for streams), by route',
+    ['method', 'route'],
+    buckets=LATENCY_BUCKETS
+)
+http_requests = Counter(
+    'http_requests_total',
+    'Responses sent, by route and status code',
+    ['method', 'route', 'status']
+)
+
+upstream_request_duration = Histogram(
+    'upstream_request_duration_seconds',
+    'Upstream fetch time including retries, by URL',
+    ['url'],
+    buckets=UPSTREAM_BUCKETS
+)
+upstream_request_errors = Counter(
+    'upstream_request_errors_total',
+    'Upstream fetches that raised or returned a 5xx status, by URL',
+    ['url', 'reason']
+)
+
+db_queries_per_request = Histogram(
+    'db_queries_per_request',
+    'SQL statements executed while handling one request, by route',
+    ['route'],
+    buckets=QUERY_COUNT_BUCKETS
+)
+db_time_per_request = Histogram(
+    'db_time_per_request_seconds',
+    'Time spent executing SQL while handling one request, by route',
+    ['route'],
+    buckets=LATENCY_BUCKETS
+)
+db_query_duration = Histogram(
+    'db_query_duration_seconds',
+    'Execution time of every SQL statement, including background threads',
+    buckets=LATENCY_BUCKETS
+)
+
+cache_lookups = Counter(
+    'cache_lookups_total',
+    'Cache lookups by cache and result (hit or miss)',
+    ['cache', 'result']
+)
+
+nowplaying_stream_clients = Gauge(
+    'nowplaying_stream_clients',
+    'Open /api/nowplaying/stream connections',
+    multiprocess_mode='livesum'
+)
+nowplaying_events_sent = Counter(
+    'nowplaying_stream_events_total',
+    'Now playing events written to stream clients (one per client per event)'
+)
+nowplaying_events_published = Counter(
+    'nowplaying_events_published_total',
+    'Now playing events published by the poller'
+)
+nowplaying_poll_delay = Histogram(
+    'nowplaying_poll_delay_seconds',
+    'How long after it was due each station metadata poll was handed to a worker',
+    buckets=LATENCY_BUCKETS
+)
+nowplaying_polls_skipped = Counter(
+    'nowplaying_polls_skipped_total',
+    'Station polls skipped because the previous poll of the station was still running'
+)
+
+rating_votes_flushed = Counter(
+    'rating_votes_flushed_total',
+    'Votes written by the write-behind flusher'
+)
+
+
+# Anything else is reported as 'other', so clients cannot create new series
+HTTP_METHODS = frozenset(['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'])
+
+
+@functools.lru_cache(maxsize=None)
+def _route_children(method, route):
+    # labels() takes a lock and builds a key on every call; the set of
+    # routes is fixed, so each route's children are looked up once
+    return (
+        http_request_duration.labels(method, route),
+        db_queries_per_request.labels(route),
+        db_time_per_request.labels(route)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _status_child(method, route, status):
+    return http_requests.labels(method, route, status)
+
+
+def observe_request(method, route, status, seconds, queries, db_seconds):
+    """Record one handled request (route is the URL rule, not the path)"""
+    if method not in HTTP_METHODS:
+        method = 'other'
+    duration, query_count, query_time = _route_children(method, route)
+    duration.observe(seconds)
+    query_count.observe(queries)
+    query_time.observe(db_seconds)
+    _status_child(method, route, status).inc()
+
+
+def observe_upstream(url, seconds, error=None):
+    """Record one upstream fetch (error is a short reason, e.g. an exception name)"""
+    upstream_request_duration.labels(url).observe(seconds)
+    if error is not None:
+        upstream_request_errors.labels(url, error).inc()
+
+
+def observe_hls_upstream(url, seconds, error=None):
+    """Like observe_upstream, with all playlist and all segment URLs under one label each
+
+    Segment names change every few seconds, so per-URL labels would grow
+    without bound.
+    """
+    kind = 'playlist' if url.split('?', 1)[0].endswith('.m3u8') else 'segment'
+    observe_upstream(f'hls {kind}', seconds, error)
+
+
+def observe_cache(cache, hit):
+    cache_lookups.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def render():
+    """Return (body, content type) for a scrape, merging all workers when multi-process"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
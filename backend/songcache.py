@@ -0,0 +1,82 @@
+"""
+In-process cache of song ids by (title, artist)
+
+The same few tracks are looked up over and over (the live track on every
+poll, the songs listeners rate), so their ids are kept in a small LRU map
+instead of querying the song table's (title, artist) index each time.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class SongIdCache:
+    """Bounded LRU map from (title, artist) to song id, with hit/miss counters.
+
+    Keys are the exact strings the song table's unique constraint compares,
+    so a cached answer never differs from what the database would return.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._ids = OrderedDict()
+        # song id -> key, so a deleted song can be dropped by id
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, title, artist):
+        """Return the cached song id, or None on a miss.
+
+        Lookups skip the lock: OrderedDict.get and move_to_end are each
+        atomic under the GIL, and the counters are only statistics (they
+        may lose an increment under contention).
+        """
+        key = (title, artist)
+        song_id = self._ids.get(key)
+        if song_id is None:
+            self.misses += 1
+            return None
+        try:
+            self._ids.move_to_end(key)
+        except KeyError:
+            # Evicted or invalidated since the get above
+            pass
+        self.hits += 1
+        return song_id
+
+    def put(self, title, artist, song_id):
+        key = (title, artist)
+        with self._lock:
+            previous = self._ids.pop(key, None)
+            if previous is not None:
+                self._keys.pop(previous, None)
+            self._ids[key] = song_id
+            self._keys[song_id] = key
+            while len(self._ids) > self.maxsize:
+                _, evicted = self._ids.popitem(last=False)
+                self._keys.pop(evicted, None)
+
+    def invalidate(self, song_id):
+        """Forget the entry for a song id (e.g. after the song was deleted)"""
+        with self._lock:
+            key = self._keys.pop(song_id, None)
+            if key is not None:
+                self._ids.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+            self._keys.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._ids),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None
+            }
@@ -0,0 +1,102 @@
+"""
+Per-request SQL profiling helpers
+
+QueryLog collects the statements one request executes (the backend feeds
+it from SQLAlchemy's cursor events when SQL_PROFILE is on) and can point
+out statements that ran many times with the same shape, the usual sign of
+an N+1 query pattern. assert_max_queries gives tests and benchmarks a
+query budget for a block of code.
+"""
+
+import re
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s|%s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|%s|:\w+))*\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+_SPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """Normalize SQL so statements that differ only in parameters compare equal.
+
+    Collapses whitespace, literal numbers and placeholder lists of any
+    length, e.g. `IN (?, ?, ?)` and `IN (?)` both become `IN (...)`.
+    """
+    shape = _SPACE.sub(' ', statement).strip()
+    shape = _PLACEHOLDER_LIST.sub('(...)', shape)
+    return _NUMBER.sub('N', shape)
+
+
+class QueryLog:
+    """Statements executed in one unit of work, with their durations"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        # shape -> [count, seconds, slowest single execution]
+        self.shapes = {}
+        # Raw statements repeat verbatim in N+1 loops, so each distinct
+        # text is only normalized once
+        self._shape_of = {}
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        shape = self._shape_of.get(statement)
+        if shape is None:
+            shape = self._shape_of[statement] = statement_shape(statement)
+        entry = self.shapes.setdefault(shape, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+
+    def repeated(self, threshold):
+        """Return [(shape, count, seconds)] of shapes executed at least threshold times"""
+        return sorted(
+            ((shape, count, seconds) for shape, (count, seconds, _) in self.shapes.items() if count >= threshold),
+            key=lambda item: -item[1]
+        )
+
+    def slowest(self, n):
+        """Return the n shapes with the most total time as [(shape, count, seconds, max_seconds)]"""
+        return sorted(
+            ((shape, count, seconds, slowest) for shape, (count, seconds, slowest) in self.shapes.items()),
+            key=lambda item: -item[2]
+        )[:n]
+
+    def report(self, n=5):
+        lines = [f'{self.count} queries, {self.seconds * 1000:.1f} ms']
+        for shape, count, seconds, slowest in self.slowest(n):
+            lines.append(f'  {seconds * 1000:8.1f} ms  {count:4d}x  max {slowest * 1000:.1f} ms  {shape[:300]}')
+        return '\n'.join(lines)
+
+
+@contextmanager
+def assert_max_queries(engine, limit):
+    """Fail if the block executes more than `limit` SQL statements on engine.
+
+    Yields the QueryLog, whose report is included in the failure message:
+
+        with assert_max_queries(db.engine, 2):
+            client.get('/api/posts')
+    """
+    log = QueryLog()
+    started = {}
+
+    def before(connection, cursor, statement, parameters, context, executemany):
+        started[id(cursor)] = time.perf_counter()
+
+    def after(connection, cursor, statement, parameters, context, executemany):
+        log.record(statement, time.perf_counter() - started.pop(id(cursor), time.perf_counter()))
+
+    event.listen(engine, 'before_cursor_execute', before)
+    event.listen(engine, 'after_cursor_execute', after)
+    try:
+        yield log
+    finally:
+        event.remove(engine, 'before_cursor_execute', before)
+        event.remove(engine, 'after_cursor_execute', after)
+    assert log.count <= limit, f'Expected at most {limit} queries, got {log.report(10)}'
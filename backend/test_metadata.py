@@ -12,6 +12,10 @@ Example:
 import sys
 import requests
 import json
+from upstream import UpstreamClient
+
+# Same pooled client the backend uses for upstream fetches
+upstream = UpstreamClient(read_timeout=10)
 
 def test_endpoint(url):
     """Test a metadata endpoint and display the response"""
@@ -20,7 +24,7 @@ def test_endpoint(url):
     print(f"{'='*60}\n")
 
     try:
-        response = requests.get(url, timeout=10)
+        response = upstream.get(url)
 
         print(f"Status Code: {response.status_code}")
         print(f"Content-Type: {response.headers.get('Content-Type', 'N/A')}")
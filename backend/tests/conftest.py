@@ -0,0 +1,53 @@
+"""
+Shared fixtures: the backend app on a SQLite database in a temporary directory
+
+The app reads its configuration when it is imported, so the environment
+is set here first. Nothing points at a reachable upstream server, and the
+pollers wait an hour between polls and station reloads, so background
+queries do not land in the tests' query counts.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_tmp = tempfile.TemporaryDirectory()
+
+os.environ.update(
+    DATABASE_URL='sqlite:///' + os.path.join(_tmp.name, 'test.db'),
+    RATING_WRITE_BEHIND='false',
+    SQL_PROFILE='false',
+    NOWPLAYING_METADATA_URL='http://127.0.0.1:9/metadata.json',
+    NOWPLAYING_ALBUM_ART_URL='',
+    NOWPLAYING_POLL_INTERVAL='3600',
+    STATIONS_RELOAD_INTERVAL='3600',
+    RANKING_REBUILD_INTERVAL='0',
+    ART_CACHE_DIR=os.path.join(_tmp.name, 'art'),
+    HLS_RELAY='false'
+)
+sys.path.insert(0, BACKEND_DIR)
+
+import app as backend
+
+
+@pytest.fixture(scope='session')
+def app():
+    with backend.app.app_context():
+        backend.db.create_all()
+    yield backend.app
+    backend.poll_scheduler.stop()
+    _tmp.cleanup()
+
+
+@pytest.fixture(scope='session')
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def db(app):
+    with app.app_context():
+        yield backend.db
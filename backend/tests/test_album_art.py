@@ -0,0 +1,47 @@
+"""
+Cached album art (/api/art/<song_id>)
+"""
+
+import pytest
+
+import app as backend
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+@pytest.fixture
+def song_with_art(db):
+    art_hash = backend.art_cache.store(PNG)
+    song_data, _ = backend.resolve_song('Art Song', 'Art Artist', '')
+    song = db.session.get(backend.Song, song_data['id'])
+    song.art_hash = art_hash
+    db.session.commit()
+    return song.id, art_hash
+
+
+def test_the_published_url_is_immutable(client, song_with_art):
+    song_id, art_hash = song_with_art
+
+    response = client.get(backend.art_url(song_id, art_hash))
+
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+
+
+@pytest.mark.parametrize('query', [
+    lambda art_hash: {},
+    lambda art_hash: {'v': ''},
+    # Prefixes of the published version, and the whole hash
+    lambda art_hash: {'v': art_hash[:1]},
+    lambda art_hash: {'v': art_hash[:15]},
+    lambda art_hash: {'v': art_hash},
+    lambda art_hash: {'v': '0' * 16},
+], ids=['no v', 'empty', 'one character', '15 characters', 'full hash', 'wrong'])
+def test_any_other_version_revalidates(client, song_with_art, query):
+    song_id, art_hash = song_with_art
+
+    response = client.get(f'/api/art/{song_id}', query_string=query(art_hash))
+
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
@@ -0,0 +1,122 @@
+"""
+Batch rating endpoints (POST /api/songs/rate and /api/songs/user-ratings)
+"""
+
+import pytest
+
+import app as backend
+
+
+@pytest.fixture
+def song_ids(db, request):
+    return [
+        backend.resolve_song(f'{request.node.name} {i}', 'Batch Artist', '')[0]['id']
+        for i in range(3)
+    ]
+
+
+def stored(db, user, song_ids):
+    ratings = dict(db.session.execute(
+        db.select(backend.Rating.song_id, backend.Rating.rating_type)
+        .where(backend.Rating.user_identifier == user, backend.Rating.song_id.in_(song_ids))
+    ).all())
+    db.session.expire_all()
+    return ratings
+
+
+def rate(client, user, ratings):
+    return client.post('/api/songs/rate', json={
+        'user_identifier': user,
+        'ratings': [{'song_id': song_id, 'rating_type': rating_type} for song_id, rating_type in ratings]
+    })
+
+
+def test_new_and_changed_votes_in_one_request(db, client, song_ids):
+    first, second, third = song_ids
+    assert rate(client, 'batcher', [(first, 'up')]).status_code == 200
+
+    response = rate(client, 'batcher', [(first, 'down'), (second, 'up'), (third, 'up'), (third, 'down')])
+
+    assert response.status_code == 200
+    assert stored(db, 'batcher', song_ids) == {first: 'down', second: 'up', third: 'down'}
+    counts = {song['id']: (song['thumbs_up'], song['thumbs_down']) for song in response.get_json()['songs']}
+    assert counts == {first: (0, 1), second: (1, 0), third: (0, 1)}
+
+    response = client.post('/api/songs/user-ratings', json={'user_identifier': 'batcher', 'song_ids': song_ids})
+    assert response.get_json()['ratings'] == {str(first): 'down', str(second): 'up', str(third): 'down'}
+
+
+def test_a_failed_batch_writes_nothing(db, client, song_ids, monkeypatch):
+    def fail(changes, connection=None):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(backend, 'apply_vote_changes', fail)
+
+    assert rate(client, 'batcher', [(song_id, 'up') for song_id in song_ids]).status_code == 500
+    assert stored(db, 'batcher', song_ids) == {}
+
+
+def test_unknown_songs_are_reported_and_nothing_is_written(db, client, song_ids):
+    response = rate(client, 'batcher', [(song_ids[0], 'up'), (999999, 'up')])
+
+    assert response.status_code == 404
+    assert response.get_json()['song_ids'] == [999999]
+    assert stored(db, 'batcher', song_ids) == {}
+
+    response = client.post('/api/songs/user-ratings', json={'user_identifier': 'batcher', 'song_ids': [999999]})
+    assert response.get_json()['ratings'] == {'999999': None}
+
+
+def test_empty_lists(client):
+    response = rate(client, 'batcher', [])
+    assert response.status_code == 200
+    assert response.get_json()['songs'] == []
+
+    response = client.post('/api/songs/user-ratings', json={'user_identifier': 'batcher', 'song_ids': []})
+    assert response.status_code == 200
+    assert response.get_json()['ratings'] == {}
+
+
+@pytest.mark.parametrize('path, key', [('/api/songs/rate', 'ratings'), ('/api/songs/user-ratings', 'song_ids')])
+def test_at_most_rating_batch_max_per_request(app, client, song_ids, monkeypatch, path, key):
+    monkeypatch.setitem(app.config, 'RATING_BATCH_MAX', 2)
+    entries = {
+        'ratings': [{'song_id': song_id, 'rating_type': 'up'} for song_id in song_ids],
+        'song_ids': song_ids
+    }[key]
+
+    assert client.post(path, json={'user_identifier': 'batcher', key: entries}).status_code == 400
+    assert client.post(path, json={'user_identifier': 'batcher', key: entries[:2]}).status_code == 200
+
+
+@pytest.mark.parametrize('body', [
+    {'user_identifier': ['batcher'], 'song_ids': [1]},
+    {'user_identifier': {'id': 'batcher'}, 'song_ids': [1]},
+    {'user_identifier': 7, 'song_ids': [1]},
+    {'user_identifier': '', 'song_ids': [1]},
+    {'user_identifier': 'batcher', 'song_ids': ['1']},
+    {'user_identifier': 'batcher', 'song_ids': [1.5]},
+    {'user_identifier': 'batcher', 'song_ids': [True]},
+    {'user_identifier': 'batcher', 'song_ids': [[1]]},
+    ['batcher'],
+])
+def test_user_ratings_rejects_bad_types(client, body):
+    response = client.post('/api/songs/user-ratings', json=body)
+    assert response.status_code == 400
+    assert 'SELECT' not in response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize('user, song_id', [
+    (['batcher'], 1),
+    ({'id': 'batcher'}, 1),
+    (7, 1),
+    ('batcher', '1'),
+    ('batcher', None),
+    ('batcher', {'id': 1}),
+])
+def test_rate_rejects_bad_types(client, user, song_id):
+    response = client.post('/api/songs/rate', json={
+        'user_identifier': user, 'ratings': [{'song_id': song_id, 'rating_type': 'up'}]
+    })
+    assert response.status_code == 400
+    assert 'SELECT' not in response.get_data(as_text=True)
@@ -0,0 +1,42 @@
+"""
+/api/export filters
+"""
+
+import json
+from datetime import datetime
+
+import pytest
+
+import app as backend
+
+
+@pytest.fixture
+def rating_at_3am(db):
+    song_data, _ = backend.resolve_song('Export Song', 'Export Artist', '')
+    rating = backend.Rating(song_id=song_data['id'], user_identifier='export_listener', rating_type='up',
+                            created_at=datetime(2024, 1, 1, 3, 0, 0))
+    db.session.add(rating)
+    db.session.commit()
+    yield rating.id
+    db.session.delete(rating)
+    db.session.commit()
+
+
+@pytest.mark.parametrize('since, included', [
+    ('2024-01-01T00:00:00', True),
+    ('2024-01-01T00:00:00Z', True),
+    # 00:00Z and 04:00Z written with offsets
+    ('2024-01-01T05:00:00+05:00', True),
+    ('2024-01-01T04:00:00+00:00', False),
+    ('2023-12-31T23:00:00-05:00', False),
+])
+def test_since_with_utc_offset(client, rating_at_3am, since, included):
+    response = client.get('/api/export/ratings', query_string={'since': since})
+    assert response.status_code == 200
+    ids = [json.loads(line)['id'] for line in response.get_data(as_text=True).splitlines()]
+    assert (rating_at_3am in ids) == included
+
+
+def test_since_must_be_iso_8601(client):
+    response = client.get('/api/export/ratings?since=yesterday')
+    assert response.status_code == 400
@@ -0,0 +1,122 @@
+"""
+HlsRelay against an origin that answers only when told to
+"""
+
+import threading
+import time
+
+import pytest
+
+from hlsrelay import HlsRelay, RelayBusy, SegmentCache
+
+
+class Response:
+    def __init__(self, content):
+        self.status_code = 200
+        self.content = content
+
+    @property
+    def raw(self):
+        class Raw:
+            def read(raw, size, decode_content=True):
+                return self.content[:size]
+        return Raw()
+
+    def close(self):
+        pass
+
+
+class HeldOrigin:
+    """Answers every request once release is set, counting requests"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.requests = 0
+
+    def get(self, url, stream=False):
+        self.requests += 1
+        self.release.wait(10)
+        return Response(b'G' + url.encode())
+
+
+@pytest.fixture
+def origin():
+    origin = HeldOrigin()
+    yield origin
+    origin.release.set()
+
+
+def relay(origin, max_waiting):
+    return HlsRelay(origin, 'http://origin/hls/', SegmentCache(1024 * 1024), max_waiting=max_waiting)
+
+
+def start(function, *args):
+    outcome = {}
+
+    def run():
+        try:
+            outcome['result'] = function(*args)
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+def test_misses_beyond_max_waiting_are_turned_away(origin):
+    hls = relay(origin, max_waiting=2)
+    waiting = [start(hls.segment, f'segment{i}.ts') for i in range(2)]
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    with pytest.raises(RelayBusy):
+        hls.segment('segment9.ts')
+    assert time.monotonic() - started < 0.1
+
+    origin.release.set()
+    for thread, outcome in waiting:
+        thread.join(5)
+        assert outcome['result'].startswith(b'G')
+    # Slots are given back once the fetches finish
+    assert hls.segment('segment9.ts') == b'Ghttp://origin/hls/segment9.ts'
+    assert hls.stats()['rejected'] == 1
+
+
+def test_requests_sharing_a_fetch_count_as_waiting(origin):
+    hls = relay(origin, max_waiting=3)
+    waiting = [start(hls.segment, 'segment1.ts') for _ in range(3)]
+    time.sleep(0.1)
+
+    with pytest.raises(RelayBusy):
+        hls.segment('segment1.ts')
+    origin.release.set()
+    for thread, outcome in waiting:
+        thread.join(5)
+        assert 'error' not in outcome
+    assert origin.requests == 1
+
+
+def test_no_limit_by_default(origin):
+    hls = relay(origin, max_waiting=None)
+    waiting = [start(hls.segment, 'segment1.ts') for _ in range(20)]
+    time.sleep(0.1)
+
+    origin.release.set()
+    for thread, outcome in waiting:
+        thread.join(5)
+        assert 'error' not in outcome
+    assert hls.stats()['rejected'] == 0
+
+
+def test_cache_hits_are_never_turned_away(origin):
+    origin.release.set()
+    hls = relay(origin, max_waiting=1)
+    hls.segment('segment1.ts')
+    origin.release.clear()
+    thread, _ = start(hls.segment, 'segment2.ts')
+    time.sleep(0.1)
+
+    assert hls.segment('segment1.ts') == b'Ghttp://origin/hls/segment1.ts'
+    origin.release.set()
+    thread.join(5)
@@ -0,0 +1,64 @@
+"""
+NowPlayingPoller against a metadata server that starts failing
+"""
+
+import pytest
+
+import app as backend
+
+
+class Response:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class Upstream:
+    """Answers get_conditional with the next queued response"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+
+    def get_conditional(self, url):
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response, True
+
+
+@pytest.fixture
+def poller(app):
+    return backend.NowPlayingPoller(app, metadata_url='http://metadata/metadata.json', album_art_url='',
+                                    interval=10, stale_after=30)
+
+
+def playing(title):
+    return Response(200, {'title': title, 'artist': 'Poller Artist', 'album': 'Poller Album'})
+
+
+@pytest.mark.parametrize('failure', [Response(503), Response(404), ConnectionError('connection reset')])
+def test_a_failed_poll_keeps_the_live_snapshot(poller, monkeypatch, failure):
+    monkeypatch.setattr(backend, 'upstream', Upstream(playing('Still Playing'), failure))
+    poller.poll_once()
+    live = poller.snapshot
+
+    poller.poll_once()
+
+    assert poller.snapshot is live
+    assert poller.current()['title'] == 'Still Playing'
+
+
+@pytest.mark.parametrize('failure', [Response(503), ConnectionError('connection reset')])
+def test_the_fallback_is_shown_until_the_first_successful_poll(poller, monkeypatch, failure):
+    monkeypatch.setattr(backend, 'upstream', Upstream(failure, playing('First Track')))
+
+    poller.poll_once()
+    assert poller.current()['title'] == 'Radio Calico'
+    assert poller.is_stale(poller.current())
+
+    poller.poll_once()
+    assert poller.current()['title'] == 'First Track'
+    assert not poller.is_stale(poller.current())
@@ -0,0 +1,53 @@
+"""
+?limit= and ?cursor= on the paginated list endpoints
+"""
+
+import pytest
+
+PATHS = ['/api/users', '/api/posts']
+
+
+@pytest.fixture
+def users(client, request):
+    for i in range(3):
+        response = client.post('/api/users', json={
+            'username': f'{request.node.name}_{i}', 'email': f'{request.node.name}_{i}@example.com'
+        })
+        assert response.status_code == 201
+
+
+@pytest.mark.parametrize('path', PATHS)
+@pytest.mark.parametrize('limit', ['abc', '', '1.5', '0', '-1', '+5', ' 5'])
+def test_a_bad_limit_is_rejected(client, path, limit):
+    response = client.get(path, query_string={'limit': limit})
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'limit must be a positive integer'
+
+
+@pytest.mark.parametrize('path', PATHS)
+def test_a_bad_cursor_is_rejected(client, path):
+    assert client.get(path, query_string={'cursor': 'not-a-cursor'}).status_code == 400
+
+
+def test_limit_is_capped_at_the_max_page_size(app, client, users, monkeypatch):
+    monkeypatch.setitem(app.config, 'API_MAX_PAGE_SIZE', 2)
+
+    response = client.get('/api/users', query_string={'limit': '5'})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body['users']) == 2
+    assert body['next_cursor'] is not None
+
+
+def test_pages_follow_the_cursor(client, users):
+    response = client.get('/api/users', query_string={'limit': '1'})
+    first = response.get_json()
+
+    response = client.get('/api/users', query_string={'limit': '1', 'cursor': first['next_cursor']})
+
+    assert response.status_code == 200
+    second = response.get_json()
+    assert len(first['users']) == len(second['users']) == 1
+    assert first['users'][0]['id'] != second['users'][0]['id']
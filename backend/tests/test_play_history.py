@@ -0,0 +1,66 @@
+"""
+Recording plays and serving track history
+"""
+
+import pytest
+
+import app as backend
+
+
+def plays(db, station_id=None):
+    return db.session.scalars(
+        db.select(backend.PlayHistory.song_id)
+        .where(backend.play_history_of(station_id))
+        .order_by(backend.PlayHistory.id)
+    ).all()
+
+
+def poller(station_id=None):
+    return backend.NowPlayingPoller(
+        backend.app, metadata_url='', album_art_url='', interval=10, stale_after=30, station_id=station_id
+    )
+
+
+@pytest.fixture
+def songs(db):
+    db.session.execute(db.delete(backend.PlayHistory))
+    db.session.commit()
+    return [backend.resolve_song(f'History {i}', 'History Artist', '')[0]['id'] for i in range(3)]
+
+
+def test_a_track_change_is_recorded_once(db, songs):
+    first, second = songs[:2]
+    # Separate pollers stand in for separate worker processes
+    for _ in range(3):
+        poller()._record_play(first)
+    poller()._record_play(second)
+    poller()._record_play(second)
+
+    assert plays(db) == [first, second]
+
+
+def test_each_station_has_its_own_history(db, songs):
+    station = backend.Station(slug='history', name='History FM', metadata_url='http://127.0.0.1:9/metadata.json')
+    db.session.add(station)
+    db.session.commit()
+    try:
+        poller()._record_play(songs[0])
+        poller(station.id)._record_play(songs[0])
+        poller(station.id)._record_play(songs[1])
+
+        assert plays(db) == [songs[0]]
+        assert plays(db, station.id) == [songs[0], songs[1]]
+    finally:
+        db.session.execute(db.delete(backend.PlayHistory))
+        db.session.delete(station)
+        db.session.commit()
+
+
+def test_track_history_starts_the_pollers(client):
+    scheduler = backend.poll_scheduler
+    scheduler.stop()
+    if scheduler._thread is not None:
+        scheduler._thread.join(5)
+
+    assert client.get('/api/trackhistory').status_code == 200
+    assert scheduler._thread.is_alive()
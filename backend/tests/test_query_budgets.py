@@ -0,0 +1,88 @@
+"""
+Every API endpoint stays within a fixed SQL query budget
+
+Budgets are fixed numbers, not per-row, so an N+1 pattern fails as soon as
+a list gets longer than the budget. On failure the message lists the
+statements that ran (sqlprofile.assert_max_queries).
+"""
+
+import pytest
+
+import app as backend
+from sqlprofile import assert_max_queries
+
+# (method, path, JSON body or a function of the seeded ids, maximum queries);
+# {user}, {post}, {song} and {station} in paths are filled from the seed
+BUDGETS = [
+    ('GET', '/api/health', None, 0),
+    ('GET', '/api/nowplaying', None, 1),
+    ('GET', '/api/trackhistory', None, 1),
+    ('GET', '/api/stations', None, 1),
+    ('GET', '/api/stations/{station}/nowplaying', None, 1),
+    ('GET', '/api/stations/{station}/trackhistory', None, 1),
+    ('GET', '/api/users', None, 2),
+    ('GET', '/api/users/{user}', None, 2),
+    ('GET', '/api/posts', None, 1),
+    ('GET', '/api/posts/{post}', None, 2),
+    ('GET', '/api/songs/{song}/ratings', None, 1),
+    ('GET', '/api/songs/{song}/user-rating/listener_1', None, 1),
+    ('POST', '/api/songs/user-ratings', lambda ids: {'user_identifier': 'listener_1', 'song_ids': ids['songs'][:20]}, 1),
+    ('POST', '/api/songs/{song}/rate', {'user_identifier': 'budget', 'rating_type': 'up'}, 10),
+    ('POST', '/api/songs/rate', lambda ids: {'user_identifier': 'budget', 'ratings': [
+        {'song_id': song_id, 'rating_type': 'down'} for song_id in ids['songs'][:20]
+    ]}, 11),
+    ('GET', '/api/songs/top', None, 2),
+    ('GET', '/api/songs/{song}/trend?hours=48', None, 2),
+    ('POST', '/api/songs/find-or-create', {'title': 'Budget Song 1', 'artist': 'Budget Artist 1'}, 1),
+    ('GET', '/api/art/{song}', None, 1),
+]
+
+
+@pytest.fixture(scope='module')
+def ids(app, client):
+    """A few users, posts, songs, ratings, stations and plays; returns their ids"""
+    db = backend.db
+    with app.app_context():
+        users = [backend.User(username=f'budget_user{i}', email=f'budget_user{i}@example.com') for i in range(30)]
+        db.session.add_all(users)
+        db.session.flush()
+        posts = [backend.Post(title=f'Budget post {i}', content='Lorem ipsum', user_id=users[i % 30].id)
+                 for i in range(60)]
+        stations = [backend.Station(slug=f'budget-{i}', name=f'Budget {i}',
+                                    metadata_url='http://127.0.0.1:9/metadata.json') for i in range(5)]
+        db.session.add_all(posts + stations)
+        db.session.commit()
+
+        songs = [
+            song_data['id'] for song_data, _ in backend.upsert_songs([
+                {'title': f'Budget Song {i}', 'artist': f'Budget Artist {i}'} for i in range(30)
+            ]).values()
+        ]
+        db.session.execute(db.insert(backend.Rating.__table__), [
+            {'song_id': song_id, 'user_identifier': f'listener_{i}', 'rating_type': 'up'}
+            for song_id in songs for i in range(5)
+        ])
+        db.session.execute(db.insert(backend.PlayHistory.__table__), [
+            {'song_id': song_id, 'station_id': station_id}
+            for song_id in songs[:10] for station_id in (None, stations[0].id)
+        ])
+        db.session.commit()
+        app.test_cli_runner().invoke(backend.rebuild_rating_counts)
+        ids = {'user': users[0].id, 'post': posts[0].id, 'song': songs[0], 'songs': songs,
+               'station': stations[0].id}
+
+    # Warm the now playing snapshots and the song id cache
+    client.get('/api/nowplaying')
+    client.get(f'/api/stations/{ids["station"]}/nowplaying')
+    return ids
+
+
+@pytest.mark.parametrize('method, path, body, budget', BUDGETS, ids=[f'{m} {p}' for m, p, _, _ in BUDGETS])
+def test_query_budget(app, client, ids, method, path, body, budget):
+    if callable(body):
+        body = body(ids)
+    with app.app_context():
+        engine = backend.db.engine
+    with assert_max_queries(engine, budget):
+        response = client.open(path.format(**ids), method=method, json=body)
+    assert response.status_code < 500, response.get_data(as_text=True)
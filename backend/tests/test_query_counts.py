@@ -0,0 +1,45 @@
+"""
+List endpoints run a fixed number of queries however many rows they return
+"""
+
+import pytest
+
+import app as backend
+from sqlprofile import assert_max_queries
+
+
+def add_users_with_posts(db, users, posts_per_user):
+    start = db.session.scalar(db.select(db.func.count(backend.User.id)))
+    db.session.execute(db.insert(backend.User.__table__), [
+        {'username': f'user{start + i}', 'email': f'user{start + i}@example.com'} for i in range(users)
+    ])
+    user_ids = db.session.scalars(db.select(backend.User.id).order_by(backend.User.id.desc()).limit(users)).all()
+    db.session.execute(db.insert(backend.Post.__table__), [
+        {'title': f'Post {user_id}.{i}', 'content': 'Lorem ipsum', 'user_id': user_id}
+        for user_id in user_ids for i in range(posts_per_user)
+    ])
+    db.session.commit()
+
+
+def query_count(db, client, path):
+    with assert_max_queries(db.engine, 1000) as log:
+        response = client.get(path)
+    assert response.status_code == 200
+    return log.count
+
+
+@pytest.mark.parametrize('path, key, budget', [
+    ('/api/users', 'users', 1),
+    ('/api/posts', 'posts', 1),
+])
+def test_list_query_count_does_not_grow_with_rows(db, client, path, key, budget):
+    add_users_with_posts(db, users=3, posts_per_user=1)
+    few = query_count(db, client, path)
+
+    # A full page, each user with several posts
+    add_users_with_posts(db, users=60, posts_per_user=4)
+    assert len(client.get(path).get_json()[key]) == backend.app.config['API_DEFAULT_PAGE_SIZE']
+    many = query_count(db, client, path)
+
+    assert few == many
+    assert many <= budget
@@ -0,0 +1,32 @@
+"""
+Per-statement timing (db_query_duration_seconds)
+"""
+
+import copy
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy.exc import OperationalError
+
+import app as backend
+
+
+def timed_statements():
+    return REGISTRY.get_sample_value('db_query_duration_seconds_count')
+
+
+def test_failed_statements_leave_nothing_behind(app):
+    with app.app_context():
+        engine = backend.db.engine
+    with engine.connect() as connection:
+        info = copy.deepcopy(connection.info)
+        for _ in range(5):
+            with pytest.raises(OperationalError):
+                connection.exec_driver_sql('SELECT * FROM no_such_table')
+            connection.rollback()
+
+        before = timed_statements()
+        assert connection.exec_driver_sql('SELECT 1').scalar() == 1
+
+        assert timed_statements() == before + 1
+        assert connection.info == info
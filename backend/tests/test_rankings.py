@@ -0,0 +1,143 @@
+"""
+Leaderboard windows (/api/songs/top)
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as backend
+
+
+def ranking(db, window, song_id):
+    row = db.session.get(backend.SongRanking, (window, song_id))
+    db.session.expire_all()
+    return (row.thumbs_up, row.thumbs_down) if row is not None else None
+
+
+def vote(client, song_id, user, rating_type):
+    response = client.post(f'/api/songs/{song_id}/rate', json={'user_identifier': user, 'rating_type': rating_type})
+    assert response.status_code in (200, 201)
+
+
+@pytest.fixture
+def song_id(db, request):
+    song_data, _ = backend.resolve_song(request.node.name, 'Ranking Artist', '')
+    return song_data['id']
+
+
+def test_votes_reach_every_window_as_they_are_written(db, client, song_id):
+    vote(client, song_id, 'ranker_1', 'up')
+    vote(client, song_id, 'ranker_2', 'up')
+    vote(client, song_id, 'ranker_2', 'down')
+
+    for window in backend.RANKING_WINDOWS:
+        assert ranking(db, window, song_id) == (1, 1)
+
+
+def test_a_rebuild_drops_votes_older_than_the_window(db, client, song_id):
+    vote(client, song_id, 'ranker_1', 'up')
+    vote(client, song_id, 'ranker_2', 'down')
+    db.session.execute(
+        db.update(backend.Rating)
+        .where(backend.Rating.song_id == song_id, backend.Rating.user_identifier == 'ranker_1')
+        .values(created_at=datetime.utcnow() - timedelta(days=2))
+    )
+    db.session.commit()
+
+    # Still counted until the window is rebuilt
+    assert ranking(db, 'day', song_id) == (1, 1)
+    backend.rebuild_ranking_window('day', datetime.utcnow())
+    backend.rebuild_ranking_window('week', datetime.utcnow())
+
+    assert ranking(db, 'day', song_id) == (0, 1)
+    assert ranking(db, 'week', song_id) == (1, 1)
+
+
+def test_changing_an_aged_out_vote_does_not_go_negative(db, client, song_id):
+    vote(client, song_id, 'ranker_1', 'up')
+    db.session.execute(
+        db.update(backend.Rating).where(backend.Rating.song_id == song_id)
+        .values(created_at=datetime.utcnow() - timedelta(days=2))
+    )
+    db.session.commit()
+    backend.rebuild_ranking_window('day', datetime.utcnow())
+
+    vote(client, song_id, 'ranker_1', 'down')
+
+    assert ranking(db, 'day', song_id) == (0, 1)
+    assert ranking(db, 'all', song_id) == (0, 1)
+
+
+def test_changing_a_vote_that_aged_out_since_the_rebuild_replaces_it(db, client, song_id):
+    now = datetime.utcnow()
+    vote(client, song_id, 'ranker_1', 'up')
+    db.session.execute(
+        db.update(backend.Rating).where(backend.Rating.song_id == song_id)
+        .values(created_at=now - timedelta(hours=25))
+    )
+    db.session.commit()
+    # Rebuilt two hours ago, when the vote was still in the window
+    backend.rebuild_ranking_window('day', now - timedelta(hours=2))
+    assert ranking(db, 'day', song_id) == (1, 0)
+
+    vote(client, song_id, 'ranker_1', 'down')
+
+    assert ranking(db, 'day', song_id) == (0, 1)
+
+
+def test_a_rebuild_removes_songs_without_votes_in_the_window(db, client, song_id):
+    vote(client, song_id, 'ranker_1', 'up')
+    db.session.execute(
+        db.update(backend.Rating).where(backend.Rating.song_id == song_id)
+        .values(created_at=datetime.utcnow() - timedelta(days=2))
+    )
+    db.session.commit()
+
+    backend.rebuild_ranking_window('day', datetime.utcnow())
+
+    assert ranking(db, 'day', song_id) is None
+    assert ranking(db, 'all', song_id) == (1, 0)
+
+
+def test_a_vote_during_a_rebuild_is_kept(db, client, song_id, monkeypatch):
+    vote(client, song_id, 'ranker_1', 'up')
+    ranking_counts = backend.ranking_counts
+
+    def read_then_vote(window, now, song_ids=None):
+        if song_ids is not None:
+            return ranking_counts(window, now, song_ids)
+        # The vote commits after the rebuild has added up the ratings
+        vote(client, song_id, 'ranker_2', 'down')
+        return ranking_counts(window, now).where(backend.Rating.user_identifier != 'ranker_2')
+
+    monkeypatch.setattr(backend, 'ranking_counts', read_then_vote)
+    backend.rebuild_ranking_window('week', datetime.utcnow())
+
+    assert ranking(db, 'week', song_id) == (1, 1)
+
+
+def test_each_window_is_claimed_once_per_interval(db):
+    now = datetime.utcnow()
+    backend.rebuild_ranking_window('month', now)
+    interval = timedelta(hours=1)
+
+    assert not backend.claim_ranking_rebuild('month', now + timedelta(minutes=30), interval)
+    assert backend.claim_ranking_rebuild('month', now + timedelta(minutes=61), interval)
+    # Claimed above, so another process checking at the same time skips it
+    assert not backend.claim_ranking_rebuild('month', now + timedelta(minutes=61), interval)
+
+
+def test_top_reports_when_the_window_was_rebuilt(db, client):
+    rebuilt_at = datetime(2024, 5, 1, 12, 0, 0)
+    backend.rebuild_ranking_window('week', rebuilt_at)
+
+    response = client.get('/api/songs/top?window=week')
+
+    assert response.status_code == 200
+    assert response.get_json()['updated_at'] == '2024-05-01T12:00:00+00:00'
+
+
+@pytest.mark.parametrize('query', ['limit=0', 'limit=-3', 'limit=ten', 'window=year'])
+def test_top_rejects_bad_parameters(client, query):
+    assert client.get(f'/api/songs/top?{query}').status_code == 400
@@ -0,0 +1,93 @@
+"""
+Denormalized song rating counters and `flask rebuild-rating-counts`
+"""
+
+import pytest
+
+import app as backend
+
+
+@pytest.fixture
+def song_id(db, request):
+    song_data, _ = backend.resolve_song(request.node.name, 'Counter Artist', '')
+    return song_data['id']
+
+
+def counters(db, song_id):
+    song = db.session.get(backend.Song, song_id)
+    db.session.expire_all()
+    return song.thumbs_up, song.thumbs_down
+
+
+def counted(db, song_id):
+    """(up, down) counted from the Rating table"""
+    rows = dict(db.session.execute(
+        db.select(backend.Rating.rating_type, backend.func.count())
+        .where(backend.Rating.song_id == song_id)
+        .group_by(backend.Rating.rating_type)
+    ).all())
+    return rows.get('up', 0), rows.get('down', 0)
+
+
+def verify(app):
+    return app.test_cli_runner().invoke(backend.rebuild_rating_counts, ['--verify'])
+
+
+@pytest.mark.parametrize('votes, expected', [
+    ([('a', 'up')], (1, 0)),
+    ([('a', 'up'), ('b', 'down')], (1, 1)),
+    # Flips
+    ([('a', 'up'), ('a', 'down')], (0, 1)),
+    ([('a', 'down'), ('a', 'up'), ('a', 'down'), ('a', 'up')], (1, 0)),
+    # The same vote again
+    ([('a', 'up'), ('a', 'up'), ('b', 'down'), ('b', 'down')], (1, 1)),
+    ([('a', 'up'), ('b', 'up'), ('a', 'down'), ('b', 'up'), ('c', 'down'), ('a', 'down')], (1, 2)),
+])
+def test_counters_follow_the_ratings(db, client, song_id, votes, expected):
+    for user, rating_type in votes:
+        response = client.post(f'/api/songs/{song_id}/rate', json={'user_identifier': user, 'rating_type': rating_type})
+        assert response.status_code in (200, 201)
+
+    assert counters(db, song_id) == expected
+    assert counted(db, song_id) == expected
+
+
+def test_batch_votes_keep_the_counters(db, client, song_id):
+    other_id = backend.resolve_song('Counter Song 2', 'Counter Artist', '')[0]['id']
+    for ratings in (
+        [{'song_id': song_id, 'rating_type': 'up'}, {'song_id': other_id, 'rating_type': 'down'}],
+        [{'song_id': song_id, 'rating_type': 'down'}, {'song_id': other_id, 'rating_type': 'down'}],
+    ):
+        response = client.post('/api/songs/rate', json={'user_identifier': 'batch_counter', 'ratings': ratings})
+        assert response.status_code == 200
+
+    assert counters(db, song_id) == counted(db, song_id) == (0, 1)
+    assert counters(db, other_id) == counted(db, other_id) == (0, 1)
+
+
+def test_verify_passes_when_the_counters_match(app, client, song_id):
+    client.post(f'/api/songs/{song_id}/rate', json={'user_identifier': 'a', 'rating_type': 'up'})
+
+    result = verify(app)
+
+    assert result.exit_code == 0, result.output
+    assert 'All rating counters match' in result.output
+
+
+def test_verify_reports_drift_and_a_rebuild_repairs_it(app, db, client, song_id):
+    client.post(f'/api/songs/{song_id}/rate', json={'user_identifier': 'a', 'rating_type': 'up'})
+    db.session.execute(db.update(backend.Song).where(backend.Song.id == song_id).values(thumbs_up=5, thumbs_down=2))
+    db.session.commit()
+
+    result = verify(app)
+
+    assert result.exit_code == 1
+    assert f'Song {song_id}: stored 5/2, actual 1/0' in result.output
+    assert '1 song(s) have incorrect rating counters' in result.output
+    # --verify changes nothing
+    assert counters(db, song_id) == (5, 2)
+
+    result = app.test_cli_runner().invoke(backend.rebuild_rating_counts)
+    assert result.exit_code == 0, result.output
+    assert counters(db, song_id) == (1, 0)
+    assert verify(app).exit_code == 0
@@ -0,0 +1,52 @@
+"""
+Pollers of stations added with `flask add-station`
+"""
+
+import pytest
+
+import app as backend
+
+
+@pytest.fixture
+def add_station(db):
+    added = []
+
+    def add(slug, poll_interval=None):
+        station = backend.Station(slug=slug, name=f'{slug.title()} FM', poll_interval=poll_interval,
+                                  metadata_url='http://127.0.0.1:9/metadata.json')
+        db.session.add(station)
+        db.session.commit()
+        added.append(station)
+        return station
+
+    yield add
+    for station in added:
+        db.session.delete(station)
+    db.session.commit()
+    backend.poll_scheduler.reload()
+
+
+def test_stale_after_follows_the_poll_interval(add_station):
+    slow = add_station('slow', poll_interval=120)
+    fast = add_station('fast', poll_interval=5)
+    backend.poll_scheduler.reload()
+
+    assert backend.poll_scheduler.poller(slow.id).stale_after == 360
+    assert backend.poll_scheduler.poller(fast.id).stale_after == backend.app.config['NOWPLAYING_STALE_AFTER']
+
+
+def test_a_station_shows_its_name_before_its_first_poll(db, client, add_station):
+    station = add_station('waiting')
+
+    response = client.get(f'/api/stations/{station.id}/nowplaying')
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['title'] == 'Waiting FM'
+    assert body['song_id'] is None
+    assert (body['thumbs_up'], body['thumbs_down']) == (0, 0)
+    assert body['stale'] is True
+    # A placeholder, not a song
+    assert db.session.execute(db.select(backend.Song).filter_by(title='Waiting FM')).first() is None
+    # The default station keeps the Radio Calico fallback
+    assert client.get('/api/nowplaying').get_json()['title'] == 'Radio Calico'
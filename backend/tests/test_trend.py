@@ -0,0 +1,128 @@
+"""
+Hourly vote rollups and /api/songs/<id>/trend
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as backend
+
+
+@pytest.fixture
+def song_id(db, request):
+    song_data, _ = backend.resolve_song(request.node.name, 'Trend Artist', '')
+    return song_data['id']
+
+
+def rollups(db, song_id):
+    rows = db.session.execute(
+        db.select(backend.RatingRollup.hour, backend.RatingRollup.up, backend.RatingRollup.down,
+                  backend.RatingRollup.flips)
+        .where(backend.RatingRollup.song_id == song_id)
+        .order_by(backend.RatingRollup.hour)
+    ).all()
+    return [tuple(row) for row in rows]
+
+
+def cast(db, song_id, user, rating_type, at, previous=None):
+    """Store a vote cast at a given time the way rate_song does"""
+    rating = db.session.execute(db.select(backend.Rating).filter_by(song_id=song_id, user_identifier=user)).scalar()
+    previous_at = None
+    if rating is None:
+        db.session.add(backend.Rating(song_id=song_id, user_identifier=user, rating_type=rating_type, created_at=at))
+    else:
+        previous_at = rating.created_at
+        rating.rating_type, rating.created_at = rating_type, at
+    backend.apply_vote_changes([(song_id, previous, rating_type, at, previous_at)])
+    db.session.commit()
+
+
+def vote(client, song_id, user, rating_type):
+    response = client.post(f'/api/songs/{song_id}/rate', json={'user_identifier': user, 'rating_type': rating_type})
+    assert response.status_code in (200, 201)
+
+
+def trend(client, song_id, hours):
+    response = client.get(f'/api/songs/{song_id}/trend?hours={hours}')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_votes_are_counted_in_the_hour_they_were_cast(db, song_id):
+    cast(db, song_id, 'trend_1', 'up', datetime(2024, 1, 1, 3, 15))
+    cast(db, song_id, 'trend_2', 'down', datetime(2024, 1, 1, 3, 59, 59))
+    cast(db, song_id, 'trend_3', 'up', datetime(2024, 1, 1, 4, 0))
+
+    assert rollups(db, song_id) == [
+        (datetime(2024, 1, 1, 3), 1, 1, 0),
+        (datetime(2024, 1, 1, 4), 1, 0, 0),
+    ]
+
+
+def test_a_changed_vote_counts_as_a_flip(client, song_id):
+    vote(client, song_id, 'trend_1', 'up')
+    vote(client, song_id, 'trend_1', 'down')
+
+    body = trend(client, song_id, 2)
+    assert (body['up'], body['down'], body['flips']) == (1, 1, 1)
+
+
+def test_the_same_vote_again_is_not_counted(client, song_id):
+    vote(client, song_id, 'trend_1', 'up')
+    vote(client, song_id, 'trend_1', 'up')
+
+    body = trend(client, song_id, 2)
+    assert (body['up'], body['down'], body['flips']) == (1, 0, 0)
+    assert body['sentiment'] == 1.0
+
+
+def test_hours_without_votes_are_filled_in(client, song_id):
+    vote(client, song_id, 'trend_1', 'up')
+
+    body = trend(client, song_id, 5)
+
+    hours = [datetime.fromisoformat(bucket['hour']) for bucket in body['buckets']]
+    assert hours == [hours[0] + timedelta(hours=offset) for offset in range(5)]
+    assert [bucket['up'] for bucket in body['buckets']] == [0, 0, 0, 0, 1]
+
+
+@pytest.mark.parametrize('hours, returned', [
+    (0, 1),
+    (-5, 1),
+    (10 ** 6, backend.TREND_MAX_HOURS),
+])
+def test_hours_are_clamped(client, song_id, hours, returned):
+    body = trend(client, song_id, hours)
+    assert body['hours'] == returned
+    assert len(body['buckets']) == returned
+
+
+def test_trend_of_an_unknown_song(client):
+    assert client.get('/api/songs/999999/trend').status_code == 404
+
+
+def test_backfill_only_rebuilds_hours_from_since(app, db, song_id):
+    cast(db, song_id, 'trend_1', 'up', datetime(2024, 1, 1, 3, 15))
+    cast(db, song_id, 'trend_1', 'down', datetime(2024, 1, 1, 3, 30), previous='up')
+    cast(db, song_id, 'trend_2', 'up', datetime(2024, 1, 2, 5, 10))
+    cast(db, song_id, 'trend_2', 'down', datetime(2024, 1, 2, 5, 20), previous='up')
+    cast(db, song_id, 'trend_3', 'up', datetime(2024, 1, 2, 6, 0))
+
+    result = app.test_cli_runner().invoke(backend.backfill_rollups, ['--since', '2024-01-02T05:45:00'])
+
+    assert result.exit_code == 0, result.output
+    db.session.expire_all()
+    assert rollups(db, song_id) == [
+        # Before --since: kept as maintained live
+        (datetime(2024, 1, 1, 3), 1, 1, 1),
+        # From the hour --since falls in: recounted from the current ratings
+        (datetime(2024, 1, 2, 5), 0, 1, 0),
+        (datetime(2024, 1, 2, 6), 1, 0, 0),
+    ]
+
+
+def test_backfill_rejects_a_bad_since(app):
+    result = app.test_cli_runner().invoke(backend.backfill_rollups, ['--since', 'last week'])
+    assert result.exit_code != 0
+    assert '--since' in result.output
@@ -0,0 +1,190 @@
+"""
+Write-behind vote buffer (RATING_WRITE_BEHIND)
+"""
+
+import threading
+
+import pytest
+
+import app as backend
+from writebehind import PendingVotes
+
+
+class Store:
+    """Stands in for the database: the stored rating per (song_id, user)"""
+
+    def __init__(self):
+        self.ratings = {}
+        self.batches = []
+        self.fail = 0
+        self.during_write = None
+
+    def write(self, votes):
+        self.batches.append([(vote['song_id'], vote['user_identifier'], vote['rating_type']) for vote in votes])
+        if self.during_write is not None:
+            during_write, self.during_write = self.during_write, None
+            during_write()
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError('database is locked')
+        for vote in votes:
+            self.ratings[(vote['song_id'], vote['user_identifier'])] = vote['rating_type']
+
+    def stored(self, song_id, user):
+        return lambda: self.ratings.get((song_id, user))
+
+    def counts(self):
+        counts = {}
+        for (song_id, _), rating_type in self.ratings.items():
+            up, down = counts.get(song_id, (0, 0))
+            counts[song_id] = (up + (rating_type == 'up'), down + (rating_type == 'down'))
+        return counts
+
+
+@pytest.fixture
+def store():
+    return Store()
+
+
+@pytest.fixture
+def pending(store):
+    return PendingVotes(store.write, flush_interval=3600, max_pending=1000)
+
+
+def vote(pending, store, song_id, user, rating_type):
+    return pending.submit(song_id, user, rating_type, store.stored(song_id, user))
+
+
+def effective_counts(pending, read):
+    counts, deltas = pending.read_consistent(read)
+    return {
+        song_id: (counts.get(song_id, (0, 0))[0] + deltas.get(song_id, (0, 0))[0],
+                  counts.get(song_id, (0, 0))[1] + deltas.get(song_id, (0, 0))[1])
+        for song_id in set(counts) | set(deltas)
+    }
+
+
+def test_later_votes_replace_earlier_ones_before_a_flush(pending, store):
+    store.ratings[(1, 'u1')] = 'down'
+    assert vote(pending, store, 1, 'u1', 'up') == 'down'
+    assert vote(pending, store, 1, 'u1', 'down') == 'up'
+    assert vote(pending, store, 1, 'u1', 'up') == 'down'
+    vote(pending, store, 1, 'u2', 'up')
+
+    assert effective_counts(pending, store.counts) == {1: (2, 0)}
+    assert pending.flush() == 2
+    assert sorted(store.batches[0]) == [(1, 'u1', 'up'), (1, 'u2', 'up')]
+    assert effective_counts(pending, store.counts) == {1: (2, 0)}
+
+
+def test_a_failed_flush_is_written_by_the_next_one(pending, store):
+    vote(pending, store, 1, 'u1', 'up')
+    vote(pending, store, 2, 'u1', 'down')
+    store.fail = 1
+
+    assert pending.flush() == 0
+    assert pending.stats() == {'pending_votes': 2, 'flushed_votes': 0, 'failed_flushes': 1}
+    assert effective_counts(pending, store.counts) == {1: (1, 0), 2: (0, 1)}
+
+    assert pending.flush() == 2
+    assert store.ratings == {(1, 'u1'): 'up', (2, 'u1'): 'down'}
+    assert effective_counts(pending, store.counts) == {1: (1, 0), 2: (0, 1)}
+
+
+def test_a_newer_vote_is_kept_over_the_failed_batch(pending, store):
+    vote(pending, store, 1, 'u1', 'up')
+    store.fail = 1
+    # Cast while the failing batch is being written
+    store.during_write = lambda: vote(pending, store, 1, 'u1', 'down')
+
+    pending.flush()
+    assert effective_counts(pending, store.counts) == {1: (0, 1)}
+
+    pending.flush()
+    assert store.batches[-1] == [(1, 'u1', 'down')]
+    assert store.ratings == {(1, 'u1'): 'down'}
+    assert effective_counts(pending, store.counts) == {1: (0, 1)}
+
+
+def test_a_read_overlapping_a_flush_is_retried(pending, store):
+    vote(pending, store, 1, 'u1', 'up')
+    reads = []
+
+    def read():
+        counts = store.counts()
+        if not reads:
+            # The batch is stored after this read but before the deltas are taken
+            pending.flush()
+        reads.append(counts)
+        return counts
+
+    assert effective_counts(pending, read) == {1: (1, 0)}
+    assert len(reads) == 2
+
+
+def test_a_read_during_a_flush_waits_for_it(pending, store):
+    vote(pending, store, 1, 'u1', 'up')
+    writing = threading.Event()
+    release = threading.Event()
+
+    def during_write():
+        writing.set()
+        release.wait(5)
+
+    store.during_write = during_write
+    flusher = threading.Thread(target=pending.flush)
+    flusher.start()
+    writing.wait(5)
+    threading.Timer(0.1, release.set).start()
+
+    assert effective_counts(pending, store.counts) == {1: (1, 0)}
+    flusher.join(5)
+
+
+def test_a_submit_overlapping_a_flush_reads_the_stored_vote_again(pending, store):
+    loads = []
+
+    def load_stored():
+        loads.append(store.ratings.get((1, 'u1')))
+        if len(loads) == 1:
+            # Another request's vote for the same pair is written meanwhile
+            vote(pending, store, 1, 'u1', 'up')
+            pending.flush()
+        return loads[-1]
+
+    assert pending.submit(1, 'u1', 'down', load_stored) == 'up'
+    assert loads == [None, 'up']
+    pending.flush()
+    assert effective_counts(pending, store.counts) == {1: (0, 1)}
+
+
+@pytest.fixture
+def write_behind(app, monkeypatch):
+    with app.app_context():
+        connection = backend.db.engine.connect()
+    pending = PendingVotes(backend._flush_votes, flush_interval=3600, max_pending=1000)
+    monkeypatch.setattr(backend, '_vote_connection', connection, raising=False)
+    monkeypatch.setattr(backend, 'pending_votes', pending)
+    yield pending
+    pending.stop()
+    connection.close()
+
+
+def test_buffered_votes_reach_every_read_after_a_flush(db, client, write_behind):
+    song_id = backend.resolve_song('Write Behind Song', 'Write Behind Artist', '')[0]['id']
+    for i in range(6):
+        response = client.post(f'/api/songs/{song_id}/rate', json={'user_identifier': f'behind_{i}', 'rating_type': 'up'})
+        assert response.status_code == 202
+    client.post(f'/api/songs/{song_id}/rate', json={'user_identifier': 'behind_0', 'rating_type': 'down'})
+
+    ratings = client.get(f'/api/songs/{song_id}/ratings').get_json()
+    assert (ratings['thumbs_up'], ratings['thumbs_down']) == (5, 1)
+
+    assert write_behind.flush() == 6
+
+    ratings = client.get(f'/api/songs/{song_id}/ratings').get_json()
+    assert (ratings['thumbs_up'], ratings['thumbs_down']) == (5, 1)
+    top = client.get('/api/songs/top?limit=200').get_json()['songs']
+    assert [(song['thumbs_up'], song['thumbs_down']) for song in top if song['song_id'] == song_id] == [(5, 1)]
+    trend = client.get(f'/api/songs/{song_id}/trend?hours=1').get_json()
+    assert (trend['up'], trend['down'], trend['flips']) == (5, 1, 0)
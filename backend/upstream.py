@@ -0,0 +1,113 @@
+"""
+Shared HTTP client for upstream requests (station metadata, track history)
+
+All upstream fetches go through one pooled requests.Session so connections
+to each host are kept alive and reused instead of paying a new TCP + TLS
+handshake on every poll.
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class UpstreamClient:
+    """Pooled keep-alive HTTP client with timeouts and limited retries.
+
+    pool_connections is the number of per-host pools to keep, pool_maxsize
+    the number of idle connections kept per host. Failed connects and
+    502/503/504 responses are retried up to `retries` times with
+    exponential backoff plus random jitter, so several workers retrying
+    at once do not hit the upstream in lockstep.
+
+    observer, if given, is called after every get as
+    observer(url, seconds, error), where error is None on success, the
+    exception's class name if the request raised, or 'http_<status>' for
+    a 5xx response.
+    """
+
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, connect_timeout=3.05,
+                 read_timeout=5, retries=2, backoff_factor=0.2, backoff_jitter=0.3,
+                 user_agent='RadioCalico/1.0', observer=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.observer = observer
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            backoff_jitter=backoff_jitter,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry
+        )
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = user_agent
+
+        # url -> last 200 response, for conditional requests
+        self._validated = {}
+        self._validated_lock = threading.Lock()
+
+    def get(self, url, timeout=None, **kwargs):
+        """GET a URL through the shared pool.
+
+        timeout defaults to the client's (connect, read) timeouts and may be
+        a single number or a tuple, as with requests.
+        """
+        started = time.perf_counter()
+        try:
+            response = self.session.get(url, timeout=timeout or self.timeout, **kwargs)
+        except Exception as e:
+            if self.observer is not None:
+                self.observer(url, time.perf_counter() - started, type(e).__name__)
+            raise
+        if self.observer is not None:
+            error = f'http_{response.status_code}' if response.status_code >= 500 else None
+            self.observer(url, time.perf_counter() - started, error)
+        return response
+
+    def get_conditional(self, url, timeout=None, **kwargs):
+        """GET a URL, revalidating the last 200 response for it.
+
+        Sends If-None-Match / If-Modified-Since from the previous response's
+        ETag / Last-Modified. Returns (response, modified): on a 304 the
+        previous 200 response is returned with modified=False, so callers can
+        skip re-parsing and re-processing a body they have already seen.
+        """
+        with self._validated_lock:
+            previous = self._validated.get(url)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if previous is not None:
+            if previous.headers.get('ETag'):
+                headers['If-None-Match'] = previous.headers['ETag']
+            if previous.headers.get('Last-Modified'):
+                headers['If-Modified-Since'] = previous.headers['Last-Modified']
+
+        response = self.get(url, timeout=timeout, headers=headers, **kwargs)
+
+        if response.status_code == 304 and previous is not None:
+            return previous, False
+
+        if response.status_code == 200 and (response.headers.get('ETag') or response.headers.get('Last-Modified')):
+            with self._validated_lock:
+                self._validated[url] = response
+        return response, True
+
+    def close(self):
+        self.session.close()
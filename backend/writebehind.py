@@ -0,0 +1,224 @@
+"""
+Write-behind buffer for song votes
+
+Votes are applied to an in-memory pending map (last vote per
+(song_id, user_identifier) wins) and written to the database in one
+transaction every flush interval or once enough votes are waiting. This
+keeps bursts of votes on a popular track from queueing up on SQLite's
+single writer lock, one commit per vote.
+"""
+
+import threading
+from datetime import datetime
+
+
+class PendingVotes:
+    """Buffers votes and flushes them in batches from a background thread.
+
+    write is called with a list of vote dicts (song_id, user_identifier,
+    rating_type, created_at) and must persist them in a single transaction.
+    Each vote also remembers the rating that was stored before it
+    ('previous'), which is what lets readers add pending deltas on top of
+    the stored counters without double counting.
+    """
+
+    def __init__(self, write, flush_interval, max_pending, logger=None):
+        self.write = write
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.logger = logger
+        self.flushed_votes = 0
+        self.failed_flushes = 0
+        self._pending = {}
+        self._inflight = {}
+        # Per-song (thumbs_up, thumbs_down) deltas of the two maps above,
+        # kept up to date so reads don't have to walk every buffered vote
+        self._pending_deltas = {}
+        self._inflight_deltas = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Even while idle, odd while a batch is being written. Readers use it
+        # like a seqlock to detect that a flush overlapped their read.
+        self._generation = 0
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='rating-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread and write out everything still pending"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def submit(self, song_id, user_identifier, rating_type, load_stored):
+        """Queue a vote.
+
+        load_stored() returns the rating type currently stored in the
+        database for this user and song (or None); it is only called when
+        the pair has no vote buffered already. Returns the vote's previous
+        effective rating type (None for a first vote).
+        """
+        key = (song_id, user_identifier)
+        while True:
+            with self._lock:
+                buffered = self._pending.get(key) or self._inflight.get(key)
+                generation = self._generation
+            if buffered is None:
+                stored = load_stored()
+            with self._lock:
+                entry = self._pending.get(key)
+                inflight = self._inflight.get(key)
+                if entry is not None:
+                    previous_effective = entry['rating_type']
+                    stored_before = entry['previous']
+                elif inflight is not None:
+                    previous_effective = inflight['rating_type']
+                    stored_before = inflight['rating_type']
+                elif buffered is None and self._generation == generation:
+                    previous_effective = stored
+                    stored_before = stored
+                else:
+                    # A flush finished while we read the database; read again
+                    continue
+
+                if entry is not None:
+                    self._add_delta(self._pending_deltas, entry, -1)
+                vote = {
+                    'song_id': song_id,
+                    'user_identifier': user_identifier,
+                    'rating_type': rating_type,
+                    'previous': stored_before,
+                    'created_at': datetime.utcnow()
+                }
+                self._pending[key] = vote
+                self._add_delta(self._pending_deltas, vote, 1)
+                pending_count = len(self._pending)
+                break
+
+        if pending_count >= self.max_pending:
+            self._wakeup.set()
+        return previous_effective
+
+    def buffered_vote(self, song_id, user_identifier):
+        """Return the buffered rating type for a user and song, or None"""
+        key = (song_id, user_identifier)
+        with self._lock:
+            entry = self._pending.get(key) or self._inflight.get(key)
+            return entry['rating_type'] if entry is not None else None
+
+    def read_consistent(self, read):
+        """Run read() and return (result, deltas) from one consistent view.
+
+        deltas maps song_id to (thumbs_up, thumbs_down) adjustments that the
+        caller adds to counters read from the database. If a flush overlaps
+        the read it is retried, and after a few tries the read waits for the
+        flush to finish instead.
+        """
+        for _ in range(3):
+            generation = self._generation
+            if generation % 2 == 0:
+                result = read()
+                with self._lock:
+                    if self._generation == generation:
+                        return result, self._deltas()
+        with self._flush_lock:
+            result = read()
+            with self._lock:
+                return result, self._deltas()
+
+    def flush(self):
+        """Write all pending votes in one batch"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._inflight = self._pending
+                self._inflight_deltas = self._pending_deltas
+                self._pending = {}
+                self._pending_deltas = {}
+                self._generation += 1
+                votes = list(self._inflight.values())
+
+            try:
+                self.write(votes)
+            except Exception as e:
+                self.failed_flushes += 1
+                if self.logger is not None:
+                    self.logger.error('Rating flush of %d votes failed: %s', len(votes), e)
+                with self._lock:
+                    # Keep the batch for the next flush unless newer votes replaced it
+                    for key, vote in self._inflight.items():
+                        newer = self._pending.get(key)
+                        if newer is None:
+                            self._pending[key] = vote
+                        else:
+                            newer['previous'] = vote['previous']
+                    self._pending_deltas = {}
+                    for vote in self._pending.values():
+                        self._add_delta(self._pending_deltas, vote, 1)
+                    self._inflight = {}
+                    self._inflight_deltas = {}
+                    self._generation += 1
+                return 0
+
+            with self._lock:
+                # Votes buffered during the write were made relative to the
+                # batch that is now stored
+                self._inflight = {}
+                self._inflight_deltas = {}
+                self._generation += 1
+            self.flushed_votes += len(votes)
+            return len(votes)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending_votes': pending,
+            'flushed_votes': self.flushed_votes,
+            'failed_flushes': self.failed_flushes
+        }
+
+    def _deltas(self):
+        # Caller holds self._lock
+        deltas = dict(self._inflight_deltas)
+        for song_id, (up, down) in self._pending_deltas.items():
+            inflight_up, inflight_down = deltas.get(song_id, (0, 0))
+            deltas[song_id] = (inflight_up + up, inflight_down + down)
+        return deltas
+
+    @staticmethod
+    def _add_delta(deltas, vote, sign):
+        # Add (sign=1) or remove (sign=-1) one vote's effect on its song
+        up, down = deltas.get(vote['song_id'], (0, 0))
+        if vote['previous'] == 'up':
+            up -= sign
+        elif vote['previous'] == 'down':
+            down -= sign
+        if vote['rating_type'] == 'up':
+            up += sign
+        else:
+            down += sign
+        deltas[vote['song_id']] = (up, down)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error('Rating writer error: %s', e)
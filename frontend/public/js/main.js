@@ -14,6 +14,17 @@ let currentSongData = {
     thumbs_up: 0,
     thumbs_down: 0
 };
+let nowPlayingStream = null;
+const responseETags = {};
+let nowPlayingPollTimer = null;
+let trackHistoryPollTimer = null;
+// Ratings clicked but not sent yet: song ID -> { rating_type, context }
+const pendingRatings = new Map();
+let ratingFlushTimer = null;
+const RATING_BATCH_DELAY = 300;
+const API_ORIGIN = 'http://localhost:5000';
+// Set by the server from STREAM_URL
+const STREAM_URL = audio.querySelector('source').getAttribute('src');
 
 // ============================================================================
 // Audio Player Functions
@@ -64,6 +75,34 @@ function getUserIdentifier() {
     return userId;
 }
 
+// ============================================================================
+// Conditional Requests
+// ============================================================================
+
+/**
+ * Fetch JSON, sending the ETag from the previous response for this URL
+ * @param {string} url - URL to fetch
+ * @returns {Promise<Object|null>} Parsed body, or null if the resource is
+ *     unchanged (304) or the request failed
+ */
+async function fetchJSONIfChanged(url) {
+    const headers = {};
+    if (responseETags[url]) {
+        headers['If-None-Match'] = responseETags[url];
+    }
+
+    const response = await fetch(url, { headers });
+    if (response.status === 304 || !response.ok) {
+        return null;
+    }
+
+    const etag = response.headers.get('ETag');
+    if (etag) {
+        responseETags[url] = etag;
+    }
+    return response.json();
+}
+
 // ============================================================================
 // Now Playing Functions
 // ============================================================================
@@ -73,58 +112,139 @@ function getUserIdentifier() {
  */
 async function updateNowPlaying() {
     try {
-        const response = await fetch('http://localhost:5000/api/nowplaying');
-        if (response.ok) {
-            const data = await response.json();
+        const data = await fetchJSONIfChanged('http://localhost:5000/api/nowplaying');
+        if (data) {
+            renderNowPlaying(data);
+        }
+    } catch (error) {
+        console.error('Error fetching now playing data:', error);
+    }
+}
 
-            // Store song data globally
-            currentSongData = {
-                song_id: data.song_id,
-                thumbs_up: data.thumbs_up || 0,
-                thumbs_down: data.thumbs_down || 0
-            };
+/**
+ * Update the now playing section from a now playing payload
+ * @param {Object} data - Response body of /api/nowplaying or a stream event
+ * @returns {boolean} Whether the track changed
+ */
+function renderNowPlaying(data) {
+    const trackChanged = data.song_id !== currentSongData.song_id;
+
+    // Store song data globally
+    currentSongData = {
+        song_id: data.song_id,
+        thumbs_up: data.thumbs_up || 0,
+        thumbs_down: data.thumbs_down || 0
+    };
+
+    // Update track information
+    if (data.title) {
+        document.getElementById('trackTitle').textContent = data.title;
+    }
+    if (data.artist) {
+        document.getElementById('artistName').textContent = data.artist;
+    }
+    if (data.album) {
+        document.getElementById('albumName').textContent = data.album;
+    }
 
-            // Update track information
-            if (data.title) {
-                document.getElementById('trackTitle').textContent = data.title;
-            }
-            if (data.artist) {
-                document.getElementById('artistName').textContent = data.artist;
-            }
-            if (data.album) {
-                document.getElementById('albumName').textContent = data.album;
-            }
+    // A station that has not been polled yet shows a placeholder with no song to rate
+    document.getElementById('nowPlayingRating').style.display = data.song_id ? '' : 'none';
 
-            // Update rating counts
-            document.getElementById('nowPlayingUpCount').textContent = data.thumbs_up || 0;
-            document.getElementById('nowPlayingDownCount').textContent = data.thumbs_down || 0;
+    // Update rating counts
+    document.getElementById('nowPlayingUpCount').textContent = data.thumbs_up || 0;
+    document.getElementById('nowPlayingDownCount').textContent = data.thumbs_down || 0;
 
-            // Check if user has already rated this song
-            if (data.song_id) {
-                checkUserRating(data.song_id, 'now-playing');
-            }
+    // Check if user has already rated this song (only needed once per track)
+    if (data.song_id && trackChanged) {
+        checkUserRatings([{ songId: data.song_id, context: 'now-playing' }]);
+    }
 
-            // Update album art with smooth transition
-            if (data.albumArt) {
-                const albumArtImg = document.getElementById('albumArt');
-                const newSrc = data.albumArt.startsWith('http') ?
-                    data.albumArt :
-                    data.albumArt;
-
-                if (albumArtImg.src !== newSrc) {
-                    albumArtImg.style.opacity = '0.5';
-                    setTimeout(() => {
-                        albumArtImg.src = newSrc;
-                        albumArtImg.onload = () => {
-                            albumArtImg.style.opacity = '1';
-                        };
-                    }, 300);
-                }
-            }
+    // Update album art with smooth transition
+    if (data.albumArt) {
+        const albumArtImg = document.getElementById('albumArt');
+        const newSrc = artSrc(data.albumArt);
+
+        if (albumArtImg.src !== newSrc) {
+            albumArtImg.style.opacity = '0.5';
+            setTimeout(() => {
+                albumArtImg.src = newSrc;
+                albumArtImg.onload = () => {
+                    albumArtImg.style.opacity = '1';
+                };
+            }, 300);
         }
-    } catch (error) {
-        console.error('Error fetching now playing data:', error);
     }
+
+    return trackChanged;
+}
+
+/**
+ * Resolve an albumArt value from the API: cached covers are backend paths
+ * (/api/art/...), anything else is already a full URL or a frontend path
+ */
+function artSrc(albumArt) {
+    return albumArt.startsWith('/api/') ? `${API_ORIGIN}${albumArt}` : albumArt;
+}
+
+// ============================================================================
+// Live Updates
+// ============================================================================
+
+/**
+ * Subscribe to the now playing event stream.
+ * The server only sends an event when the track or its ratings change, so
+ * track history is refreshed on track changes instead of on a timer. If the
+ * stream is unavailable we fall back to polling until it reconnects.
+ */
+function subscribeToNowPlaying() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    nowPlayingStream = new EventSource('http://localhost:5000/api/nowplaying/stream');
+
+    nowPlayingStream.addEventListener('open', () => {
+        stopPolling();
+    });
+
+    nowPlayingStream.addEventListener('nowplaying', (event) => {
+        const data = JSON.parse(event.data);
+        if (renderNowPlaying(data)) {
+            updateTrackHistory();
+        }
+    });
+
+    nowPlayingStream.addEventListener('error', () => {
+        startPolling();
+        if (nowPlayingStream.readyState === EventSource.CLOSED) {
+            // The browser gave up reconnecting on its own; try again later
+            nowPlayingStream = null;
+            setTimeout(subscribeToNowPlaying, 30000);
+        }
+    });
+}
+
+/**
+ * Start interval polling (fallback when the event stream is down)
+ */
+function startPolling() {
+    if (nowPlayingPollTimer) {
+        return;
+    }
+    updateNowPlaying();
+    nowPlayingPollTimer = setInterval(updateNowPlaying, 10000);  // Every 10 seconds
+    trackHistoryPollTimer = setInterval(updateTrackHistory, 30000);  // Every 30 seconds
+}
+
+/**
+ * Stop interval polling once the event stream is connected
+ */
+function stopPolling() {
+    clearInterval(nowPlayingPollTimer);
+    clearInterval(trackHistoryPollTimer);
+    nowPlayingPollTimer = null;
+    trackHistoryPollTimer = null;
 }
 
 // ============================================================================
@@ -136,14 +256,13 @@ async function updateNowPlaying() {
  */
 async function updateTrackHistory() {
     try {
-        const response = await fetch('http://localhost:5000/api/trackhistory');
-        if (response.ok) {
-            const data = await response.json();
-
+        const data = await fetchJSONIfChanged('http://localhost:5000/api/trackhistory');
+        if (data) {
             const trackHistoryList = document.getElementById('trackHistory');
 
             if (data.tracks && data.tracks.length > 0) {
                 trackHistoryList.innerHTML = '';
+                const ratedEntries = [];
 
                 data.tracks.forEach((track, index) => {
                     const li = document.createElement('li');
@@ -166,7 +285,8 @@ async function updateTrackHistory() {
 
                     li.innerHTML = `
                         <div class="track-details-row">
-                            <div>
+                            ${track.albumArt ? `<img class="track-art" src="${artSrc(track.albumArt)}" alt="" loading="lazy">` : ''}
+                            <div class="track-info">
                                 <strong>${track.title || track.artist || 'Unknown Track'}</strong><br>
                                 <small>${track.artist || ''}</small>
                                 ${track.album ? `<br><em style="color: #666;">${track.album}</em>` : ''}
@@ -187,11 +307,13 @@ async function updateTrackHistory() {
 
                     trackHistoryList.appendChild(li);
 
-                    // Check if user has rated this song
                     if (track.song_id) {
-                        checkUserRating(track.song_id, `history-${index}`);
+                        ratedEntries.push({ songId: track.song_id, context: `history-${index}` });
                     }
                 });
+
+                // Look up the user's ratings for every listed song in one request
+                checkUserRatings(ratedEntries);
             } else {
                 trackHistoryList.innerHTML = '<li class="track-item">No track history available</li>';
             }
@@ -208,55 +330,94 @@ async function updateTrackHistory() {
 // ============================================================================
 
 /**
- * Check if user has already rated a song and highlight the button
- * @param {number} songId - The song ID
+ * Get the thumbs up/down buttons for a rating context
+ * @param {string} context - The context ('now-playing' or 'history-{index}')
+ * @returns {Array<HTMLElement>|null} [upButton, downButton]
+ */
+function ratingButtons(context) {
+    if (context === 'now-playing') {
+        return [
+            document.getElementById('nowPlayingThumbsUp'),
+            document.getElementById('nowPlayingThumbsDown')
+        ];
+    }
+    const index = context.split('-')[1];
+    const trackItem = document.querySelectorAll('.track-item')[index];
+    return trackItem ? Array.from(trackItem.querySelectorAll('.rating-btn')) : null;
+}
+
+/**
+ * Highlight the button the user chose (both buttons remain enabled for editing)
  * @param {string} context - The context ('now-playing' or 'history-{index}')
+ * @param {string} ratingType - The rating type ('up' or 'down')
+ */
+function highlightRating(context, ratingType) {
+    const buttons = ratingButtons(context);
+    if (!buttons) {
+        return;
+    }
+    buttons[0].classList.remove('rated');
+    buttons[1].classList.remove('rated');
+    buttons[ratingType === 'up' ? 0 : 1].classList.add('rated');
+}
+
+/**
+ * Show a song's rating counts in a rating context
+ * @param {string} context - The context ('now-playing' or 'history-{index}')
+ * @param {Object} song - Song with thumbs_up and thumbs_down
+ */
+function showRatingCounts(context, song) {
+    if (context === 'now-playing') {
+        document.getElementById('nowPlayingUpCount').textContent = song.thumbs_up;
+        document.getElementById('nowPlayingDownCount').textContent = song.thumbs_down;
+    } else {
+        const index = context.split('-')[1];
+        document.getElementById(`historyUpCount-${index}`).textContent = song.thumbs_up;
+        document.getElementById(`historyDownCount-${index}`).textContent = song.thumbs_down;
+    }
+}
+
+/**
+ * Check which of several songs the user has already rated and highlight the buttons
+ * @param {Array<Object>} entries - { songId, context } for each displayed song
  */
-async function checkUserRating(songId, context) {
+async function checkUserRatings(entries) {
+    if (entries.length === 0) {
+        return;
+    }
     const userId = getUserIdentifier();
     try {
-        const response = await fetch(`http://localhost:5000/api/songs/${songId}/user-rating/${userId}`);
+        const response = await fetch('http://localhost:5000/api/songs/user-ratings', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                user_identifier: userId,
+                song_ids: entries.map(entry => entry.songId)
+            })
+        });
         if (response.ok) {
             const data = await response.json();
-            if (data.has_rated) {
-                // Highlight the button they chose (both buttons remain enabled for editing)
-                if (context === 'now-playing') {
-                    const upBtn = document.getElementById('nowPlayingThumbsUp');
-                    const downBtn = document.getElementById('nowPlayingThumbsDown');
-                    upBtn.classList.remove('rated');
-                    downBtn.classList.remove('rated');
-                    if (data.rating_type === 'up') {
-                        upBtn.classList.add('rated');
-                    } else {
-                        downBtn.classList.add('rated');
-                    }
-                } else if (context.startsWith('history-')) {
-                    const index = context.split('-')[1];
-                    const trackItem = document.querySelector(`[data-song-id="${songId}"]`);
-                    if (trackItem) {
-                        const buttons = trackItem.querySelectorAll('.rating-btn');
-                        buttons[0].classList.remove('rated');
-                        buttons[1].classList.remove('rated');
-                        if (data.rating_type === 'up') {
-                            buttons[0].classList.add('rated');
-                        } else {
-                            buttons[1].classList.add('rated');
-                        }
-                    }
+            entries.forEach(entry => {
+                const ratingType = data.ratings[entry.songId];
+                if (ratingType) {
+                    highlightRating(entry.context, ratingType);
                 }
-            }
+            });
         }
     } catch (error) {
-        console.error('Error checking user rating:', error);
+        console.error('Error checking user ratings:', error);
     }
 }
 
 /**
  * Rate a song with thumbs up or down
+ * Clicks are collected for a short moment and sent as one batch request.
  * @param {string} context - The context ('now-playing' or 'history-{index}')
  * @param {string} ratingType - The rating type ('up' or 'down')
  */
-async function rateSong(context, ratingType) {
+function rateSong(context, ratingType) {
     let songId;
 
     // Get song ID based on context
@@ -265,7 +426,7 @@ async function rateSong(context, ratingType) {
     } else if (context.startsWith('history-')) {
         const index = context.split('-')[1];
         const trackItem = document.querySelectorAll('.track-item')[index];
-        songId = trackItem ? trackItem.dataset.songId : null;
+        songId = trackItem ? Number(trackItem.dataset.songId) : null;
     }
 
     if (!songId) {
@@ -273,69 +434,53 @@ async function rateSong(context, ratingType) {
         return;
     }
 
-    const userId = getUserIdentifier();
+    highlightRating(context, ratingType);
+    pendingRatings.set(songId, { rating_type: ratingType, context });
+
+    if (!ratingFlushTimer) {
+        ratingFlushTimer = setTimeout(submitPendingRatings, RATING_BATCH_DELAY);
+    }
+}
+
+/**
+ * Send all pending ratings in one request and show the new counts
+ */
+async function submitPendingRatings() {
+    ratingFlushTimer = null;
+    const batch = new Map(pendingRatings);
+    pendingRatings.clear();
 
     try {
-        const response = await fetch(`http://localhost:5000/api/songs/${songId}/rate`, {
+        const response = await fetch('http://localhost:5000/api/songs/rate', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                user_identifier: userId,
-                rating_type: ratingType
+                user_identifier: getUserIdentifier(),
+                ratings: Array.from(batch, ([songId, rating]) => ({
+                    song_id: songId,
+                    rating_type: rating.rating_type
+                }))
             })
         });
 
         const data = await response.json();
 
         if (response.ok) {
-            // Update the rating counts
-            if (context === 'now-playing') {
-                document.getElementById('nowPlayingUpCount').textContent = data.song.thumbs_up;
-                document.getElementById('nowPlayingDownCount').textContent = data.song.thumbs_down;
-
-                // Remove rated class from both buttons and add to selected one
-                const upBtn = document.getElementById('nowPlayingThumbsUp');
-                const downBtn = document.getElementById('nowPlayingThumbsDown');
-                upBtn.classList.remove('rated');
-                downBtn.classList.remove('rated');
-
-                if (ratingType === 'up') {
-                    upBtn.classList.add('rated');
-                } else {
-                    downBtn.classList.add('rated');
+            data.songs.forEach(song => {
+                const rating = batch.get(song.id);
+                if (rating) {
+                    showRatingCounts(rating.context, song);
                 }
-            } else if (context.startsWith('history-')) {
-                const index = context.split('-')[1];
-                document.getElementById(`historyUpCount-${index}`).textContent = data.song.thumbs_up;
-                document.getElementById(`historyDownCount-${index}`).textContent = data.song.thumbs_down;
-
-                // Remove rated class from both buttons and add to selected one
-                const trackItem = document.querySelectorAll('.track-item')[index];
-                const buttons = trackItem.querySelectorAll('.rating-btn');
-                buttons[0].classList.remove('rated');
-                buttons[1].classList.remove('rated');
-
-                if (ratingType === 'up') {
-                    buttons[0].classList.add('rated');
-                } else {
-                    buttons[1].classList.add('rated');
-                }
-            }
-
-            // Show success message
-            if (data.updated) {
-                console.log('Rating updated successfully!');
-            } else {
-                console.log('Rating submitted successfully!');
-            }
+            });
+            console.log(`Submitted ${batch.size} rating(s)`);
         } else {
             // Error occurred
             alert(data.error || 'Unable to submit rating');
         }
     } catch (error) {
-        console.error('Error submitting rating:', error);
+        console.error('Error submitting ratings:', error);
         alert('Unable to submit rating. Please try again.');
     }
 }
@@ -356,7 +501,7 @@ function initializeApp() {
             backBufferLength: 90
         });
 
-        hls.loadSource('https://d3d4yli4hf5bmh.cloudfront.net/hls/live.m3u8');
+        hls.loadSource(STREAM_URL);
         hls.attachMedia(audio);
 
         hls.on(Hls.Events.MANIFEST_PARSED, function() {
@@ -383,7 +528,7 @@ function initializeApp() {
         });
     } else if (audio.canPlayType('application/vnd.apple.mpegurl')) {
         // Native HLS support (Safari)
-        audio.src = 'https://d3d4yli4hf5bmh.cloudfront.net/hls/live.m3u8';
+        audio.src = STREAM_URL;
     }
 
     // Set initial volume
@@ -401,12 +546,10 @@ function initializeApp() {
         isPlaying = false;
     });
 
-    // Start fetching metadata
-    updateNowPlaying();
-    setInterval(updateNowPlaying, 10000);  // Every 10 seconds
-
+    // Start fetching metadata; the event stream delivers the current track
+    // as its first event and pushes changes after that
     updateTrackHistory();
-    setInterval(updateTrackHistory, 30000);  // Every 30 seconds
+    subscribeToNowPlaying();
 }
 
 // Initialize when DOM is ready
@@ -6,6 +6,9 @@ require('dotenv').config();
 const app = express();
 const PORT = process.env.PORT || 3000;
 const API_URL = process.env.API_URL || 'http://localhost:5000/api';
+const PAGE_SIZE = parseInt(process.env.PAGE_SIZE || '50');
+// Live stream playlist; point at the backend's /api/hls/live.m3u8 to play through its relay
+const STREAM_URL = process.env.STREAM_URL || 'https://d3d4yli4hf5bmh.cloudfront.net/hls/live.m3u8';
 
 // Middleware
 app.use(express.json());
@@ -15,6 +18,7 @@ app.use(express.static(path.join(__dirname, 'public')));
 // Set EJS as templating engine
 app.set('view engine', 'ejs');
 app.set('views', path.join(__dirname, 'views'));
+app.locals.streamUrl = STREAM_URL;
 
 // Helper function to make API calls
 async function apiCall(endpoint, method = 'GET', data = null) {
@@ -37,12 +41,34 @@ async function apiCall(endpoint, method = 'GET', data = null) {
     }
 }
 
+// Fetch one page of a paginated list endpoint (/users, /posts).
+// Resolves to the API response, which includes next_cursor.
+function apiPage(endpoint, cursor = null, limit = PAGE_SIZE) {
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    return apiCall(`${endpoint}?${params}`);
+}
+
+// Follow next_cursor through every page and collect the items under key
+async function apiAllPages(endpoint, key) {
+    const items = [];
+    let cursor = null;
+    do {
+        const data = await apiPage(endpoint, cursor);
+        items.push(...(data[key] || []));
+        cursor = data.next_cursor;
+    } while (cursor);
+    return items;
+}
+
 // Routes
 
-// Home page - display all posts
+// Home page - display the latest posts
 app.get('/', async (req, res) => {
     try {
-        const data = await apiCall('/posts');
+        const data = await apiPage('/posts');
         res.render('index', {
             posts: data.posts || [],
             error: null
@@ -60,17 +86,21 @@ app.get('/about', (req, res) => {
     res.render('about');
 });
 
-// Users page - display all users
+// Users page - display one page of users (?cursor= for the next ones)
 app.get('/users', async (req, res) => {
     try {
-        const data = await apiCall('/users');
+        const data = await apiPage('/users', req.query.cursor);
         res.render('users', {
             users: data.users || [],
+            nextCursor: data.next_cursor || null,
+            paged: Boolean(req.query.cursor),
             error: null
         });
     } catch (error) {
         res.render('users', {
             users: [],
+            nextCursor: null,
+            paged: Boolean(req.query.cursor),
             error: 'Failed to load users'
         });
     }
@@ -98,9 +128,9 @@ app.post('/user/add', async (req, res) => {
 // Add post page
 app.get('/post/add', async (req, res) => {
     try {
-        const data = await apiCall('/users');
+        const users = await apiAllPages('/users', 'users');
         res.render('add_post', {
-            users: data.users || [],
+            users,
             error: null,
             success: null
         });
@@ -124,9 +154,9 @@ app.post('/post/add', async (req, res) => {
         });
         res.redirect('/');
     } catch (error) {
-        const usersData = await apiCall('/users');
+        const users = await apiAllPages('/users', 'users');
         res.render('add_post', {
-            users: usersData.users || [],
+            users,
             error: error.response?.data?.error || 'Failed to create post',
             success: null
         });
@@ -136,7 +166,7 @@ app.post('/post/add', async (req, res) => {
 // API proxy endpoints (optional - for frontend JavaScript to use)
 app.get('/api/posts', async (req, res) => {
     try {
-        const data = await apiCall('/posts');
+        const data = await apiPage('/posts', req.query.cursor, req.query.limit || PAGE_SIZE);
         res.json(data);
     } catch (error) {
         res.status(500).json({ error: 'Failed to fetch posts' });
@@ -145,7 +175,7 @@ app.get('/api/posts', async (req, res) => {
 
 app.get('/api/users', async (req, res) => {
     try {
-        const data = await apiCall('/users');
+        const data = await apiPage('/users', req.query.cursor, req.query.limit || PAGE_SIZE);
         res.json(data);
     } catch (error) {
         res.status(500).json({ error: 'Failed to fetch users' });